@@ -0,0 +1,232 @@
+#   -*- mode: python; coding: utf-8; -*-
+#
+#   Copyright 2018 Asier Aguirre <asier.aguirre@gmail.com>
+#   This file is part of memory-tools.
+#
+#   memory-tools is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   memory-tools is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with memory-tools. If not, see <http://www.gnu.org/licenses/>.
+
+
+import gdb, os, time, struct, mt_util
+from xml.etree import ElementTree
+from mt_colors import mt_colors as c
+
+mt_scratch_size = 256 # inferior buffer for out arguments and mallctl names
+# jemalloc statistics: (mallctl name, bytes or 0 for size_t); stats.retained is
+# not mapped, so jemalloc has no mmap field (stats.mapped is the footprint)
+mt_jemalloc_stats = ( ('stats.mapped', 0), ('stats.allocated', 0), ('stats.resident', 0),
+                      ('arenas.narenas', 4) )
+
+def parse_malloc_info(xml):
+    """ (arena, mmap, in use, free, arenas) bytes from glibc malloc_info XML """
+    root = ElementTree.fromstring(xml)
+    totals = dict((e.get('type'), int(e.get('size'))) for e in root.findall('total'))
+    system = dict((e.get('type'), int(e.get('size'))) for e in root.findall('system'))
+    arena = system.get('current', 0)
+    free = totals.get('fast', 0) + totals.get('rest', 0) # rest includes top chunks
+    return (arena, totals.get('mmap', 0), arena - free, free, len(root.findall('heap')))
+
+
+class MTalloc_sampler:
+    """ allocator statistics read by calling allocator functions in the inferior:
+        mallctl for jemalloc, otherwise glibc mallinfo2 (when gdb knows its
+        return type) or malloc_info written to an open_memstream buffer. Out
+        arguments go to a small buffer allocated once in the inferior, so
+        samples do not leak; its bytes are counted as in use """
+    def __init__(self):
+        self.pid = 0
+        self.scratch = 0        # inferior buffer address
+        self.allocator = None   # 'jemalloc', 'mallinfo2' or 'malloc_info'
+        self.prefix = ''        # of jemalloc symbols (je_)
+        self.mallinfo2 = ''     # expression calling mallinfo2
+
+    def _call(self, expression):
+        return gdb.parse_and_eval(expression)
+
+    def _has(self, symbol):
+        try:
+            self._call('(long)&' + symbol)
+            return True
+        except gdb.error:
+            return False
+
+    def _read(self, addr, size):
+        # not through the page cache: memory is written by inferior calls
+        return bytes(gdb.selected_inferior().read_memory(addr, size))
+
+    def _setup(self):
+        pid = gdb.selected_inferior().pid
+        if not pid: raise RuntimeError('inferior not running')
+        if self.pid == pid: return
+        self.pid = pid
+        self.scratch = int(self._call('(void*)malloc(%d)' % mt_scratch_size))
+        if not self.scratch: raise RuntimeError('cannot allocate inferior buffer')
+        self.allocator = None
+        for prefix in ('', 'je_'):
+            if self._has(prefix + 'mallctl'):
+                self.allocator, self.prefix = 'jemalloc', prefix
+                names = b''.join(name.encode() + b'\0' for name, size in mt_jemalloc_stats + (('epoch', 8),))
+                gdb.selected_inferior().write_memory(self.scratch + 32, names)
+                return
+        for expression in ('mallinfo2()', '(struct mallinfo2)mallinfo2()'):
+            try:
+                self._call(expression)
+                self.allocator = 'mallinfo2'
+                self.mallinfo2 = expression
+                return
+            except gdb.error:
+                pass
+        self.allocator = 'malloc_info'
+
+    def sample(self):
+        """ (time, arena, mmap, in use, free, arenas, seconds stopped) """
+        self._setup()
+        start = time.time()
+        stats = getattr(self, '_' + self.allocator)()
+        return (start,) + stats + (time.time() - start,)
+
+    def _mallinfo2(self):
+        info = self._call(self.mallinfo2)
+        return (int(info['arena']), int(info['hblkhd']), int(info['uordblks']), int(info['fordblks']), 0)
+
+    def _malloc_info(self):
+        buf, size = self.scratch, self.scratch + mt_util.pointer_size()
+        stream = int(self._call('(void*)open_memstream((char**)%d, (unsigned long*)%d)' % (buf, size)))
+        if not stream: raise RuntimeError('open_memstream failed in inferior')
+        self._call('(int)malloc_info(0, (void*)%d)' % stream)
+        self._call('(int)fclose((void*)%d)' % stream)
+        size = mt_util.pointer_size()
+        fmt = mt_util.endian_prefix() + '2' + (size == 8 and 'Q' or 'I')
+        addr, length = struct.unpack(fmt, self._read(self.scratch, 2 * size))
+        xml = self._read(addr, length)
+        self._call('(void)free((void*)%d)' % addr)
+        return parse_malloc_info(xml)
+
+    def _jemalloc(self):
+        inferior = gdb.selected_inferior()
+        mallctl = '(int)%smallctl((char*)%%d, (void*)%%d, (unsigned long*)%%d, (void*)%%d, %%d)' % self.prefix
+        value, length, epoch, name = self.scratch, self.scratch + 8, self.scratch + 16, self.scratch + 32
+        names = { }
+        for stat, size in mt_jemalloc_stats + (('epoch', 8),):
+            names[stat] = name
+            name += len(stat) + 1
+        endian = mt_util.endian_prefix()
+        size_t = mt_util.pointer_size()
+        size_fmt = endian + (size_t == 8 and 'Q' or 'I')
+        # refresh cached statistics (epoch is uint64_t)
+        inferior.write_memory(epoch, struct.pack(endian + 'Q', 1))
+        self._call(mallctl % (names['epoch'], 0, 0, epoch, 8))
+        values = { }
+        for stat, size in mt_jemalloc_stats:
+            size = size or size_t
+            inferior.write_memory(length, struct.pack(size_fmt, size))
+            if int(self._call(mallctl % (names[stat], value, length, 0, 0))): continue
+            values[stat] = int.from_bytes(self._read(value, size), 'little' if endian == '<' else 'big')
+        allocated = values.get('stats.allocated', 0)
+        return (values.get('stats.mapped', 0), 0, allocated,
+                max(0, values.get('stats.resident', 0) - allocated), values.get('arenas.narenas', 0))
+
+mt_alloc_sampler = MTalloc_sampler()
+
+
+class MTring:
+    """ file with the last capacity records of a struct format: a header
+        (magic, record size, capacity, records written) and records in a
+        circular buffer, so it has a fixed size and survives sessions """
+    magic = b'MTring1\0'
+    header = struct.Struct('=8sQQQ')
+
+    def __init__(self, path, fmt, capacity = 4096):
+        self.record = struct.Struct(fmt)
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        data = os.pread(self.fd, self.header.size, 0)
+        if len(data) == self.header.size:
+            magic, size, file_capacity, count = self.header.unpack(data)
+            if magic == self.magic and size == self.record.size:
+                self.capacity, self.count = file_capacity, count
+                return
+        self.capacity, self.count = capacity, 0
+        os.ftruncate(self.fd, 0)
+        self._write_header()
+
+    def _write_header(self):
+        os.pwrite(self.fd, self.header.pack(self.magic, self.record.size, self.capacity, self.count), 0)
+
+    def close(self):
+        os.close(self.fd)
+
+    def append(self, values):
+        offset = self.header.size + (self.count % self.capacity) * self.record.size
+        os.pwrite(self.fd, self.record.pack(*values), offset)
+        self.count += 1
+        self._write_header()
+
+    def records(self):
+        """ stored records, oldest first (read at once) """
+        n = min(self.count, self.capacity)
+        data = os.pread(self.fd, n * self.record.size, self.header.size)
+        records = [ self.record.unpack_from(data, i * self.record.size) for i in range(len(data) // self.record.size) ]
+        first = self.count > self.capacity and self.count % self.capacity or 0
+        return records[first:] + records[:first]
+
+
+mt_alloc_format = '=dQQQQQd' # time, arena, mmap, in use, free, arenas, seconds stopped
+
+def get_trends(records):
+    """ { field: (rate in bytes per second from first to last record, least
+        squares slope in bytes per second) } of 'in use', 'footprint' (arena +
+        mmap) and 'free' """
+    trends = { }
+    if len(records) < 2: return trends
+    times = [ r[0] for r in records ]
+    series = { 'in use': [ r[3] for r in records ], 'footprint': [ r[1] + r[2] for r in records ],
+               'free': [ r[4] for r in records ] }
+    mean_t = sum(times) / len(times)
+    var_t = sum((t - mean_t) ** 2 for t in times)
+    elapsed = times[-1] - times[0]
+    for name, values in series.items():
+        mean_v = sum(values) / len(values)
+        slope = var_t and sum((t - mean_t) * (v - mean_v) for t, v in zip(times, values)) / var_t or 0.0
+        trends[name] = (elapsed and (values[-1] - values[0]) / elapsed or 0.0, slope)
+    return trends
+
+def fragmentation(record):
+    """ free bytes held by the allocator over in use + free """
+    in_use, free = record[3], record[4]
+    return in_use + free and 100.0 * free / (in_use + free) or 0.0
+
+def dump(records, allocator, max_records = 20):
+    print(c.white + 'allocator statistics' + (allocator and ' (' + allocator + ')' or '') + c.reset)
+    if not records:
+        print(c.red + '<empty>' + c.reset)
+        return
+    print((c.cyan + '%8s %14s %14s %14s %14s %6s %6s %12s %8s' + c.reset) %
+          ('Time', 'Arena', 'Mmap', 'In use', 'Free', 'Frag', 'Arenas', 'In use/s', 'Stop ms'))
+    first = max(0, len(records) - max_records)
+    for i in range(first, len(records)):
+        r = records[i]
+        rate = i and r[0] > records[i - 1][0] and (r[3] - records[i - 1][3]) / (r[0] - records[i - 1][0]) or 0
+        print((c.green + '%8s ' + c.yellow + '%14d %14d %14d %14d ' + c.magenta + '%5.1f%% ' + c.reset +
+               '%6d ' + (rate > 0 and c.red or c.yellow) + '%+12d ' + c.reset + '%8.1f') %
+              (time.strftime('%H:%M:%S', time.localtime(r[0])), r[1], r[2], r[3], r[4], fragmentation(r),
+               r[5], rate, r[6] * 1000))
+    trends = get_trends(records)
+    if trends:
+        elapsed = records[-1][0] - records[0][0]
+        print(c.white + 'trends over %d samples (%.1f s)' % (len(records), elapsed) + c.reset)
+        print((c.cyan + '%10s %16s %16s' + c.reset) % ('Field', 'Rate bytes/s', 'Slope bytes/min'))
+        for name in ('in use', 'footprint', 'free'):
+            rate, slope = trends[name]
+            print((c.green + '%10s ' + c.yellow + '%+16.1f %+16.1f' + c.reset) % (name, rate, slope * 60))
+        print(c.white + 'fragmentation: ' + c.reset + '%.1f%% -> %.1f%%' %
+              (fragmentation(records[0]), fragmentation(records[-1])))
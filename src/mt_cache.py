@@ -0,0 +1,153 @@
+#   -*- mode: python; coding: utf-8; -*-
+#
+#   Copyright 2018 Asier Aguirre <asier.aguirre@gmail.com>
+#   This file is part of memory-tools.
+#
+#   memory-tools is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   memory-tools is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with memory-tools. If not, see <http://www.gnu.org/licenses/>.
+
+import gdb, collections
+
+class MTpage_cache:
+    """ line (page) granular LRU cache of inferior memory shared by raw readers;
+        misses on consecutive lines grow a read ahead window, so chains of nodes
+        allocated in order are fetched with few reads. Bulk reads larger than
+        max_cached lines bypass the cache, and unreadable lines and pages are
+        remembered until clear() so bad pointers fail without reading again """
+    def __init__(self, line_size = 1 << 14, max_lines = 1 << 12, max_window = 16, max_cached = 4):
+        self.max_window = max_window
+        self.max_cached = max_cached
+        self.configure(line_size, max_lines)
+
+    def configure(self, line_size, max_lines):
+        assert line_size >= 4096 and line_size <= 1 << 16 and not (line_size & (line_size - 1)), 'line size'
+        self.line_size = line_size
+        self.max_lines = max(1, max_lines)
+        self.clear()
+
+    def clear(self):
+        self.lines = collections.OrderedDict() # { line address: bytes }
+        self.unreadable = set()                # { line address } not readable as a whole
+        self.bad_pages = set()                 # { page address } not readable
+        self.next_fetch = None
+        self.window = 1
+        self.hits = self.misses = self.evictions = self.uncached = self.bytes_fetched = 0
+
+    def stats(self):
+        accesses = self.hits + self.misses
+        return [ ('line size',     self.line_size),
+                 ('lines',         '%d / %d' % (len(self.lines), self.max_lines)),
+                 ('hits',          self.hits),
+                 ('misses',        self.misses),
+                 ('hit rate',      accesses and '%.2f%%' % (100 * self.hits / accesses) or '-'),
+                 ('evictions',     self.evictions),
+                 ('uncached',      self.uncached),
+                 ('unreadable',    '%d lines, %d pages' % (len(self.unreadable), len(self.bad_pages))),
+                 ('bytes fetched', self.bytes_fetched) ]
+
+    def read(self, addr, size):
+        """ size bytes at addr; raises gdb.MemoryError if not accessible """
+        line_size = self.line_size
+        if size > self.max_cached * line_size: return self._direct(addr, size) # bulk read
+        base = addr & ~(line_size - 1)
+        offset = addr - base
+        if offset + size <= line_size: # fast path: one line
+            data = self._line(base)
+            if data is None: return self._direct(addr, size)
+            return data[offset : offset + size]
+        parts = []
+        end = addr + size
+        while base < end:
+            data = self._line(base)
+            if data is None: return self._direct(addr, size)
+            parts.append(data)
+            base += line_size
+        return b''.join(parts)[offset : offset + size]
+
+    def read_string(self, addr, limit = 1 << 20):
+        """ bytes of the null terminated string at addr """
+        parts = []
+        length = 0
+        while length < limit:
+            at = addr + length
+            base = at & ~(self.line_size - 1)
+            data = self._line(base)
+            if data is None: # mapping ends within the line: page by page
+                data = self._direct(at, 4096 - (at & 4095))
+            else:
+                data = data[at - base:]
+            end = data.find(b'\0')
+            if end >= 0:
+                parts.append(data[:end])
+                break
+            parts.append(data)
+            length += len(data)
+        return b''.join(parts)[:limit]
+
+    def is_readable(self, addr):
+        try:
+            self.read(addr, 1)
+            return True
+        except gdb.MemoryError:
+            return False
+
+    def _line(self, base):
+        data = self.lines.get(base)
+        if data is not None:
+            self.hits += 1
+            self.lines.move_to_end(base)
+            return data
+        if base in self.unreadable: return None
+        self.misses += 1
+        return self._fetch(base)
+
+    def _fetch(self, base):
+        # read ahead grows while misses follow the previous fetch
+        if self.next_fetch is not None and base >= self.next_fetch - self.line_size and \
+           base <= self.next_fetch + self.window * self.line_size:
+            self.window = min(2 * self.window, self.max_window)
+        else:
+            self.window = 1
+        inferior = gdb.selected_inferior()
+        for window in (self.window > 1 and (self.window, 1) or (1,)):
+            try:
+                data = bytes(inferior.read_memory(base, window * self.line_size))
+                break
+            except gdb.MemoryError:
+                data = None
+        if data is None:
+            self.unreadable.add(base)
+            return None
+        self.window = window
+        self.next_fetch = base + len(data)
+        self.bytes_fetched += len(data)
+        for i in range(0, len(data), self.line_size):
+            self.lines[base + i] = data[i : i + self.line_size]
+        while len(self.lines) > self.max_lines:
+            self.lines.popitem(last = False)
+            self.evictions += 1
+        return self.lines.get(base)
+
+    def _direct(self, addr, size):
+        # bulk reads and lines not accessible as a whole (mapping ends within it)
+        first, last = addr >> 12, (addr + max(size, 1) - 1) >> 12
+        if self.bad_pages and any(page in self.bad_pages for page in range(first, min(last, first + 16) + 1)):
+            raise gdb.MemoryError('Cannot access memory at address 0x%x' % addr)
+        self.uncached += 1
+        try:
+            return bytes(gdb.selected_inferior().read_memory(addr, size))
+        except gdb.MemoryError:
+            if first == last: self.bad_pages.add(first)
+            raise
+
+mt_page_cache = MTpage_cache()
@@ -0,0 +1,134 @@
+#   -*- mode: python; coding: utf-8; -*-
+#
+#   Copyright 2018 Asier Aguirre <asier.aguirre@gmail.com>
+#   This file is part of memory-tools.
+#
+#   memory-tools is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   memory-tools is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with memory-tools. If not, see <http://www.gnu.org/licenses/>.
+
+import os, struct, array
+from mt_numpy import np
+from mt_colors import mt_colors as c
+
+mt_page = 4096
+mt_page_idle = '/sys/kernel/mm/page_idle/bitmap'
+mt_pfn_mask = (1 << 55) - 1
+
+class MTcold:
+    """ pages not accessed since start(): idle flags of the page frames of
+        tracked regions are set in /sys/kernel/mm/page_idle/bitmap and read back
+        by get_cold_pages(); page frame numbers are read from /proc/$pid/pagemap
+        (needs CAP_SYS_ADMIN and CONFIG_IDLE_PAGE_TRACKING). Bitmap words are
+        read and written in runs, one system call per run """
+    def __init__(self, page = mt_page, block = 1 << 16, gap = 64):
+        self.page = page
+        self.block = block  # pagemap entries read at once
+        self.gap = gap      # bitmap words read in the same run when closer than gap
+        self.pid = 0
+        self.regions = [ ]  # [ region ] tracked
+        self.tracked = 0    # pages marked idle
+
+    def is_tracking(self, pid):
+        return self.pid and self.pid == pid
+
+    def _frames(self, pagemap, region):
+        """ generate (addr, pfn) of resident pages of region """
+        first, last = region.low // self.page, (region.high + self.page - 1) // self.page
+        while first < last:
+            count = min(self.block, last - first)
+            try:
+                data = os.pread(pagemap, 8 * count, 8 * first)
+            except OSError:
+                data = b''
+            if np is not None:
+                entries = np.frombuffer(data, dtype = np.uint64)
+                pfns = entries & np.uint64(mt_pfn_mask)
+                pages = np.nonzero((entries >> np.uint64(63)) & (pfns != 0))[0]
+                for i, pfn in zip(pages.tolist(), pfns[pages].tolist()):
+                    yield ((first + i) * self.page, pfn)
+            else:
+                for i, e in enumerate(array.array('Q', data)):
+                    if e >> 63 and e & mt_pfn_mask: yield ((first + i) * self.page, e & mt_pfn_mask)
+            first += count
+
+    def _runs(self, words):
+        """ group sorted bitmap word indexes in runs [ (first word, last word) ] """
+        runs = [ ]
+        for word in words:
+            if runs and word - runs[-1][1] <= self.gap: runs[-1][1] = word
+            else: runs.append([word, word])
+        return runs
+
+    def start(self, pid, regions):
+        masks = { } # { bitmap word: bits }
+        tracked = 0
+        pagemap = os.open('/proc/%d/pagemap' % pid, os.O_RDONLY)
+        try:
+            for region in regions:
+                for addr, pfn in self._frames(pagemap, region):
+                    masks[pfn >> 6] = masks.get(pfn >> 6, 0) | (1 << (pfn & 63))
+                    tracked += 1
+        finally:
+            os.close(pagemap)
+        bitmap = os.open(mt_page_idle, os.O_WRONLY)
+        try:
+            for first, last in self._runs(sorted(masks)):
+                # zero bits are ignored by the kernel: words between masks are harmless
+                words = [ masks.get(w, 0) for w in range(first, last + 1) ]
+                os.pwrite(bitmap, struct.pack('=%dQ' % len(words), *words), first * 8)
+        finally:
+            os.close(bitmap)
+        self.pid = pid
+        self.regions = list(regions)
+        self.tracked = tracked
+
+    def get_cold_pages(self):
+        """ [ (region, resident pages, cold page addresses array) ] of tracked regions """
+        frames = [ ]
+        pagemap = os.open('/proc/%d/pagemap' % self.pid, os.O_RDONLY)
+        try:
+            for region in self.regions:
+                frames.append((region, list(self._frames(pagemap, region))))
+        finally:
+            os.close(pagemap)
+        words = { } # { bitmap word: bits }
+        bitmap = os.open(mt_page_idle, os.O_RDONLY)
+        try:
+            needed = sorted(set(pfn >> 6 for region, region_frames in frames for addr, pfn in region_frames))
+            for first, last in self._runs(needed):
+                data = os.pread(bitmap, (last - first + 1) * 8, first * 8)
+                for i, bits in enumerate(struct.unpack('=%dQ' % (len(data) // 8), data)):
+                    words[first + i] = bits
+        finally:
+            os.close(bitmap)
+        report = [ ]
+        for region, region_frames in frames:
+            cold = array.array('Q', (addr for addr, pfn in region_frames if (words.get(pfn >> 6, 0) >> (pfn & 63)) & 1))
+            report.append((region, len(region_frames), cold))
+        return report
+
+    def dump(self, cold_pages):
+        print(c.white + 'pages not accessed since cold tracking start' + c.reset)
+        if not cold_pages:
+            print(c.red + '<empty>' + c.reset)
+            return
+        print((c.cyan + '%16s %16s %10s %10s %s' + c.reset) % ('Start', 'End', 'Resident', 'Cold', 'Description'))
+        for region, resident, cold in cold_pages:
+            if not resident: continue
+            print((c.green + '%16x %16x ' + c.yellow + '%10d %10d ' + c.reset + '%s') %
+                  (region.low, region.high, resident, len(cold), region.build_description()))
+        resident = sum(r[1] for r in cold_pages)
+        cold = sum(len(r[2]) for r in cold_pages)
+        print(c.white + 'total: ' + c.reset + '%d cold pages of %d resident (%d bytes)' % (cold, resident, cold * self.page))
+
+mt_cold_tracker = MTcold()
@@ -19,16 +19,107 @@
 # Some of these class inspectors are based on libstdc++6 pretty printers:
 #   /usr/share/gcc-8/python/libstdcxx/v6/printers.py
 
-import gdb
+import gdb, struct, mt_cache, mt_heap, mt_types, mt_util
 
 def find_type(orig, name):
-    type = orig.strip_typedefs()
-    search = '%s::%s' % (type.unqualified(), name)
-    return gdb.lookup_type(search)
-
-def get_value_from_aligned_membuf(buf, valtype):
-    """ Returns the value held in a __gnu_cxx::__aligned_membuf. """
-    return buf['_M_storage'].address.cast(valtype.pointer()).dereference()
+    return mt_types.mt_type_registry.member(orig, name)
+
+def lookup_type(name):
+    return mt_types.mt_type_registry.lookup(name)
+
+mt_block_bytes = 1 << 16 # gdb default max-value-size
+
+def read_buffers(buffers, type_elem):
+    """ generate the values of contiguous buffers [ (address, count) ] of type_elem;
+        each block is fetched with one memory read and its elements are views of
+        the block (no more reads) that keep their addresses """
+    pointer = type_elem.pointer()
+    per_block = max(1, mt_block_bytes // max(1, type_elem.sizeof))
+    for address, count in buffers:
+        first = gdb.Value(address).cast(pointer)
+        done = 0
+        while done < count:
+            n = min(per_block, count - done)
+            block = (first + done).dereference().cast(type_elem.array(n - 1))
+            block.fetch_lazy()
+            for i in range(n):
+                yield block[i]
+            done += n
+
+def offset_of(type, field):
+    """ offset of field (searched also in base classes) in struct type """
+    return int(gdb.Value(0).cast(type.pointer()).dereference()[field].address)
+
+def payload_offset(node_type):
+    """ offset of the value stored in a list, hash or tree node """
+    for field in ('_M_storage', '_M_value_field', '_M_data'):
+        try:
+            return offset_of(node_type, field)
+        except gdb.error:
+            pass
+    raise ValueError("Unsupported implementation for %s" % str(node_type))
+
+
+class MTnodes:
+    """ raw memory walker of linked nodes: link words are read as raw bytes at
+        offsets computed once from the node type, without gdb.Value """
+    def __init__(self):
+        self.word = mt_util.pointer_size()
+        self.read = mt_cache.mt_page_cache.read
+        prefix = mt_util.endian_prefix()
+        self.unpack = struct.Struct(prefix + (self.word == 8 and 'Q' or 'I')).unpack_from
+        self.unpack2 = struct.Struct(prefix + (self.word == 8 and '2Q' or '2I')).unpack_from
+
+    def chain(self, first, next_offset, end = 0):
+        """ generate node addresses following the link at next_offset until end
+            (or null); cycles not going through end are cut """
+        seen = set()
+        node = first
+        while node and node != end and node not in seen:
+            seen.add(node)
+            yield node
+            node = self.unpack(self.read(node + next_offset, self.word))[0]
+
+    def inorder(self, root, left_offset, count):
+        """ generate binary tree node addresses in order; right link follows left
+            one; at most count nodes are generated (cycles are cut) """
+        stack = []
+        node = root
+        while (stack or node) and count > 0:
+            while node and len(stack) < count:
+                left, right = self.unpack2(self.read(node + left_offset, 2 * self.word))
+                stack.append((node, right))
+                node = left
+            node, right = stack.pop()
+            count -= 1
+            yield node
+            node = right
+
+    def depths(self, root, left_offset, count):
+        """ generate depths of binary tree nodes (root is 1), at most count """
+        stack = root and [(root, 1)] or []
+        while stack and count > 0:
+            count -= 1
+            node, depth = stack.pop()
+            yield depth
+            for child in self.unpack2(self.read(node + left_offset, 2 * self.word)):
+                if child: stack.append((child, depth + 1))
+
+    def link_offset(self, node_type, field):
+        """ offset of the raw pointer held by member field of node_type, being
+            a pointer, std::unique_ptr or std::shared_ptr """
+        member = gdb.Value(0).cast(node_type.pointer()).dereference()[field]
+        name = member.type.strip_typedefs().name or ''
+        if name.startswith('std::shared_ptr<'): member = member['_M_ptr']
+        elif name.startswith('std::unique_ptr<'): member = MTstd_unique_ptr(member)._get()
+        return int(member.address)
+
+    def pointer_chain(self, value, field):
+        """ generate addresses of user nodes linked through member field (pointer,
+            unique_ptr or shared_ptr) starting from node value """
+        address = value.address
+        if address is None: return iter(())
+        return self.chain(int(address), self.link_offset(value.type.strip_typedefs(), field))
 
 
 class MTarray:
@@ -47,23 +138,29 @@ class MTarray:
     def get_item(self, i):
         return self.value[i]
 
+    def get_buffers(self):
+        """ contiguous element buffers [ (address, count) ] """
+        if self.value.address is None: return None
+        return [(int(self.value.address), self.prop_size)]
+
     def __iter__(self):
-        self.iElem = 0
+        buffers = self.get_buffers()
+        if buffers is None or not self.value.is_lazy:
+            self.items = (self.value[i] for i in range(self.prop_size))
+        else:
+            self.items = read_buffers(buffers, self.type_elem)
         return self
 
     def __next__(self):
-        if self.iElem >= self.prop_size:
-            raise StopIteration
-        elem = self.get_item(self.iElem)
-        self.iElem += 1
-        return elem
+        return next(self.items)
 
 
 class MTstd_vector:
     def __init__(self, value):
         self.value = value
-        self.is_bool = value.type.template_argument(0).code  == gdb.TYPE_CODE_BOOL
-        if not value.type.template_argument(0).sizeof:
+        self.type_elem = value.type.template_argument(0)
+        self.is_bool = self.type_elem.code  == gdb.TYPE_CODE_BOOL
+        if not self.type_elem.sizeof:
             self.error = True
 
     @property
@@ -72,27 +169,67 @@ class MTstd_vector:
 
     @property
     def prop_size(self):
-        return self.value['_M_impl']['_M_finish'] - self.value['_M_impl']['_M_start']
+        impl = self.value['_M_impl']
+        if self.is_bool:
+            start, finish = impl['_M_start'], impl['_M_finish']
+            return ((int(finish['_M_p']) - int(start['_M_p'])) * 8 +
+                    int(finish['_M_offset']) - int(start['_M_offset']))
+        return impl['_M_finish'] - impl['_M_start']
 
     @property
     def prop_capacity(self):
-        return self.value['_M_impl']['_M_end_of_storage'] - self.value['_M_impl']['_M_start']
+        impl = self.value['_M_impl']
+        if self.is_bool:
+            return (int(impl['_M_end_of_storage']) - int(impl['_M_start']['_M_p'])) * 8
+        return impl['_M_end_of_storage'] - impl['_M_start']
+
+    @property
+    def prop_heap_bytes(self):
+        impl = self.value['_M_impl']
+        start = impl['_M_start']
+        if self.is_bool: start = start['_M_p']
+        start = int(start)
+        return mt_heap.MTmalloc().chunk_size(start, int(impl['_M_end_of_storage']) - start)
+
+    @property
+    def prop_slack_bytes(self):
+        if self.is_bool: return 0
+        return int(self.prop_capacity - self.prop_size) * self.type_elem.sizeof
 
     def get_item(self, i):
+        if self.is_bool: return gdb.Value(self._get_bools(i, 1)[0])
         start = self.value['_M_impl']['_M_start']
         start += i
         return start.dereference()
 
+    def get_buffers(self):
+        """ contiguous element buffers [ (address, count) ] """
+        if self.is_bool: return None
+        return [(int(self.value['_M_impl']['_M_start']), int(self.prop_size))]
+
+    def _get_bools(self, first, count):
+        """ decode count bits from bit first of the _Bit_type words """
+        start = self.value['_M_impl']['_M_start']
+        word_type = start['_M_p'].type.target().strip_typedefs()
+        bits = word_type.sizeof * 8
+        first += int(start['_M_offset'])
+        words_first = first // bits
+        words_last = (first + count + bits - 1) // bits
+        addr = int(start['_M_p']) + words_first * word_type.sizeof
+        storage = int.from_bytes(mt_util.read_memory(addr, (words_last - words_first) * word_type.sizeof),
+                                 mt_util.endian_prefix() == '<' and 'little' or 'big')
+        first -= words_first * bits
+        return [bool((storage >> bit) & 1) for bit in range(first, first + count)]
+
     def __iter__(self):
-        self.iElem = 0
+        if self.is_bool:
+            self.items = (gdb.Value(bit) for bit in self._get_bools(0, self.prop_size))
+        else:
+            self.items = read_buffers(self.get_buffers(), self.type_elem)
         return self
 
     def __next__(self):
-        if self.iElem >= self.prop_size:
-            raise StopIteration
-        elem = self.get_item(self.iElem)
-        self.iElem += 1
-        return elem
+        return next(self.items)
 
 
 class MTstd_unordered_map:
@@ -107,7 +244,9 @@ class MTstd_unordered_map:
                 raise RuntimeError('unknown std::unordered_map implementation')
             else:
                 raise RuntimeError('std::unordered map prior to libstdc++ 4.9')
-        self.node_type = find_type(self.value['_M_h'].type, '__node_type').pointer()
+        self.node_type = find_type(self.value['_M_h'].type, '__node_type').strip_typedefs().pointer()
+        self.type_elem = self.node_type.target().template_argument(0)
+        self.payload = payload_offset(self.node_type.target())
 
     @property
     def prop_type(self):
@@ -121,17 +260,47 @@ class MTstd_unordered_map:
     def prop_buckets(self):
         return self.value['_M_h']['_M_bucket_count']
 
+    @property
+    def prop_heap_bytes(self):
+        h = self.value['_M_h']
+        malloc = mt_heap.MTmalloc()
+        heap = int(self.prop_size) * malloc.request_to_chunk(self.node_type.target().sizeof)
+        buckets = int(h['_M_buckets'])
+        try:
+            single_bucket = int(h['_M_single_bucket'].address)
+        except gdb.error:
+            single_bucket = 0
+        if buckets and buckets != single_bucket:
+            heap += malloc.chunk_size(buckets, int(self.prop_buckets) * mt_util.pointer_size())
+        return heap
+
+    def get_node_addresses(self):
+        """ node addresses in iteration order (_M_nxt is the first word of a node) """
+        return MTnodes().chain(int(self.value['_M_h']['_M_before_begin']['_M_nxt']), 0)
+
+    def get_chain_lengths(self):
+        """ length of each non empty bucket chain; the bucket array is read at once """
+        h = self.value['_M_h']
+        # buckets point to the node before their first node
+        heads = set(mt_util.read_pointers(int(h['_M_buckets']), int(self.prop_buckets)))
+        lengths = []
+        prev = int(h['_M_before_begin'].address)
+        for node in self.get_node_addresses():
+            if prev in heads or not lengths: lengths.append(0)
+            lengths[-1] += 1
+            prev = node
+        return lengths
+
+    def get_payload(self, node):
+        """ value stored in node at address node """
+        return gdb.Value(node + self.payload).cast(self.type_elem.pointer()).dereference()
+
     def __iter__(self):
+        self.items = (self.get_payload(node) for node in self.get_node_addresses())
         return self
 
     def __next__(self):
-        if self.node == 0:
-            raise StopIteration
-        elem = self.node.cast(self.node_type).dereference()
-        self.node = elem['_M_nxt']
-        valptr = elem['_M_storage'].address
-        valptr = valptr.cast(elem.type.template_argument(0).pointer())
-        return valptr.dereference()
+        return next(self.items)
 
 
 class MTstd_unordered_set(MTstd_unordered_map):
@@ -145,34 +314,53 @@ class MTstd_list:
         self.value = value
         self.base = self.value['_M_impl']['_M_node']
         self.next = self.base['_M_next']
-        self.type = find_type(self.value.type, 'value_type').pointer()
+        self.type_elem = find_type(self.value.type, 'value_type').strip_typedefs()
+        self.type = self.type_elem.pointer()
         self.nodeType = self.next.dereference().type.strip_typedefs().pointer()
+        try:
+            self.payload = payload_offset(find_type(self.value.type, '_Node').strip_typedefs())
+        except (gdb.error, ValueError):
+            self.payload = self.nodeType.target().sizeof # value follows _List_node_base
 
     @property
     def prop_type(self):
         return "std::list"
 
+    @property
+    def prop_size(self):
+        header = self.value['_M_impl']['_M_node']
+        try:    return int(header['_M_size']) # libstdc++ >= 7
+        except gdb.error: pass
+        try:    return int(header['_M_data']) # c++11 libstdc++ 5 and 6
+        except gdb.error: pass
+        return sum(1 for node in self.get_node_addresses())
+
+    @property
+    def prop_heap_bytes(self):
+        node_size = self.payload + self.type_elem.sizeof
+        return self.prop_size * mt_heap.MTmalloc().request_to_chunk(node_size)
+
+    def get_node_addresses(self):
+        """ node addresses in iteration order (_M_next is the first word of a node) """
+        return MTnodes().chain(int(self.next), 0, int(self.base.address))
+
+    def get_payload(self, node):
+        """ value stored in node at address node """
+        return gdb.Value(node + self.payload).cast(self.type).dereference()
+
     def __iter__(self):
+        self.items = (self.get_payload(node) for node in self.get_node_addresses())
         return self
 
     def __next__(self):
-        if not self.next or self.next == self.base.address:
-            raise StopIteration
-        elem = self.next
-        self.next = elem.dereference()['_M_next']
-        node_ptr = elem.cast(self.nodeType)
-        node = node_ptr.dereference()
-        try:    # c++03
-            return node['_M_storage'].address.cast(self.type).dereference()
-        except: # c++11
-            return (node_ptr + 1).cast(self.type).dereference()
+        return next(self.items)
 
 
 class MTstd_deque:
     def __init__(self, value):
         self.value = value
-        item_type = value.type.template_argument(0)
-        size = item_type.sizeof
+        self.type_elem = value.type.template_argument(0)
+        size = self.type_elem.sizeof
         if size < 512:
             self.buffer_size = int (512 / size)
         else:
@@ -197,36 +385,50 @@ class MTstd_deque:
         end = self.value['_M_impl']['_M_finish']
         return end['_M_node'] - start['_M_node'] + 1
 
-    def __iter__(self):
+    @property
+    def prop_heap_bytes(self):
+        impl = self.value['_M_impl']
+        nodes = int(impl['_M_map'])
+        if not nodes: return 0
+        malloc = mt_heap.MTmalloc()
+        heap = malloc.chunk_size(nodes, int(impl['_M_map_size']) * mt_util.pointer_size())
+        heap += int(self.prop_buckets) * malloc.request_to_chunk(self.buffer_size * self.type_elem.sizeof)
+        return heap
+
+    def get_buffers(self):
+        """ contiguous element buffers [ (address, count) ], one per block;
+            block pointers are read at once from the map """
+        if not int(self.value['_M_impl']['_M_map']): return [] # moved from
         start = self.value['_M_impl']['_M_start']
-        end = self.value['_M_impl']['_M_finish']
-        self.node = start['_M_node']
-        self.start = start['_M_cur']
-        self.end = start['_M_last']
-        self.last = end['_M_cur']
+        finish = self.value['_M_impl']['_M_finish']
+        size = self.type_elem.sizeof
+        first_node = int(start['_M_node'])
+        nodes = (int(finish['_M_node']) - first_node) // mt_util.pointer_size() + 1
+        blocks = mt_util.read_pointers(first_node, nodes)
+        buffers = []
+        for i, block in enumerate(blocks):
+            begin = i and block or int(start['_M_cur'])
+            end = i < nodes - 1 and block + self.buffer_size * size or int(finish['_M_cur'])
+            if end > begin: buffers.append((begin, (end - begin) // size))
+        return buffers
+
+    def __iter__(self):
+        self.items = read_buffers(self.get_buffers(), self.type_elem)
         return self
 
     def __next__(self):
-        if self.start == self.last:
-            raise StopIteration
-
-        result = self.start.dereference()
-
-        # advance the 'cur' pointer
-        self.start = self.start + 1
-        if self.start == self.end:
-            # if we got to the end of this bucket, move to the next bucket
-            self.node = self.node + 1
-            self.start = self.node[0]
-            self.end = self.start + self.buffer_size
-
-        return result
+        return next(self.items)
 
 
 class MTstd_map:
     def __init__(self, value):
         self.value = value
         self.size = value['_M_t']['_M_impl']['_M_node_count']
+        self.type_elem = find_type(value.type, 'value_type').strip_typedefs()
+        rep_type = find_type(value.type, '_Rep_type')
+        self.node_type = find_type(rep_type, '_Link_type').strip_typedefs().target()
+        self.payload = payload_offset(self.node_type)
+        self.left = offset_of(lookup_type('std::_Rb_tree_node_base'), '_M_left')
 
     @property
     def prop_type(self):
@@ -236,50 +438,31 @@ class MTstd_map:
     def prop_size(self):
         return self.size
 
+    @property
+    def prop_heap_bytes(self):
+        return int(self.size) * mt_heap.MTmalloc().request_to_chunk(self.node_type.sizeof)
+
+    def _root(self):
+        return int(self.value['_M_t']['_M_impl']['_M_header']['_M_parent'])
+
+    def get_node_addresses(self):
+        """ node addresses in iteration (key) order """
+        return MTnodes().inorder(self._root(), self.left, int(self.size))
+
+    def get_depths(self):
+        """ depth of each node of the red-black tree (root is 1) """
+        return list(MTnodes().depths(self._root(), self.left, int(self.size)))
+
+    def get_payload(self, node):
+        """ value stored in node at address node """
+        return gdb.Value(node + self.payload).cast(self.type_elem.pointer()).dereference()
+
     def __iter__(self):
-        self.count = 0
-        self.node = self.value['_M_t']['_M_impl']['_M_header']['_M_left']
-        rep_type = find_type(self.value.type, '_Rep_type')
-        node = find_type(rep_type, '_Link_type')
-        self.type = node.strip_typedefs()
+        self.items = (self.get_payload(node) for node in self.get_node_addresses())
         return self
 
-    def _get_value_from_Rb_tree_node(self, node):
-        """ returns the value held in an _Rb_tree_node<_Val> """
-        try:
-            member = node.type.fields()[1].name
-            if member == '_M_value_field':
-                # C++03 implementation, node contains the value as a member
-                return node['_M_value_field']
-            elif member == '_M_storage':
-                # C++11 implementation, node stores value in __aligned_membuf
-                valtype = node.type.template_argument(0)
-                return get_value_from_aligned_membuf(node['_M_storage'], valtype)
-        except:
-            pass
-        raise ValueError("Unsupported implementation for %s" % str(node.type))
-
     def __next__(self):
-        if self.count == self.size:
-            raise StopIteration
-        result = self.node
-        self.count = self.count + 1
-        if self.count < self.size:
-            # compute the next node
-            node = self.node
-            if node.dereference()['_M_right']:
-                node = node.dereference()['_M_right']
-                while node.dereference()['_M_left']:
-                    node = node.dereference()['_M_left']
-            else:
-                parent = node.dereference()['_M_parent']
-                while node == parent.dereference()['_M_right']:
-                    node = parent
-                    parent = parent.dereference()['_M_parent']
-                if node.dereference()['_M_right'] != parent:
-                    node = parent
-            self.node = node
-        return self._get_value_from_Rb_tree_node(result.cast(self.type).dereference())
+        return next(self.items)
 
 
 class MTstd_set(MTstd_map):
@@ -345,6 +528,30 @@ class MTstd_shared_ptr:
         rc = self.value['_M_refcount']['_M_pi']
         return rc and rc['_M_use_count'] or 0
 
+    @property
+    def prop_weak_count(self):
+        rc = self.value['_M_refcount']['_M_pi']
+        return rc and rc['_M_weak_count'] or 0
+
+    def get_control_block(self):
+        """ address of the control block (0 if empty) """
+        return int(self.value['_M_refcount']['_M_pi'])
+
+    def get_control_block_bytes(self):
+        """ (heap bytes of control block, heap bytes of the object when allocated
+            apart from the control block); make_shared objects are in the control block """
+        rc = self.value['_M_refcount']['_M_pi']
+        if not int(rc): return (0, 0)
+        malloc = mt_heap.MTmalloc()
+        try:
+            block_type = rc.dynamic_type.target()
+        except gdb.error:
+            block_type = rc.type.target()
+        block = malloc.chunk_size(int(rc), block_type.sizeof)
+        if '_Sp_counted_ptr_inplace' in (block_type.name or ''): return (block, 0)
+        pointer = int(self.value['_M_ptr'])
+        return (block, malloc.chunk_size(pointer, self.value['_M_ptr'].type.target().sizeof))
+
     def __iter__(self):
         self.iElem = 0
         return self
@@ -356,6 +563,16 @@ class MTstd_shared_ptr:
         raise StopIteration
 
 
+class MTstd_weak_ptr(MTstd_shared_ptr):
+    """ same layout as shared_ptr, but the object is not owned (not iterated) """
+    @property
+    def prop_type(self):
+        return "std::weak_ptr"
+
+    def __next__(self):
+        raise StopIteration
+
+
 class MTstd_string:
     def __init__(self, value):
         self.value = value
@@ -371,14 +588,46 @@ class MTstd_string:
             size = int(self.value['_M_string_length'])
         except:
             # size is two longs before
-            size = int((data - data.type.sizeof * 2).cast(gdb.lookup_type('long').pointer()).dereference())
+            size = int((data - data.type.sizeof * 2).cast(lookup_type('long').pointer()).dereference())
             assert size >= 0, "internal string"
-        if int(data.cast(gdb.lookup_type('long'))): # not null
-            value = data.dereference().cast(gdb.lookup_type('char').array(size - 1)) # return char[size] type
+        if int(data.cast(lookup_type('long'))): # not null
+            value = data.dereference().cast(lookup_type('char').array(size - 1)) # return char[size] type
         else:
-            value = gdb.Value(0).cast(gdb.lookup_type('char').pointer()) # return (char*)nullptr
+            value = gdb.Value(0).cast(lookup_type('char').pointer()) # return (char*)nullptr
         return value
 
+    def get_data(self):
+        """ (address, length) of the characters """
+        data = int(self.value['_M_dataplus']['_M_p'])
+        try:
+            return data, int(self.value['_M_string_length'])
+        except gdb.error:
+            # reference counted: length is the first word of _Rep header
+            word = mt_util.pointer_size()
+            return data, mt_util.read_pointers(data - 3 * word, 1)[0]
+
+    def is_sso(self):
+        """ characters are stored in the small string buffer (no heap) """
+        try:
+            return int(self.value['_M_dataplus']['_M_p']) == int(self.value['_M_local_buf'].address)
+        except gdb.error:
+            return False # reference counted
+
+    @property
+    def prop_heap_bytes(self):
+        data = int(self.value['_M_dataplus']['_M_p'])
+        malloc = mt_heap.MTmalloc()
+        try:
+            local_buf = int(self.value['_M_local_buf'].address)
+        except gdb.error:
+            # reference counted: _Rep header (length, capacity, refcount) precedes data
+            word = mt_util.pointer_size()
+            length, capacity = mt_util.read_pointers(data - 3 * word, 2)
+            if not capacity: return 0 # shared empty representation
+            return malloc.chunk_size(data - 3 * word, 3 * word + capacity + 1)
+        if data == local_buf: return 0 # short string optimization
+        return malloc.chunk_size(data, int(self.value['_M_allocated_capacity']) + 1)
+
     def __iter__(self):
         self.iElem = 0
         return self
@@ -444,11 +693,11 @@ class MTframe_lf_chunk:
     def __init__(self, value):
         self.value = value['chunk']
         assert self.value.type.code == gdb.TYPE_CODE_PTR
-        directory = int(self.value.cast(gdb.lookup_type('uint64_t')))
+        directory = int(self.value.cast(lookup_type('uint64_t')))
         self.initialized = directory != 0
         if self.initialized:
             directory = directory & -32
-            self.directory = gdb.Value(directory).cast(gdb.lookup_type('uint64_t').pointer())
+            self.directory = gdb.Value(directory).cast(lookup_type('uint64_t').pointer())
 
     @property
     def prop_type(self):
@@ -464,7 +713,7 @@ class MTframe_lf_chunk:
 
     @property
     def prop_collected(self):
-        return self.initialized and bool((int(self.value.cast(gdb.lookup_type('uint64_t'))) & 15) != 0) or False
+        return self.initialized and bool((int(self.value.cast(lookup_type('uint64_t'))) & 15) != 0) or False
 
     @property
     def prop_begin(self, type):
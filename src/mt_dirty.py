@@ -0,0 +1,111 @@
+#   -*- mode: python; coding: utf-8; -*-
+#
+#   Copyright 2018 Asier Aguirre <asier.aguirre@gmail.com>
+#   This file is part of memory-tools.
+#
+#   memory-tools is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   memory-tools is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with memory-tools. If not, see <http://www.gnu.org/licenses/>.
+
+import os, array, weakref
+from mt_numpy import np
+from mt_colors import mt_colors as c
+
+mt_page = 4096
+mt_soft_dirty_bit = 55 # of /proc/$pid/pagemap entries
+mt_dirty_trackers = weakref.WeakSet() # started trackers: soft dirty bits are shared per process
+
+class MTdirty:
+    """ pages written by the inferior since start(): soft dirty bits are
+        cleared through /proc/$pid/clear_refs and read back from /proc/$pid/pagemap
+        (kernel needs CONFIG_MEM_SOFT_DIRTY). Several trackers keep separate
+        windows: before one clears the bits, the others save their dirty pages """
+    def __init__(self, page = mt_page, block = 1 << 16):
+        self.page = page
+        self.block = block  # pagemap entries read at once
+        self.pid = 0
+        self.regions = [ ]  # [ region ] tracked
+        self.saved = set()  # { page number } dirty when another tracker cleared the bits
+
+    def start(self, pid, regions):
+        for tracker in list(mt_dirty_trackers):
+            if tracker is not self and tracker.is_tracking(pid):
+                tracker.saved = tracker.get_dirty_set()
+        with open('/proc/%d/clear_refs' % pid, 'w') as f:
+            f.write('4') # clear soft dirty bits
+        self.pid = pid
+        self.regions = list(regions)
+        self.saved = set()
+        mt_dirty_trackers.add(self)
+
+    def get_ranges(self):
+        """ [ (low, high) ] sorted address ranges covered by the dirty pages """
+        return sorted((region.low, region.high) for region in self.regions)
+
+    def is_tracking(self, pid):
+        return self.pid and self.pid == pid
+
+    def get_dirty_pages(self):
+        """ [ (region, dirty page addresses array) ] of tracked regions """
+        pagemap = os.open('/proc/%d/pagemap' % self.pid, os.O_RDONLY)
+        try:
+            dirty_pages = [ (region, self._region(pagemap, region)) for region in self.regions ]
+        finally:
+            os.close(pagemap)
+        if not self.saved: return dirty_pages
+        merged = [ ]
+        for region, pages in dirty_pages:
+            saved = set(page * self.page for page in self.saved if region.low <= page * self.page < region.high)
+            merged.append((region, array.array('Q', sorted(saved.union(pages)))))
+        return merged
+
+    def _region(self, pagemap, region):
+        dirty = array.array('Q')
+        first, last = region.low // self.page, (region.high + self.page - 1) // self.page
+        while first < last:
+            count = min(self.block, last - first)
+            try:
+                data = os.pread(pagemap, 8 * count, 8 * first)
+            except OSError:
+                data = b''
+            if np is not None:
+                entries = np.frombuffer(data, dtype = np.uint64)
+                pages = np.nonzero((entries >> np.uint64(mt_soft_dirty_bit)) & np.uint64(1))[0]
+                dirty.extend(((pages + first) * self.page).tolist())
+            else:
+                entries = array.array('Q', data)
+                dirty.extend((first + i) * self.page for i, e in enumerate(entries) if (e >> mt_soft_dirty_bit) & 1)
+            first += count
+        return dirty
+
+    def get_dirty_set(self):
+        """ { page number } of dirty pages, to check values with is_dirty() """
+        return set(addr // self.page for region, pages in self.get_dirty_pages() for addr in pages)
+
+    def is_dirty(self, dirty_set, addr, size):
+        """ any page of [addr, addr + size) was written """
+        first, last = addr // self.page, (addr + max(size, 1) - 1) // self.page
+        return any(page in dirty_set for page in range(first, last + 1))
+
+    def dump(self, dirty_pages):
+        print(c.white + 'pages written since dirty tracking start' + c.reset)
+        if not dirty_pages:
+            print(c.red + '<empty>' + c.reset)
+            return
+        print((c.cyan + '%16s %16s %10s %10s %s' + c.reset) % ('Start', 'End', 'Pages', 'Dirty', 'Description'))
+        for region, pages in dirty_pages:
+            print((c.green + '%16x %16x ' + c.yellow + '%10d %10d ' + c.reset + '%s') %
+                  (region.low, region.high, (region.high - region.low) // self.page, len(pages), region.build_description()))
+        total = sum(len(pages) for region, pages in dirty_pages)
+        print(c.white + 'total: ' + c.reset + '%d dirty pages (%d bytes)' % (total, total * self.page))
+
+mt_dirty_tracker = MTdirty()
@@ -0,0 +1,152 @@
+#   -*- mode: python; coding: utf-8; -*-
+#
+#   Copyright 2018 Asier Aguirre <asier.aguirre@gmail.com>
+#   This file is part of memory-tools.
+#
+#   memory-tools is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   memory-tools is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with memory-tools. If not, see <http://www.gnu.org/licenses/>.
+
+import gdb, json, math, mt_visitor
+from mt_type_cleaning import type_id
+
+mt_smart_pointers = ( 'std::unique_ptr<', 'std::shared_ptr<', 'std::weak_ptr<' )
+
+class MTexport(mt_visitor.MTvisitor):
+    """ stream values to a file as JSON or NDJSON without building them in memory;
+        output follows MTpython structure. Roots and targets of pointers and
+        smart pointers (the only values that can be reached twice) get an id
+        and are referenced as { "$ref": id } when written again, using the
+        (addr, type id) key of MTpython; embedded values are not recorded """
+    def __init__(self, out, ndjson = False):
+        super().__init__()
+        self.out = out
+        self.ndjson = ndjson
+        self.ids = { }      # { (addr, type id): id } of roots and pointed values
+        self.pending = [ ]  # [ (id, value, name) ] ndjson objects reached through pointers
+        self.open = [ ]     # [ [is_slot, written] ] open objects / pointer slots
+        self.line_key = None
+        self.pointed = False # next struct visited is a root or pointer target
+        self.roots = 0
+
+    def begin(self):
+        if not self.ndjson: self.out.write('[')
+
+    def end(self):
+        if not self.ndjson: self.out.write(']\n')
+
+    def export(self, name, value):
+        """ write one root value """
+        if self.ndjson:
+            self._line(None, value, name)
+            while self.pending:
+                self._line(*self.pending.pop())
+        else:
+            self.out.write((self.roots and ',\n' or '\n') + '{"name": ' + json.dumps(name) + ', "value": ')
+            self.pointed = True
+            self.visit(value, name)
+            self.pointed = False
+            self.out.write('}')
+        self.roots += 1
+
+    def _line(self, id, value, name):
+        self.out.write('{' + (id is None and '"root": ' or '"$id": %d, "name": ' % id) + json.dumps(name) + ', "value": ')
+        self.line_key = id is not None and self._key(value) or None
+        self.pointed = True
+        self.visit(value, name)
+        self.pointed = False
+        self.out.write('}\n')
+
+    def _key(self, value):
+        if value.address is None: return None
+        addr = int(value.address)
+        return addr and (addr, type_id(value.type)) or None
+
+    def _write_key(self, name):
+        if not self.open: return
+        top = self.open[-1]
+        if top[0]: # pointer slot, value without name
+            top[1] += 1
+            return
+        if name[0] == '[': name = name[1 : name.find(']')]
+        self.out.write((top[1] and ', ' or '') + json.dumps(name) + ': ')
+        top[1] += 1
+
+    def _write(self, name, string):
+        self._write_key(name)
+        self.out.write(string)
+
+    def visit_struct(self, value, name):
+        pointed, self.pointed = self.pointed, False
+        key = pointed and self._key(value) or None
+        line_key, self.line_key = self.line_key, None # only the top of the line is exempt
+        if key in self.ids and key != line_key:
+            return self._write(name, '{"$ref": %d}' % self.ids[key])
+        self._write_key(name)
+        if key:
+            self.ids.setdefault(key, len(self.ids))
+            self.out.write('{"$id": %d' % self.ids[key])
+        else:
+            self.out.write('{')
+        self.open.append([False, key and 1 or 0])
+        # items of smart pointers are their targets
+        self.pointed = (value.type.name or '').startswith(mt_smart_pointers)
+        self.generic_visit(value, name)
+        self.pointed = False
+        self.open.pop()
+        self.out.write('}')
+
+    def visit_array(self, value, name):
+        if self.is_string_char_array(value): return self.visit_string(value, name)
+        self.visit_struct(value, name)
+
+    def visit_union(self, value, name):
+        self.visit_struct(value, name)
+
+    def visit_ptr(self, value, name):
+        if self.ndjson and not self.is_string_const_char(value):
+            target = self.dereference(value)
+            if target is not None and target.type.strip_typedefs().code == gdb.TYPE_CODE_STRUCT:
+                key = self._key(target)
+                if key:
+                    if key not in self.ids:
+                        self.ids[key] = len(self.ids)
+                        self.pending.append((self.ids[key], target, '*' + name))
+                    return self._write(name, '{"$ref": %d}' % self.ids[key])
+        self._write_key(name)
+        slot = [True, 0]
+        self.open.append(slot)
+        self.pointed = True
+        self.generic_visit(value, name)
+        self.pointed = False
+        self.open.pop()
+        if not slot[1]: self.out.write('null')
+
+    def visit_int(self, value, name):
+        self._write(name, str(int(value)))
+
+    def visit_char(self, value, name):
+        self._write(name, json.dumps(str(value)))
+
+    def visit_string(self, value, name):
+        self._write(name, json.dumps(self.get_string(value)))
+
+    def visit_bool(self, value, name):
+        self._write(name, bool(value) and 'true' or 'false')
+
+    def visit_flt(self, value, name):
+        number = float(value)
+        # NaN and infinities are not valid JSON numbers
+        self._write(name, json.dumps(number if math.isfinite(number) else str(number)))
+
+    def visit_enum(self, value, name):
+        self._write(name, str(int(value)))
@@ -0,0 +1,58 @@
+#   -*- mode: python; coding: utf-8; -*-
+#
+#   Copyright 2018 Asier Aguirre <asier.aguirre@gmail.com>
+#   This file is part of memory-tools.
+#
+#   memory-tools is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   memory-tools is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with memory-tools. If not, see <http://www.gnu.org/licenses/>.
+
+import mt_visitor
+from mt_type_cleaning import clean_type
+from mt_colors import mt_colors as c
+
+class MTfootprint(mt_visitor.MTwalker):
+    """ heap bytes owned by std containers reachable from roots, per container and per type """
+    def __init__(self):
+        super().__init__()
+        self.containers = [ ] # [ (heap_bytes, addr, name, typename) ]
+        self.types = { }      # { typename: [count, heap_bytes] }
+
+    def analysis(self, name_values):
+        """ name_values as returned by MTsymbols.get_values """
+        for name, value in name_values:
+            self.walk(value, name)
+
+    def on_wrap(self, wrap, value, name):
+        if not hasattr(wrap, 'prop_heap_bytes'): return True
+        heap_bytes = wrap.prop_heap_bytes
+        typename = clean_type(value.type)
+        self.containers.append((heap_bytes, int(value.address or 0), name, typename))
+        stats = self.types.setdefault(typename, [0, 0])
+        stats[0] += 1
+        stats[1] += heap_bytes
+        return True
+
+    def dump(self, max_containers = 20):
+        print(c.white + 'heap footprint by type' + c.reset)
+        if not self.containers:
+            print(c.red + '<empty>' + c.reset)
+            return
+        print((c.cyan + '%10s %14s %s' + c.reset) % ('Count', 'Heap bytes', 'Type'))
+        for typename, (count, heap_bytes) in sorted(self.types.items(), key = lambda x: -x[1][1]):
+            print((c.yellow + '%10d %14d ' + c.reset + '%s') % (count, heap_bytes, typename))
+        print(c.white + 'largest containers' + c.reset)
+        print((c.cyan + '%16s %14s %s' + c.reset) % ('Address', 'Heap bytes', 'Name'))
+        for heap_bytes, addr, name, typename in sorted(self.containers, reverse = True)[:max_containers]:
+            print((c.green + '%16x ' + c.yellow + '%14d ' + c.reset + '%s ' + c.blue + '%s' + c.reset) %
+                  (addr, heap_bytes, name, typename))
+        print(c.white + 'total: ' + c.reset + str(sum(x[0] for x in self.containers)) + ' bytes')
@@ -0,0 +1,108 @@
+#   -*- mode: python; coding: utf-8; -*-
+#
+#   Copyright 2018 Asier Aguirre <asier.aguirre@gmail.com>
+#   This file is part of memory-tools.
+#
+#   memory-tools is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   memory-tools is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with memory-tools. If not, see <http://www.gnu.org/licenses/>.
+
+import math, mt_visitor, mt_heap, mt_locality, mt_util
+from mt_type_cleaning import clean_type
+from mt_colors import mt_colors as c
+
+class MThealth(mt_visitor.MTwalker):
+    """ signs of poor runtime performance of std containers reachable from roots """
+    max_chain = 8 # last bucket of chain length histogram accumulates longer chains
+    page = 4096
+
+    def __init__(self):
+        super().__init__()
+        self.issues = [ ] # [ (wasted_bytes, cost, addr, name, typename, details) ]
+        self.chains = [0] * (self.max_chain + 1) # { chain length: buckets }
+        self.malloc = mt_heap.MTmalloc()
+        self.word = mt_util.pointer_size()
+
+    def analysis(self, name_values):
+        """ name_values as returned by MTsymbols.get_values """
+        for name, value in name_values:
+            self.walk(value, name)
+
+    def on_wrap(self, wrap, value, name):
+        check = getattr(self, '_check_' + wrap.prop_type.replace('std::', ''), None)
+        if check:
+            issue = check(wrap)
+            if issue:
+                self.issues.append(issue[:2] + (int(value.address or 0), name, clean_type(value.type)) + issue[2:])
+        return True
+
+    def _check_vector(self, wrap):
+        if wrap.is_bool: return None
+        size, capacity = int(wrap.prop_size), int(wrap.prop_capacity)
+        return (wrap.prop_slack_bytes, 1, 'size %d capacity %d ratio %s' %
+                (size, capacity, size and '%.2f' % (capacity / size) or '-'))
+
+    def _check_unordered_map(self, wrap):
+        size, buckets = int(wrap.prop_size), int(wrap.prop_buckets)
+        lengths = wrap.get_chain_lengths()
+        for length in lengths:
+            self.chains[min(length, self.max_chain)] += 1
+        self.chains[0] += buckets - len(lengths)
+        # expected probes of a successful lookup
+        cost = size and sum(l * (l + 1) // 2 for l in lengths) / size or 0
+        wasted = (buckets - len(lengths)) * self.word
+        return (wasted, cost, 'size %d buckets %d load %.2f max chain %d' %
+                (size, buckets, buckets and size / buckets or 0, max(lengths or [0])))
+
+    _check_unordered_set = _check_unordered_map
+
+    def _check_deque(self, wrap):
+        impl = wrap.value['_M_impl']
+        size, blocks, map_size = int(wrap.prop_size), int(wrap.prop_buckets), int(impl['_M_map_size'])
+        block_bytes = wrap.buffer_size * wrap.type_elem.sizeof
+        used = size * wrap.type_elem.sizeof
+        wasted = blocks * block_bytes - used + (map_size - blocks) * self.word
+        return (wasted, 1, 'size %d blocks %d map %d block usage %.2f' %
+                (size, blocks, map_size, blocks and used / (blocks * block_bytes) or 0))
+
+    def _check_map(self, wrap):
+        depths = wrap.get_depths()
+        if not depths: return None
+        optimal = math.ceil(math.log2(len(depths) + 1))
+        wasted = wrap.prop_heap_bytes - len(depths) * wrap.type_elem.sizeof # node overhead
+        cost = sum(depths) / len(depths)
+        return (wasted, cost, 'size %d depth %d (optimal %d) mean %.2f' %
+                (len(depths), max(depths), optimal, cost))
+
+    _check_set = _check_map
+
+    def _check_list(self, wrap):
+        stats = mt_locality.MTlocality_stats(wrap.get_node_addresses(), self.page)
+        if not stats.nodes: return None
+        wasted = wrap.prop_heap_bytes - stats.nodes * wrap.type_elem.sizeof # node overhead
+        return (wasted, stats.nodes / 2, str(stats))
+
+    def dump(self, by_cost = False, max_issues = 40):
+        print(c.white + 'containers ranked by ' + (by_cost and 'lookup cost' or 'wasted bytes') + c.reset)
+        if not self.issues:
+            print(c.red + '<empty>' + c.reset)
+            return
+        key = by_cost and (lambda x: (-x[1], -x[0])) or (lambda x: (-x[0], -x[1]))
+        print((c.cyan + '%16s %12s %8s %s' + c.reset) % ('Address', 'Wasted', 'Cost', 'Name + Type + Details'))
+        for wasted, cost, addr, name, typename, details in sorted(self.issues, key = key)[:max_issues]:
+            print((c.green + '%16x ' + c.yellow + '%12d %8.2f ' + c.reset + '%s ' + c.blue + '%s ' + c.reset + '%s') %
+                  (addr, wasted, cost, name, typename, details))
+        if sum(self.chains):
+            print(c.white + 'unordered bucket chain lengths' + c.reset)
+            for length, buckets in enumerate(self.chains):
+                print((c.cyan + '  %3s' + c.yellow + '%12d' + c.reset) %
+                      (length == self.max_chain and '%d+' % length or str(length), buckets))
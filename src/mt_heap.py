@@ -0,0 +1,80 @@
+#   -*- mode: python; coding: utf-8; -*-
+#
+#   Copyright 2018 Asier Aguirre <asier.aguirre@gmail.com>
+#   This file is part of memory-tools.
+#
+#   memory-tools is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   memory-tools is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with memory-tools. If not, see <http://www.gnu.org/licenses/>.
+
+import gdb, mt_util
+from mt_type_cleaning import type_id
+
+class MTmalloc:
+    """ glibc malloc chunk geometry: bytes really used by a heap block """
+    def __init__(self):
+        self.size_sz = mt_util.pointer_size()    # SIZE_SZ
+        self.align = 2 * self.size_sz            # MALLOC_ALIGNMENT
+        self.min_chunk = 4 * self.size_sz        # MINSIZE
+        self.page = 4096
+
+    def request_to_chunk(self, request):
+        """ chunk size (usable + header) that malloc(request) would use """
+        if request <= 0: return 0
+        size = (request + self.size_sz + self.align - 1) & ~(self.align - 1)
+        return max(size, self.min_chunk)
+
+    def chunk_size(self, addr, request):
+        """ chunk size reading the malloc header of block at addr; falls back
+            to request_to_chunk when the header does not look like glibc's """
+        if not addr or request <= 0: return 0
+        estimation = self.request_to_chunk(request)
+        try:
+            size = mt_util.read_pointers(addr - self.size_sz, 1)[0]
+        except gdb.MemoryError:
+            return estimation
+        mmapped = size & 2  # IS_MMAPPED
+        size &= ~7
+        if mmapped:
+            if size >= request and size <= request + self.page + self.align:
+                return size
+        elif size >= estimation and size < estimation + self.min_chunk:
+            return size
+        return estimation
+
+
+mt_owns_heap = { } # { type id: bool }
+
+def type_owns_heap(type):
+    """ False if values of type cannot reference other memory (scalars and
+        aggregates of scalars), so containers of them need no element walk """
+    type = type.strip_typedefs()
+    key = type_id(type)
+    if key not in mt_owns_heap:
+        mt_owns_heap[key] = True # recursive types own heap
+        mt_owns_heap[key] = _type_owns_heap(type)
+    return mt_owns_heap[key]
+
+def _type_owns_heap(type):
+    code = type.code
+    if code in { gdb.TYPE_CODE_INT, gdb.TYPE_CODE_FLT, gdb.TYPE_CODE_BOOL,
+                 gdb.TYPE_CODE_CHAR, gdb.TYPE_CODE_ENUM }:
+        return False
+    if code == gdb.TYPE_CODE_ARRAY:
+        return type_owns_heap(type.target())
+    if code in { gdb.TYPE_CODE_STRUCT, gdb.TYPE_CODE_UNION }:
+        if type.name and type.name.startswith('std::'): return True
+        for field in type.fields():
+            if not hasattr(field, 'bitpos'): continue # static member
+            if type_owns_heap(field.type): return True
+        return False
+    return True
@@ -16,28 +16,134 @@
 #   You should have received a copy of the GNU General Public License
 #   along with memory-tools. If not, see <http://www.gnu.org/licenses/>.
 
-import gdb, sys, mt_maps, mt_symbols, mt_object
+import gdb, os, sys, time, signal, threading, mt_cache, mt_heap, mt_types, mt_type_cleaning, mt_maps, mt_symbols, mt_object, mt_footprint, mt_layout, mt_sharing, mt_locality, mt_strings, mt_shared, mt_pages, mt_dirty, mt_cold, mt_numa, mt_stacks, mt_tls, mt_locks, mt_alloc_stats, mt_memory, mt_health, mt_numpy, mt_export
 from mt_colors import mt_colors as c
 
 
 # context
+class MTlayer:
+    """ cached object rebuilt on demand, with hit and rebuild statistics;
+        a stale layer is only rebuilt when its stamp (cheap to compute) changed """
+    def __init__(self, name, build, stamp = None):
+        self.name = name
+        self.build = build      # build(previous) -> object
+        self.stamp = stamp      # stamp() -> comparable, or None when always rebuilt
+        self.value = None
+        self.stale = False
+        self.last_stamp = None
+        self.hits = self.builds = 0
+        self.build_time = self.last_build_time = 0.0
+
+    def invalidate(self):
+        self.value = None
+
+    def mark_stale(self):
+        self.stale = True
+
+    def get(self):
+        if self.value is not None and self.stale:
+            self.stale = False
+            stamp = self.stamp and self.stamp()
+            if stamp is None or stamp != self.last_stamp:
+                self._build(stamp)
+                return self.value
+        if self.value is None:
+            self._build(self.stamp and self.stamp())
+        else:
+            self.hits += 1
+        return self.value
+
+    def _build(self, stamp):
+        start = time.time()
+        self.value = self.build(self.value)
+        self.last_stamp = stamp
+        self.stale = False
+        self.last_build_time = time.time() - start
+        self.build_time += self.last_build_time
+        self.builds += 1
+
+    def stats(self):
+        requests = self.hits + self.builds
+        return [ ('requests', requests),
+                 ('hit rate', '%.1f%%' % (requests and 100.0 * self.hits / requests)),
+                 ('rebuilds', self.builds),
+                 ('last rebuild', '%.3f s' % self.last_build_time),
+                 ('total rebuild', '%.3f s' % self.build_time) ]
+
+
 class MTcontext:
+    """ per subsystem caches, each one invalidated only by the events that
+        can change it (see handlers at the end of this file) """
     def __init__(self):
-        self.invalidate()
+        self.maps = MTlayer('maps', lambda previous: mt_maps.MTmaps(), self._maps_stamp)
+        # symbols in frames are always parsed again, global and static blocks are reused
+        self.symbols = MTlayer('symbols', lambda previous: mt_symbols.MTsymbols(statics = previous))
+        self.type_rebuilds = 0
+        self.memory = None # MTmemory kept between stops (incremental analysis)
 
     def invalidate(self):
-        self.maps = None
-        self.symbols = None
+        self.invalidate_maps()
+        self.invalidate_symbols()
+        self.invalidate_types()
+        self.invalidate_memory()
+
+    def invalidate_maps(self):
+        self.maps.invalidate()
+
+    def invalidate_symbols(self):
+        self.symbols.invalidate()
+
+    def invalidate_types(self):
+        self.memory = None # keyed by type ids
+        mt_types.mt_type_registry.clear()
+        mt_type_cleaning.mt_type_names.clear()
+        mt_heap.mt_owns_heap.clear()
+        mt_numpy.mt_dtypes.clear()
+        mt_layout.mt_layouts.clear()
+        mt_sharing.mt_sync_kinds.clear()
+        mt_sharing.mt_sync_fields.clear()
+        mt_locks.mt_mutex_kinds.clear()
+        mt_locks.mt_mutex_fields.clear()
+        mt_locality.mt_link_fields.clear()
+        self.type_rebuilds += 1
+
+    def invalidate_memory(self):
+        mt_cache.mt_page_cache.clear()
+
+    def on_resume(self):
+        # maps are diffed and frames parsed on next request
+        self.maps.mark_stale()
+        self.symbols.mark_stale()
+        self.invalidate_memory()
+
+    def _maps_stamp(self):
+        inferior = gdb.selected_inferior()
+        try:
+            with open('/proc/%d/maps' % inferior.pid) as f:
+                maps = f.read()
+        except IOError:
+            return None
+        return (maps, tuple(sorted(thread.num for thread in inferior.threads())))
 
     def get_maps(self):
-        if self.maps: return self.maps
-        self.maps = mt_maps.MTmaps()
-        return self.maps
+        return self.maps.get()
 
     def get_symbols(self):
-        if self.symbols: return self.symbols
-        self.symbols = mt_symbols.MTsymbols()
-        return self.symbols
+        return self.symbols.get()
+
+    def get_memory(self):
+        if self.memory is None: self.memory = mt_memory.MTmemory()
+        return self.memory
+
+    def stats(self):
+        return [ (layer.name, layer.stats()) for layer in (self.maps, self.symbols) ] + \
+               [ ('types', mt_types.mt_type_registry.stats() +
+                           [ ('interned names', len(mt_type_cleaning.mt_type_names.names)),
+                             ('derived types', len(mt_heap.mt_owns_heap) + len(mt_numpy.mt_dtypes) +
+                                               len(mt_layout.mt_layouts) + len(mt_sharing.mt_sync_fields) +
+                                               len(mt_locks.mt_mutex_fields)),
+                             ('invalidations', self.type_rebuilds) ]),
+                 ('memory', mt_cache.mt_page_cache.stats()) ]
 
 mt_context = MTcontext()
 mt_debug = False
@@ -211,6 +317,631 @@ class MTobjects(MTbase):
         objs.dump()
 
 
+class MTfootprint(MTbase):
+    """Heap bytes owned by std containers reachable from symbols
+    Bytes include capacity slack, hash buckets, tree and list nodes, deque
+      maps and blocks and strings out of the small string buffer, measured
+      with malloc chunk sizes.
+    Without arguments, all variables are used as roots. Otherwise, arguments
+      select root symbols as in 'mt symbols'.
+    Examples:
+      mt footprint
+      mt footprint ^mt_ loc_static
+    """
+    def __init__(self):
+        gdb.Command.__init__(self, 'mt footprint', gdb.COMMAND_DATA, prefix = False)
+
+    @mt_show_exception
+    def invoke(self, argument, from_tty):
+        syms = mt_context.get_symbols()
+        locs, addrs, names, ranges = syms.filter_arguments_from_string(argument or '*')
+        footprint = mt_footprint.MTfootprint()
+        footprint.analysis(syms.get_values(syms.filter(locs, addrs, names, ranges)))
+        footprint.dump()
+
+
+class MTlayout(MTbase):
+    """Struct padding weighted by live instances reachable from symbols
+    As pahole, holes between fields and tail padding of each struct type are
+      reported, but types are ranked by bytes lost in all live instances.
+      Reordering column shows bytes saved if fields were sorted by alignment
+      ('?' for bitfields, base classes or virtual tables).
+    Without arguments, all variables are used as roots. Otherwise, arguments
+      select root symbols as in 'mt symbols'.
+    Examples:
+      mt layout
+      mt layout ^mt_ loc_static
+    """
+    def __init__(self):
+        gdb.Command.__init__(self, 'mt layout', gdb.COMMAND_DATA, prefix = False)
+
+    @mt_show_exception
+    def invoke(self, argument, from_tty):
+        syms = mt_context.get_symbols()
+        locs, addrs, names, ranges = syms.filter_arguments_from_string(argument or '*')
+        padding = mt_layout.MTpadding()
+        padding.analysis(syms.get_values(syms.filter(locs, addrs, names, ranges)))
+        padding.dump()
+
+
+class MTsharing(MTbase):
+    """False sharing candidates among values reachable from symbols
+    Locks (std and pthread mutexes, condition variables...) and atomics are
+      located in all values reachable from roots. Cache lines (64 bytes) holding
+      more than one of them, or one of them and other roots or pointed objects,
+      are listed with the objects on each line.
+    Arrays and vectors of elements with locks or atomics not padded to a cache
+      line (e.g. per thread counters) are also listed.
+    Without arguments, all variables are used as roots. Otherwise, arguments
+      select root symbols as in 'mt symbols'.
+    Examples:
+      mt sharing
+      mt sharing ^mt_ loc_static
+    """
+    def __init__(self):
+        gdb.Command.__init__(self, 'mt sharing', gdb.COMMAND_DATA, prefix = False)
+
+    @mt_show_exception
+    def invoke(self, argument, from_tty):
+        syms = mt_context.get_symbols()
+        locs, addrs, names, ranges = syms.filter_arguments_from_string(argument or '*')
+        sharing = mt_sharing.MTsharing()
+        sharing.analysis(syms.get_values(syms.filter(locs, addrs, names, ranges)))
+        sharing.dump()
+
+
+class MTlocality(MTbase):
+    """Pointer chasing locality of node based containers reachable from symbols
+    Node addresses of lists, maps, sets, unordered containers and user linked
+      structures (structs with a pointer, unique_ptr or shared_ptr to their own
+      type) are read in iteration order; reported metrics are mean and
+      percentile strides between successive nodes, fraction of successors in
+      the same page and distinct pages per 1000 nodes.
+    Containers are sorted by worst same page fraction.
+    Without arguments, all variables are used as roots. Otherwise, arguments
+      select root symbols as in 'mt symbols'.
+    Examples:
+      mt locality
+      mt locality ^mt_ loc_static
+    """
+    def __init__(self):
+        gdb.Command.__init__(self, 'mt locality', gdb.COMMAND_DATA, prefix = False)
+
+    @mt_show_exception
+    def invoke(self, argument, from_tty):
+        syms = mt_context.get_symbols()
+        locs, addrs, names, ranges = syms.filter_arguments_from_string(argument or '*')
+        locality = mt_locality.MTlocality()
+        locality.analysis(syms.get_values(syms.filter(locs, addrs, names, ranges)))
+        locality.dump()
+
+
+class MTstrings(MTbase):
+    """Duplicated string contents reachable from symbols
+    std::string, char arrays and const char* strings are hashed while walking;
+      contents with several copies are reported with copy counts and bytes
+      reclaimable sharing one heap copy. Strings are also split by storage:
+      small string buffer (sso), heap, char arrays and pointers.
+    Without arguments, all variables are used as roots. Otherwise, arguments
+      select root symbols as in 'mt symbols'.
+    Examples:
+      mt strings
+      mt strings ^mt_ loc_static
+    """
+    def __init__(self):
+        gdb.Command.__init__(self, 'mt strings', gdb.COMMAND_DATA, prefix = False)
+
+    @mt_show_exception
+    def invoke(self, argument, from_tty):
+        syms = mt_context.get_symbols()
+        locs, addrs, names, ranges = syms.filter_arguments_from_string(argument or '*')
+        strings = mt_strings.MTstrings()
+        strings.analysis(syms.get_values(syms.filter(locs, addrs, names, ranges)))
+        strings.dump()
+
+
+class MTshared(MTbase):
+    """Shared ownership reachable from symbols
+    shared_ptr and weak_ptr values are grouped by control block, reporting use
+      and weak counts and heap bytes of control blocks and objects (expired
+      bytes are kept alive only by weak_ptr).
+    Cycles of shared ownership (strongly connected components of the owner to
+      owned graph) are listed; they are never freed by reference counting and
+      are leaked when they have no external references.
+    Without arguments, all variables are used as roots. Otherwise, arguments
+      select root symbols as in 'mt symbols'.
+    Examples:
+      mt shared
+      mt shared ^mt_ loc_static
+    """
+    def __init__(self):
+        gdb.Command.__init__(self, 'mt shared', gdb.COMMAND_DATA, prefix = False)
+
+    @mt_show_exception
+    def invoke(self, argument, from_tty):
+        syms = mt_context.get_symbols()
+        locs, addrs, names, ranges = syms.filter_arguments_from_string(argument or '*')
+        shared = mt_shared.MTshared()
+        shared.analysis(syms.get_values(syms.filter(locs, addrs, names, ranges)))
+        shared.dump()
+
+
+class MTpages(MTbase):
+    """Zero and duplicated pages of writable anonymous regions
+    Resident pages of heap, stacks, bss and anonymous mappings are read from
+      /proc/$pid/mem in large blocks and fingerprinted; pages full of zeros
+      and pages with the same contents as another one (dedup candidates) are
+      counted per region.
+    Use --objects to also report roots, pointed objects and container buffers
+      (reachable from symbols) covering those pages; next arguments select
+      root symbols as in 'mt symbols'.
+    Examples:
+      mt pages
+      mt pages --objects
+      mt pages --objects ^mt_ loc_static
+    """
+    def __init__(self):
+        gdb.Command.__init__(self, 'mt pages', gdb.COMMAND_DATA, prefix = False)
+
+    @mt_show_exception
+    def invoke(self, argument, from_tty):
+        args = argument.split()
+        pages = mt_pages.MTpages(gdb.selected_inferior().pid)
+        pages.scan(mt_context.get_maps().get_anonymous_writable())
+        pages.dump()
+        if args and args[0] == '--objects':
+            syms = mt_context.get_symbols()
+            locs, addrs, names, ranges = syms.filter_arguments_from_string(' '.join(args[1:]) or '*')
+            objects = mt_pages.MTpage_objects()
+            objects.analysis(syms.get_values(syms.filter(locs, addrs, names, ranges)))
+            objects.dump(pages)
+
+
+class MTdirty(MTbase):
+    """Pages written by the inferior between two stops (soft dirty bits)
+    Use 'start' to clear soft dirty bits of the process and track writable
+      regions (or regions given by name as in 'mt maps'); run the inferior
+      and use 'report' to list written pages per region.
+    Use 'report --objects' to also report roots, pointed objects and container
+      buffers (reachable from symbols) on written pages; next arguments select
+      root symbols as in 'mt symbols'.
+    Examples:
+      mt dirty start
+      mt dirty start [heap]
+      mt dirty report
+      mt dirty report --objects ^mt_ loc_static
+    """
+    def __init__(self):
+        gdb.Command.__init__(self, 'mt dirty', gdb.COMMAND_DATA, prefix = False)
+
+    @mt_show_exception
+    def invoke(self, argument, from_tty):
+        args = argument.split()
+        tracker = mt_dirty.mt_dirty_tracker
+        pid = gdb.selected_inferior().pid
+        if args and args[0] == 'start':
+            maps = mt_context.get_maps()
+            tracker.start(pid, len(args) > 1 and maps.get_regions(args[1:]) or maps.get_writable())
+        elif args and args[0] == 'report':
+            if not tracker.is_tracking(pid):
+                print(c.red + 'error: ' + c.reset + 'dirty tracking not started for this process')
+                return
+            dirty_pages = tracker.get_dirty_pages()
+            tracker.dump(dirty_pages)
+            if len(args) > 1 and args[1] == '--objects':
+                syms = mt_context.get_symbols()
+                locs, addrs, names, ranges = syms.filter_arguments_from_string(' '.join(args[2:]) or '*')
+                objects = mt_pages.MTpage_objects()
+                objects.analysis(syms.get_values(syms.filter(locs, addrs, names, ranges)))
+                pages = [ addr for region, region_pages in dirty_pages for addr in region_pages ]
+                objects.dump_pages('dirty', pages, tracker.page)
+        else:
+            print(c.red + 'error: ' + c.reset + 'unknown argument "' + argument + '"')
+
+
+class MTcold(MTbase):
+    """Memory not accessed during an interval (idle page tracking)
+    Use 'start' to mark as idle the resident pages of writable anonymous
+      regions (or regions given by name as in 'mt maps'); run the inferior
+      and use 'report' to list pages not accessed since then per region.
+    Use 'run' <seconds> to start, continue the inferior for that time (it is
+      stopped with SIGINT) and report.
+    Use 'report --objects' to also report cold bytes by root symbol, by type
+      and by object (roots, pointed objects, container buffers and nodes
+      reachable from symbols); next arguments select root symbols as in
+      'mt symbols'.
+    Needs root privileges and a kernel with idle page tracking.
+    Examples:
+      mt cold start
+      mt cold start [heap]
+      mt cold run 10
+      mt cold report --objects ^mt_ loc_static
+    """
+    def __init__(self):
+        gdb.Command.__init__(self, 'mt cold', gdb.COMMAND_DATA, prefix = False)
+
+    @mt_show_exception
+    def invoke(self, argument, from_tty):
+        args = argument.split()
+        tracker = mt_cold.mt_cold_tracker
+        pid = gdb.selected_inferior().pid
+        if args and args[0] in ('start', 'run'):
+            seconds = args[0] == 'run' and float(args.pop(1)) or 0
+            maps = mt_context.get_maps()
+            tracker.start(pid, len(args) > 1 and maps.get_regions(args[1:]) or maps.get_anonymous_writable())
+            if not seconds: return
+            timer = threading.Timer(seconds, os.kill, (pid, signal.SIGINT))
+            timer.start()
+            try:
+                gdb.execute('continue')
+            finally:
+                timer.cancel()
+            args = ['report']
+        if args and args[0] == 'report':
+            if not tracker.is_tracking(pid):
+                print(c.red + 'error: ' + c.reset + 'cold tracking not started for this process')
+                return
+            cold_pages = tracker.get_cold_pages()
+            tracker.dump(cold_pages)
+            if len(args) > 1 and args[1] == '--objects':
+                syms = mt_context.get_symbols()
+                locs, addrs, names, ranges = syms.filter_arguments_from_string(' '.join(args[2:]) or '*')
+                objects = mt_pages.MTpage_objects()
+                objects.analysis(syms.get_values(syms.filter(locs, addrs, names, ranges)))
+                pages = [ addr for region, resident, region_pages in cold_pages for addr in region_pages ]
+                for by in ('root', 'type', 'name'):
+                    objects.dump_pages('cold', pages, tracker.page, by)
+        elif not args or args[0] not in ('start', 'run'):
+            print(c.red + 'error: ' + c.reset + 'unknown argument "' + argument + '"')
+
+
+class MTnuma(MTbase):
+    """NUMA placement of regions and large objects
+    Reports memory policy and pages per NUMA node of regions (from
+      /proc/$pid/numa_maps) and the cpu and allowed nodes of each thread.
+    Use --objects to also report the node of the pages of roots, pointed
+      objects and container buffers and nodes (reachable from symbols) of at
+      least --min bytes (default 65536), queried page by page with move_pages(2),
+      next to the threads whose roots reach them ('all' for static roots).
+      Nodes are shown in red when most pages are out of the nodes where those
+      threads may run. Next arguments select root symbols as in 'mt symbols'.
+    Examples:
+      mt numa
+      mt numa --objects
+      mt numa --objects --min 1048576 ^mt_ loc_static
+    """
+    def __init__(self):
+        gdb.Command.__init__(self, 'mt numa', gdb.COMMAND_DATA, prefix = False)
+
+    @mt_show_exception
+    def invoke(self, argument, from_tty):
+        args = argument.split()
+        inferior = gdb.selected_inferior()
+        numa = mt_numa.MTnuma(mt_context.get_maps(), inferior.pid)
+        if not numa.available:
+            print(c.red + 'error: ' + c.reset + 'no /proc/%d/numa_maps (kernel without NUMA support)' % inferior.pid)
+            return
+        numa.load_threads(inferior.threads())
+        numa.dump_regions()
+        numa.dump_threads()
+        if args and args[0] == '--objects':
+            min_bytes = 65536
+            if len(args) > 2 and args[1] == '--min':
+                min_bytes = int(args[2], 0)
+                args = args[2:]
+            syms = mt_context.get_symbols()
+            locs, addrs, names, ranges = syms.filter_arguments_from_string(' '.join(args[1:]) or '*')
+            tuple_syms = syms.filter(locs, addrs, names, ranges)
+            root_threads = { } # { root name: { thread num } or None for statics }
+            for address, name, (symbol, thread, frame, block) in tuple_syms:
+                if block.is_global or block.is_static or root_threads.get(name, 0) is None:
+                    root_threads[name] = None
+                else:
+                    root_threads.setdefault(name, set()).add(thread.num)
+            objects = mt_pages.MTpage_objects()
+            objects.analysis(syms.get_values(tuple_syms))
+            numa.dump_objects(numa.get_objects(objects, min_bytes, root_threads))
+
+
+class MTstacks(MTbase):
+    """Stack usage of each thread
+    Reports for every thread the stack size (region, or RLIMIT_STACK for the
+      main thread), current depth (from sp), high-water mark (lowest non-zero
+      word of the stack, read in large blocks from /proc/$pid/mem), resident
+      bytes and largest frame; threads closest to overflow are listed first.
+      Then the largest frames (sp delta to the caller frame) of all threads.
+    Examples:
+      mt stacks
+    """
+    def __init__(self):
+        gdb.Command.__init__(self, 'mt stacks', gdb.COMMAND_DATA, prefix = False)
+
+    @mt_show_exception
+    def invoke(self, argument, from_tty):
+        inferior = gdb.selected_inferior()
+        stacks = mt_stacks.MTstacks(inferior.pid)
+        stacks.analysis(mt_context.get_maps(), inferior.threads())
+        stacks.dump()
+
+
+class MTtls(MTbase):
+    """Thread local variables of every thread and their heap footprint
+    Thread local variables are found once among global and static symbols;
+      in each thread, the TLS block of every module is located from one of
+      its variables. Heap bytes owned by std containers reachable from them
+      are reported by thread and by variable.
+    Examples:
+      mt tls
+    """
+    def __init__(self):
+        gdb.Command.__init__(self, 'mt tls', gdb.COMMAND_DATA, prefix = False)
+
+    @mt_show_exception
+    def invoke(self, argument, from_tty):
+        tls = mt_tls.MTtls()
+        tls.analysis(mt_context.get_symbols().statics, gdb.selected_inferior().threads())
+        tls.dump()
+
+
+class MTlocks(MTbase):
+    """Mutex owners, waiting threads and deadlocks
+    Finds std::mutex, std::recursive_mutex, timed variants and pthread_mutex_t
+      reachable from symbols (also inside containers) and reports their owner
+      thread. Threads blocked locking a mutex are found from the functions of
+      their newest frames; the mutex is taken from lock function arguments
+      or from the futex syscall argument. Locks are listed most contended
+      first and cycles of the wait-for graph are reported as deadlocks.
+    Without arguments, all variables are used as roots. Otherwise, arguments
+      select root symbols as in 'mt symbols'.
+    Examples:
+      mt locks
+      mt locks ^mt_ loc_static
+    """
+    def __init__(self):
+        gdb.Command.__init__(self, 'mt locks', gdb.COMMAND_DATA, prefix = False)
+
+    @mt_show_exception
+    def invoke(self, argument, from_tty):
+        syms = mt_context.get_symbols()
+        locs, addrs, names, ranges = syms.filter_arguments_from_string(argument or '*')
+        locks = mt_locks.MTlocks()
+        locks.analysis(syms.get_values(syms.filter(locs, addrs, names, ranges)), gdb.selected_inferior().threads())
+        locks.dump()
+
+
+class MTalloc_stats(MTbase):
+    """Allocator statistics time series
+    Takes a sample of allocator statistics calling in the inferior jemalloc
+      mallctl or glibc mallinfo2 / malloc_info (arena, mmap, in use and free
+      bytes, arenas), appends it to a ring buffer file (--file, default
+      /tmp/mt-alloc-stats.$pid) and reports the stored samples with in use
+      rates, trends and fragmentation.
+    Use 'run' <seconds> <samples> to continue the inferior and sample it
+      every <seconds> (it is stopped with SIGINT only while sampling).
+    Use 'report' to print the stored samples without sampling.
+    Examples:
+      mt alloc-stats
+      mt alloc-stats run 10 60
+      mt alloc-stats report --file /tmp/server.stats
+    """
+    def __init__(self):
+        gdb.Command.__init__(self, 'mt alloc-stats', gdb.COMMAND_DATA, prefix = False)
+
+    @mt_show_exception
+    def invoke(self, argument, from_tty):
+        args = argument.split()
+        pid = gdb.selected_inferior().pid
+        path = '/tmp/mt-alloc-stats.%d' % pid
+        if '--file' in args:
+            i = args.index('--file')
+            path = args[i + 1]
+            del args[i:i + 2]
+        sampler = mt_alloc_stats.mt_alloc_sampler
+        ring = mt_alloc_stats.MTring(path, mt_alloc_stats.mt_alloc_format)
+        try:
+            if not args:
+                ring.append(sampler.sample())
+            elif args[0] == 'run':
+                seconds, samples = float(args[1]), int(args[2])
+                ring.append(sampler.sample())
+                for i in range(samples):
+                    timer = threading.Timer(seconds, os.kill, (pid, signal.SIGINT))
+                    timer.start()
+                    try:
+                        gdb.execute('continue')
+                    finally:
+                        timer.cancel()
+                    if not gdb.selected_inferior().pid: break # exited
+                    ring.append(sampler.sample())
+            elif args[0] != 'report':
+                print(c.red + 'error: ' + c.reset + 'unknown argument "' + argument + '"')
+                return
+            mt_alloc_stats.dump(ring.records(), sampler.allocator)
+        finally:
+            ring.close()
+
+
+class MTmemory(MTbase):
+    """Values and links reachable from symbols, by memory region
+    The analysis is kept between stops: next analyses only visit values on
+      pages modified since the previous one. Once 'mt dirty start' was used
+      (soft dirty bits are available), modified pages of writable regions are
+      known by soft dirty bits, in a window of its own that does not reset the
+      'mt dirty' one; other pages are compared by content hashes.
+    Use --reset to drop the previous analysis. Other arguments select root
+      symbols as in 'mt symbols'.
+    Examples:
+      mt memory ^mt_ loc_static
+      mt memory --reset
+    """
+    def __init__(self):
+        gdb.Command.__init__(self, 'mt memory', gdb.COMMAND_DATA, prefix = False)
+
+    @mt_show_exception
+    def invoke(self, argument, from_tty):
+        args = argument.split()
+        if args and args[0] == '--reset':
+            mt_context.memory = None
+            args = args[1:]
+        syms = mt_context.get_symbols()
+        locs, addrs, names, ranges = syms.filter_arguments_from_string(' '.join(args) or '*')
+        memory = mt_context.get_memory()
+        tracker = memory.tracker
+        pid = gdb.selected_inferior().pid
+        dirty = tracked = None
+        if memory.seen and tracker.is_tracking(pid):
+            dirty, tracked = tracker.get_dirty_set(), tracker.get_ranges()
+        memory.analysis(syms, syms.filter(locs, addrs, names, ranges), dirty, tracked)
+        if mt_dirty.mt_dirty_tracker.is_tracking(pid):
+            tracker.start(pid, mt_context.get_maps().get_writable()) # next window, current regions
+        memory.dump()
+
+
+class MTcontainers(MTbase):
+    """Health report of std containers reachable from symbols
+    Reports load factor and bucket chain lengths of unordered containers,
+      capacity / size ratio of vectors, deque fragmentation, map / set tree
+      depth and list node address locality.
+    Containers are ranked by wasted bytes; use --cost to rank by expected
+      lookup cost.
+    Without arguments, all variables are used as roots. Otherwise, arguments
+      select root symbols as in 'mt symbols'.
+    Examples:
+      mt containers
+      mt containers --cost ^mt_
+    """
+    def __init__(self):
+        gdb.Command.__init__(self, 'mt containers', gdb.COMMAND_DATA, prefix = False)
+
+    @mt_show_exception
+    def invoke(self, argument, from_tty):
+        args = argument.split()
+        by_cost = '--cost' in args
+        argument = ' '.join(arg for arg in args if arg != '--cost')
+        syms = mt_context.get_symbols()
+        locs, addrs, names, ranges = syms.filter_arguments_from_string(argument or '*')
+        health = mt_health.MThealth()
+        health.analysis(syms.get_values(syms.filter(locs, addrs, names, ranges)))
+        health.dump(by_cost)
+
+
+class MTnumpy(MTbase):
+    """Save an array, std::vector or std::deque as a numpy .npy file
+    Elements must be scalars or plain structs; the dtype is derived from the
+      type layout and memory is read in bulk.
+    Last argument is the file name; the others select the symbol as in
+      'mt value'.
+    Examples:
+      mt numpy ^mt_gvi$ /tmp/mt_gvi.npy
+    """
+    def __init__(self):
+        gdb.Command.__init__(self, 'mt numpy', gdb.COMMAND_DATA, prefix = False)
+
+    @mt_show_exception
+    def invoke(self, argument, from_tty):
+        args = argument.split()
+        if len(args) < 2:
+            print(c.red + 'error: ' + c.reset + 'symbol and file name required')
+            return
+        syms = mt_context.get_symbols()
+        locs, addrs, names, ranges = syms.filter_arguments_from_string(' '.join(args[:-1]))
+        values = syms.get_values(syms.filter(locs, addrs, names, ranges))
+        if not values:
+            print(c.red + 'error: ' + c.reset + 'no matching symbol')
+            return
+        array = mt_numpy.to_numpy(values[0][1])
+        mt_numpy.np.save(args[-1], array)
+        print(c.cyan + values[0][0] + c.reset + ' shape ' + str(array.shape) + ' dtype ' + str(array.dtype) +
+              ' saved to ' + c.green + args[-1] + c.reset)
+
+
+class MTexport(MTbase):
+    """Stream symbol values to a JSON or NDJSON file
+    First argument is the file name; the others select root symbols as in
+      'mt symbols' (all variables if none).
+    Values are written while visited, so memory does not grow with the size
+      of the exported values. Values seen before are written as {"$ref": id}
+      pointing to the object with the same "$id".
+    Use --ndjson to write one line per root and one more per structure
+      reached through a pointer.
+    Examples:
+      mt export /tmp/values.json ^mt_
+      mt export --ndjson /tmp/values.ndjson loc_static
+    """
+    def __init__(self):
+        gdb.Command.__init__(self, 'mt export', gdb.COMMAND_DATA, prefix = False)
+
+    @mt_show_exception
+    def invoke(self, argument, from_tty):
+        args = argument.split()
+        ndjson = '--ndjson' in args
+        args = [arg for arg in args if arg != '--ndjson']
+        if not args:
+            print(c.red + 'error: ' + c.reset + 'file name required')
+            return
+        syms = mt_context.get_symbols()
+        locs, addrs, names, ranges = syms.filter_arguments_from_string(' '.join(args[1:]) or '*')
+        values = syms.get_values(syms.filter(locs, addrs, names, ranges))
+        with open(args[0], 'w') as f:
+            export = mt_export.MTexport(f, ndjson)
+            export.begin()
+            for name, value in values:
+                export.export(name, value)
+            export.end()
+        print(c.cyan + str(len(values)) + c.reset + ' values exported to ' + c.green + args[0] + c.reset)
+
+
+class MTcache(MTbase):
+    """Inferior memory page cache used by memory-tools readers
+    Without arguments, dump cache statistics.
+    Use 'clear' to drop all cached lines.
+    Use 'line' <bytes> (4096 to 65536, power of 2) and 'lines' <number> to
+      configure line size and number of lines.
+    Use 'gdb on' to enable gdb own data cache (used by gdb values) on all
+      mapped regions, 'gdb off' to restore target memory regions (mem auto).
+    Use 'all' to dump statistics of every context cache (maps, symbols,
+      types and memory).
+    The cache is dropped each time the inferior runs, memory or registers are
+      written.
+    Examples:
+      mt cache
+      mt cache line 65536
+      mt cache gdb on
+      mt cache all
+    """
+    def __init__(self):
+        gdb.Command.__init__(self, 'mt cache', gdb.COMMAND_DATA, prefix = False)
+
+    @mt_show_exception
+    def invoke(self, argument, from_tty):
+        cache = mt_cache.mt_page_cache
+        args = argument.split()
+        if not args:
+            print(c.white + 'page cache' + c.reset)
+            for k, v in cache.stats():
+                print((c.green + '  %-15s ' + c.reset + '%s') % (k + ':', v))
+        elif args == ['clear']:
+            cache.clear()
+        elif args == ['all']:
+            for name, stats in mt_context.stats():
+                print(c.white + name + c.reset)
+                for k, v in stats:
+                    print((c.green + '  %-15s ' + c.reset + '%s') % (k + ':', v))
+        elif len(args) == 2 and args[0] == 'line':
+            cache.configure(int(args[1], 0), cache.max_lines)
+        elif len(args) == 2 and args[0] == 'lines':
+            cache.configure(cache.line_size, int(args[1], 0))
+        elif args == ['gdb', 'on']:
+            gdb.execute('set mem inaccessible-by-default off', to_string = True)
+            gdb.execute('set dcache line-size %d' % cache.line_size, to_string = True)
+            for region in mt_context.get_maps().regions:
+                gdb.execute('mem 0x%x 0x%x cache' % (region.low, region.high), to_string = True)
+        elif args == ['gdb', 'off']:
+            gdb.execute('mem auto', to_string = True)
+        else:
+            print(c.red + 'error: ' + c.reset + 'unknown argument "' + argument + '"')
+
+
 class MTcolors(MTbase):
     """De/activate and configure usage of console colors (escape sequences)
     Without arguments, it switches colors on and off.
@@ -264,23 +995,56 @@ class MTtest(MTbase):
         pass
 
 
-# register event handler to invalidate context
-# every time inferior runs, context gets invalidated
-# so that symbols, maps, etc, are recomputed on demand
-# otherwise, multiple commands benefit from cached results
-def mt_invalidation_handler(event): mt_context.invalidate()
-gdb.events.cont.connect(mt_invalidation_handler)
+# register event handlers to invalidate context
+# each cache is invalidated only by the events changing it, so that symbols,
+# maps, etc, are recomputed on demand and multiple commands at the same stop
+# benefit from cached results
+def mt_resume_handler(event): mt_context.on_resume()
+gdb.events.cont.connect(mt_resume_handler)
+gdb.events.stop.connect(mt_resume_handler)
+def mt_objfiles_handler(event):
+    mt_context.invalidate_symbols()
+    mt_context.invalidate_types()
+gdb.events.new_objfile.connect(mt_objfiles_handler)
+gdb.events.clear_objfiles.connect(mt_objfiles_handler)
+def mt_thread_exited_handler(event): mt_context.invalidate_symbols()
+if hasattr(gdb.events, 'thread_exited'):
+    gdb.events.thread_exited.connect(mt_thread_exited_handler)
+def mt_exited_handler(event): mt_context.invalidate()
+gdb.events.exited.connect(mt_exited_handler)
+def mt_memory_changed_handler(event): mt_context.invalidate_memory()
+gdb.events.memory_changed.connect(mt_memory_changed_handler)
+gdb.events.register_changed.connect(mt_memory_changed_handler)
 
 
 # register commands
 mt_commands = {
-    'mt':          MT(),
-    'mt symbols':  MTsymbols(),
-    'mt value':    MTvalue(),
-    'mt switch':   MTswitch(),
-    'mt maps':     MTmaps(),
-    'mt objects':  MTobjects(),
-    'mt colors':   MTcolors(),
-    'mt debug':    MTdebug(),
-    #'mt test':     MTtest(),
+    'mt':            MT(),
+    'mt symbols':    MTsymbols(),
+    'mt value':      MTvalue(),
+    'mt switch':     MTswitch(),
+    'mt maps':       MTmaps(),
+    'mt objects':    MTobjects(),
+    'mt footprint':  MTfootprint(),
+    'mt layout':     MTlayout(),
+    'mt sharing':    MTsharing(),
+    'mt locality':   MTlocality(),
+    'mt strings':    MTstrings(),
+    'mt shared':     MTshared(),
+    'mt pages':      MTpages(),
+    'mt dirty':      MTdirty(),
+    'mt cold':       MTcold(),
+    'mt numa':       MTnuma(),
+    'mt stacks':     MTstacks(),
+    'mt tls':        MTtls(),
+    'mt locks':      MTlocks(),
+    'mt alloc-stats': MTalloc_stats(),
+    'mt memory':     MTmemory(),
+    'mt containers': MTcontainers(),
+    'mt numpy':      MTnumpy(),
+    'mt cache':      MTcache(),
+    'mt export':     MTexport(),
+    'mt colors':     MTcolors(),
+    'mt debug':      MTdebug(),
+    #'mt test':       MTtest(),
 }
@@ -0,0 +1,155 @@
+#   -*- mode: python; coding: utf-8; -*-
+#
+#   Copyright 2018 Asier Aguirre <asier.aguirre@gmail.com>
+#   This file is part of memory-tools.
+#
+#   memory-tools is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   memory-tools is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with memory-tools. If not, see <http://www.gnu.org/licenses/>.
+
+import gdb, mt_heap, mt_visitor
+from mt_type_cleaning import type_id, clean_type
+from mt_colors import mt_colors as c
+
+def alignof(type):
+    try:
+        return type.alignof # gdb >= 8.2
+    except AttributeError:
+        type = type.strip_typedefs()
+        if type.code == gdb.TYPE_CODE_ARRAY: return alignof(type.target())
+        if type.code in { gdb.TYPE_CODE_STRUCT, gdb.TYPE_CODE_UNION }:
+            return max([1] + [ alignof(f.type) for f in type.fields() if hasattr(f, 'bitpos') ])
+        align = 1
+        while align < type.sizeof and align < 16: align <<= 1
+        return align
+
+
+class MTlayout:
+    """ padding of a struct type (as pahole): holes between fields, tail
+        padding and size if fields were sorted by alignment """
+    def __init__(self, type):
+        self.size = type.sizeof
+        self.holes = [ ]    # [ (offset, bytes, previous field name) ]
+        self.nested = [ ]   # [ (struct type, instances) ] of fields
+        self.packed = None  # size reordering fields, None if it cannot be estimated
+        end = 0             # bits
+        previous = ''
+        reorder = True
+        fields = [ f for f in type.fields() if hasattr(f, 'bitpos') ] # no static members
+        for field in sorted(fields, key = lambda f: f.bitpos):
+            field_type = field.type.strip_typedefs()
+            bits = field.bitsize or field_type.sizeof * 8
+            if field.is_base_class:
+                reorder = False
+                if not [ f for f in field_type.fields() if hasattr(f, 'bitpos') ]: bits = 0 # empty base
+            if field.bitsize or field.artificial: reorder = False
+            if field.bitpos >= end + 8:
+                self.holes.append((end // 8, (field.bitpos - end) // 8, previous))
+            end = max(end, field.bitpos + bits)
+            previous = field.name or ''
+            self._nested(field_type)
+        self.tail = max(0, self.size - (end + 7) // 8)
+        self.padding = sum(h[1] for h in self.holes) + self.tail
+        if reorder and fields: self.packed = self._packed(fields, type)
+
+    def _nested(self, type):
+        instances = 1
+        while type.code == gdb.TYPE_CODE_ARRAY and type.target().sizeof:
+            instances *= type.sizeof // type.target().sizeof
+            type = type.target().strip_typedefs()
+        if type.code == gdb.TYPE_CODE_STRUCT and instances:
+            self.nested.append((type.unqualified(), instances))
+
+    def _packed(self, fields, type):
+        offset = 0
+        for align, size in sorted(((alignof(f.type), f.type.sizeof) for f in fields), reverse = True):
+            offset = (offset + align - 1) // align * align + size
+        align = alignof(type)
+        return max(1, (offset + align - 1) // align * align)
+
+mt_layouts = { } # { type id: MTlayout }
+
+def get_layout(type):
+    """ layout of struct type, computed once per type """
+    key = type_id(type)
+    if key not in mt_layouts:
+        mt_layouts[key] = MTlayout(type)
+    return mt_layouts[key]
+
+
+class MTpadding(mt_visitor.MTwalker):
+    """ bytes lost to struct padding in live instances reachable from roots """
+    def __init__(self):
+        super().__init__()
+        self.instances = { } # { type id: [type, count] }
+
+    def analysis(self, name_values):
+        """ name_values as returned by MTsymbols.get_values """
+        for name, value in name_values:
+            self.walk(value, name)
+
+    def add_instances(self, type, count):
+        key = type_id(type)
+        if key not in self.instances: self.instances[key] = [type, 0]
+        self.instances[key][1] += count
+        for nested, instances in get_layout(type).nested:
+            self.add_instances(nested, count * instances)
+
+    def on_struct(self, value, name):
+        type = value.type.strip_typedefs().unqualified()
+        if type.code == gdb.TYPE_CODE_STRUCT:
+            # fields are visited by the walker (nested structs not added here)
+            key = type_id(type)
+            if key not in self.instances: self.instances[key] = [type, 0]
+            self.instances[key][1] += 1
+
+    def on_wrap(self, wrap, value, name):
+        # elements not owning heap are not visited: count them from the container
+        type_elem = getattr(wrap, 'type_elem', None)
+        if type_elem is None or mt_heap.type_owns_heap(type_elem): return True
+        type_elem = type_elem.strip_typedefs().unqualified()
+        if type_elem.code != gdb.TYPE_CODE_STRUCT: return True
+        buffers = hasattr(wrap, 'get_buffers') and wrap.get_buffers()
+        if buffers:
+            count = sum(n for addr, n in buffers)
+        else:
+            count = int(getattr(wrap, 'prop_size', 0))
+        if count: self.add_instances(type_elem, count)
+        return True
+
+    def get_report(self):
+        """ [ (lost bytes, saving bytes, count, layout, type) ] sorted by lost bytes """
+        report = [ ]
+        for type, count in self.instances.values():
+            layout = get_layout(type)
+            if not layout.padding: continue
+            saving = layout.packed is not None and (layout.size - layout.packed) * count or 0
+            report.append((layout.padding * count, max(0, saving), count, layout, type))
+        return sorted(report, key = lambda x: -x[0])
+
+    def dump(self, max_types = 20, max_holes = 8):
+        report = self.get_report()
+        print(c.white + 'struct padding weighted by live instances' + c.reset)
+        if not report:
+            print(c.red + '<empty>' + c.reset)
+            return
+        print((c.cyan + '%10s %8s %8s %8s %12s %12s %s' + c.reset) %
+              ('Count', 'Size', 'Padding', 'Tail', 'Lost bytes', 'Reordering', 'Type'))
+        for lost, saving, count, layout, type in report[:max_types]:
+            print((c.yellow + '%10d %8d %8d %8d %12d %12s ' + c.reset + '%s') %
+                  (count, layout.size, layout.padding, layout.tail, lost,
+                   layout.packed is None and '?' or saving, clean_type(type)))
+            for offset, size, previous in layout.holes[:max_holes]:
+                print((c.blue + '%10s hole of %d bytes at offset %d after %s' + c.reset) %
+                      ('', size, offset, previous or '<start>'))
+        print(c.white + 'total: ' + c.reset + str(sum(x[0] for x in report)) + ' bytes lost, ' +
+              str(sum(x[1] for x in report)) + ' bytes saved reordering fields')
@@ -0,0 +1,136 @@
+#   -*- mode: python; coding: utf-8; -*-
+#
+#   Copyright 2018 Asier Aguirre <asier.aguirre@gmail.com>
+#   This file is part of memory-tools.
+#
+#   memory-tools is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   memory-tools is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with memory-tools. If not, see <http://www.gnu.org/licenses/>.
+
+import gdb, mt_visitor
+from mt_containers import MTnodes
+from mt_numpy import np
+from mt_type_cleaning import type_id, clean_type
+from mt_colors import mt_colors as c
+
+mt_page = 4096
+mt_percentiles = (50, 90, 99)
+
+class MTlocality_stats:
+    """ locality of node addresses in iteration order (pointer chasing) """
+    def __init__(self, addrs, page = mt_page):
+        addrs = list(addrs)
+        self.nodes = len(addrs)
+        if np is not None:
+            self._numpy(addrs, page)
+        else:
+            self._python(addrs, page)
+
+    def _numpy(self, addrs, page):
+        a = np.array(addrs, dtype = np.int64)
+        strides = np.sort(np.abs(np.diff(a)))
+        pages = a // page
+        self.mean = strides.size and float(strides.mean()) or 0.0
+        self.percentiles = [ strides.size and int(strides[(strides.size - 1) * p // 100]) or 0 for p in mt_percentiles ]
+        self.same_page = float(np.count_nonzero(pages[1:] == pages[:-1])) / strides.size if strides.size else 1.0
+        self.pages = int(np.unique(pages).size)
+
+    def _python(self, addrs, page):
+        strides = sorted(abs(b - a) for a, b in zip(addrs, addrs[1:]))
+        pages = [ a // page for a in addrs ]
+        self.mean = strides and sum(strides) / len(strides) or 0.0
+        self.percentiles = [ strides and strides[(len(strides) - 1) * p // 100] or 0 for p in mt_percentiles ]
+        self.same_page = sum(1 for a, b in zip(pages, pages[1:]) if a == b) / len(strides) if strides else 1.0
+        self.pages = len(set(pages))
+
+    @property
+    def pages_per_1000(self):
+        return self.nodes and 1000.0 * self.pages / self.nodes or 0.0
+
+    def __str__(self):
+        return 'size %d same page %.2f mean stride %d p%s %s pages/1000 %.0f' % (
+            self.nodes, self.same_page, self.mean, '/p'.join(str(p) for p in mt_percentiles),
+            '/'.join(str(p) for p in self.percentiles), self.pages_per_1000)
+
+
+mt_link_fields = { } # { type id: field name or None }
+
+def link_field(type):
+    """ member of struct type linking to another node of the same type (pointer,
+        unique_ptr or shared_ptr), computed once per type """
+    key = type_id(type)
+    if key not in mt_link_fields:
+        mt_link_fields[key] = _link_field(type)
+    return mt_link_fields[key]
+
+def _link_field(type):
+    name = type.name
+    if not name or name.startswith('std::'): return None
+    smart = ('std::unique_ptr<%s' % name, 'std::shared_ptr<%s' % name)
+    for field in type.fields():
+        if not hasattr(field, 'bitpos') or field.bitsize: continue
+        field_type = field.type.strip_typedefs()
+        if field_type.code == gdb.TYPE_CODE_PTR:
+            if field_type.target().strip_typedefs().unqualified().name == name: return field.name
+        elif (field_type.name or '').startswith(smart):
+            return field.name
+    return None
+
+
+class MTlocality(mt_visitor.MTwalker):
+    """ pointer chasing locality of node based containers and user linked
+        structures reachable from roots """
+    min_nodes = 2
+
+    def __init__(self):
+        super().__init__()
+        self.report = [ ]       # [ (stats, addr, name, typename) ]
+        self.linked = set()     # { node addr } user nodes already measured in a chain
+        self.nodes = MTnodes()
+
+    def analysis(self, name_values):
+        """ name_values as returned by MTsymbols.get_values """
+        for name, value in name_values:
+            self.walk(value, name)
+
+    def add(self, addrs, value, name):
+        stats = MTlocality_stats(addrs)
+        if stats.nodes >= self.min_nodes:
+            self.report.append((stats, int(value.address or 0), name, clean_type(value.type)))
+        return stats
+
+    def on_wrap(self, wrap, value, name):
+        if hasattr(wrap, 'get_node_addresses'):
+            self.add(wrap.get_node_addresses(), value, name)
+        return True
+
+    def on_struct(self, value, name):
+        type = value.type.strip_typedefs().unqualified()
+        if type.code != gdb.TYPE_CODE_STRUCT or value.address is None: return
+        field = link_field(type)
+        if not field or int(value.address) in self.linked: return
+        addrs = list(self.nodes.pointer_chain(value.cast(type), field))
+        self.linked.update(addrs)
+        self.add(addrs, value, name)
+
+    def dump(self, max_containers = 40):
+        print(c.white + 'pointer chasing locality (worst first)' + c.reset)
+        if not self.report:
+            print(c.red + '<empty>' + c.reset)
+            return
+        print((c.cyan + '%16s %10s %10s %12s %s' + c.reset) %
+              ('Address', 'Nodes', 'Same page', 'Pages/1000', 'Name + Type + Strides'))
+        for stats, addr, name, typename in sorted(self.report, key = lambda x: (x[0].same_page, -x[0].nodes))[:max_containers]:
+            print((c.green + '%16x ' + c.yellow + '%10d %10.2f %12.0f ' + c.reset + '%s ' + c.blue + '%s ' + c.reset +
+                   'mean %d p%s %s') %
+                  (addr, stats.nodes, stats.same_page, stats.pages_per_1000, name, typename, stats.mean,
+                   '/p'.join(str(p) for p in mt_percentiles), '/'.join(str(p) for p in stats.percentiles)))
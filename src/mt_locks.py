@@ -0,0 +1,245 @@
+#   -*- mode: python; coding: utf-8; -*-
+#
+#   Copyright 2018 Asier Aguirre <asier.aguirre@gmail.com>
+#   This file is part of memory-tools.
+#
+#   memory-tools is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   memory-tools is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with memory-tools. If not, see <http://www.gnu.org/licenses/>.
+
+
+import gdb, platform, mt_heap, mt_util, mt_visitor
+from mt_containers import MTstd_mutex
+from mt_sharing import member_fields
+from mt_shared import strongly_connected
+from mt_types import mt_type_registry
+from mt_type_cleaning import type_id
+from mt_colors import mt_colors as c
+
+mt_mutex_typedefs = { 'pthread_mutex_t': 'pthread', '__gthread_mutex_t': 'pthread',
+                      '__gthread_recursive_mutex_t': 'pthread' }
+mt_mutex_prefixes = ( ('std::recursive_timed_mutex', 'recursive'), ('std::recursive_mutex', 'recursive'),
+                      ('std::timed_mutex', 'mutex'), ('std::mutex', 'mutex') )
+# functions of threads blocked in a mutex lock
+mt_lock_waits = ( 'lll_lock_wait', 'mutex_lock', 'mutex_timedlock', 'mutex_clocklock' )
+# arguments with the mutex (or its futex) address in lock functions and inlined callers
+mt_lock_arguments = ( 'mutex', '__mutex', 'futex', 'this' )
+# register with the first syscall argument (futex address) while blocked in the kernel
+mt_syscall_argument = { 'x86_64': 'rdi', 'aarch64': 'x0', 'i686': 'ebx' }
+
+mt_mutex_kinds = { } # { type id: kind or None }
+
+def mutex_kind(type):
+    """ 'mutex', 'recursive' (std types) or 'pthread' for mutex types, else None """
+    key = type_id(type)
+    if key not in mt_mutex_kinds:
+        mt_mutex_kinds[key] = _mutex_kind(type)
+    return mt_mutex_kinds[key]
+
+def _mutex_kind(type):
+    while True:
+        if type.name in mt_mutex_typedefs: return mt_mutex_typedefs[type.name]
+        if type.code != gdb.TYPE_CODE_TYPEDEF: break
+        type = type.target()
+    name = type.unqualified().name or ''
+    if name in mt_mutex_typedefs: return mt_mutex_typedefs[name] # union named by its typedef
+    for prefix, kind in mt_mutex_prefixes:
+        if name == prefix: return kind
+    return None
+
+mt_mutex_fields = { } # { type id: [ (offset, size, field name, kind) ] }
+
+def mutex_fields(type):
+    """ mutex members of type (recursively), computed once per type """
+    key = type_id(type)
+    if key not in mt_mutex_fields:
+        mt_mutex_fields[key] = [ ] # recursive types
+        mt_mutex_fields[key] = member_fields(type, mutex_kind, mutex_fields)
+    return mt_mutex_fields[key]
+
+
+class MTlocks(mt_visitor.MTwalker):
+    """ mutexes reachable from roots with their owner thread, threads blocked
+        locking them (from the functions of their newest frames) and cycles
+        of the wait-for graph (deadlocks). All the std mutexes are pthread
+        mutexes (at offset 0), so the state is read from pthread_mutex_t """
+    def __init__(self, max_frames = 12):
+        super().__init__()
+        self.max_frames = max_frames
+        self.locks = { }    # { addr: (name, kind) }
+        self.owners = { }   # { addr: owner thread num (-lwp if unknown thread) }
+        self.waiters = { }  # { thread num: (lock addr, function) }
+        self.threads = { }  # { lwp: thread num }
+
+    def analysis(self, name_values, threads):
+        """ name_values as returned by MTsymbols.get_values """
+        for name, value in name_values:
+            self.walk(value, name)
+        self.threads = dict((thread.ptid[1] or thread.ptid[0], thread.num) for thread in threads)
+        self.read_owners()
+        self.find_waiters(threads)
+
+    def add_lock(self, addr, name, kind):
+        if addr and addr not in self.locks:
+            self.locks[addr] = (name, kind)
+
+    def _mutex(self, value, name):
+        kind = mutex_kind(value.type)
+        if kind and value.address is not None:
+            self.add_lock(int(value.address), name, kind)
+        return kind
+
+    def on_struct(self, value, name):
+        self._mutex(value, name)
+
+    def on_typedef(self, value, name):
+        return not self._mutex(value, name) # pthread_mutex_t
+
+    def visit_union(self, value, name):
+        self._mutex(value, name)
+
+    def on_wrap(self, wrap, value, name):
+        if isinstance(wrap, MTstd_mutex) or self._mutex(value, name): return False
+        type_elem = getattr(wrap, 'type_elem', None)
+        if type_elem is None or mt_heap.type_owns_heap(type_elem): return True # elements are walked
+        fields = mutex_fields(type_elem)
+        if not fields: return True
+        elems = [ ] # element addresses in buffers and nodes
+        for addr, count in wrap.get_buffers() if hasattr(wrap, 'get_buffers') else ():
+            elems.extend(addr + i * type_elem.sizeof for i in range(count))
+        if hasattr(wrap, 'get_node_addresses'):
+            payload = getattr(wrap, 'payload', 0)
+            elems.extend(node + payload for node in wrap.get_node_addresses())
+        for i, addr in enumerate(elems):
+            for offset, size, field, kind in fields:
+                self.add_lock(addr + offset, ('[%d]' % i) + name + field, kind)
+        return True
+
+    def read_owners(self):
+        mutex = mt_type_registry.lookup('pthread_mutex_t').pointer()
+        for addr in self.locks:
+            try:
+                data = gdb.Value(addr).cast(mutex).dereference()['__data']
+                if not int(data['__lock']): continue
+                lwp = int(data['__owner'])
+            except gdb.error:
+                continue
+            self.owners[addr] = self.threads.get(lwp, -lwp)
+
+    @mt_util.maintain_thread_frame
+    def find_waiters(self, threads):
+        register = mt_syscall_argument.get(platform.machine())
+        for thread in threads:
+            thread.switch()
+            frame = gdb.newest_frame()
+            candidates = [ ]
+            function = None
+            level = 0
+            if register:
+                try:
+                    candidates.append(int(frame.read_register(register)))
+                except (gdb.error, ValueError):
+                    pass
+            while frame and level < self.max_frames:
+                name = frame.name() or ''
+                if any(wait in name for wait in mt_lock_waits):
+                    function = function or name
+                if function:
+                    for argument in mt_lock_arguments:
+                        try:
+                            candidates.append(int(frame.read_var(argument)))
+                        except (gdb.error, ValueError, TypeError):
+                            pass
+                try:
+                    frame = frame.older()
+                except gdb.error:
+                    break
+                level += 1
+            if not function: continue
+            known = [ addr for addr in candidates if addr in self.locks ]
+            self.waiters[thread.num] = (known and known[0] or 0, function)
+
+    def get_contention(self):
+        """ [ (addr, owner, [ waiter thread num ]) ] of held or waited locks, most waited first """
+        waiting = { }
+        for num, (addr, function) in self.waiters.items():
+            waiting.setdefault(addr, [ ]).append(num)
+        addrs = set(self.owners) | set(addr for addr in waiting if addr)
+        report = [ (addr, self.owners.get(addr), sorted(waiting.get(addr, [ ]))) for addr in addrs ]
+        report.sort(key = lambda x: (-len(x[2]), x[0]))
+        return report
+
+    def get_cycles(self):
+        """ [ [ (thread num, lock addr) ] ] cycles of the wait-for graph: each
+            thread waits for the lock owned by the next one """
+        nums = sorted(set(self.threads.values()) | set(self.waiters))
+        index = dict((num, i) for i, num in enumerate(nums))
+        edges = [ ]
+        waits = { } # { thread num: (lock, owner) }
+        for num, (addr, function) in self.waiters.items():
+            owner = self.owners.get(addr)
+            if owner in index:
+                edges.append((index[num], index[owner]))
+                waits[num] = (addr, owner)
+        loops = set(a for a, b in edges if a == b)
+        cycles = [ ]
+        for component in strongly_connected(len(nums), edges):
+            if len(component) == 1 and component[0] not in loops: continue
+            # follow the wait-for edges from the lowest thread
+            members = set(nums[i] for i in component)
+            num = min(members)
+            cycle = [ ]
+            while num in members and all(num != n for n, a in cycle):
+                addr, owner = waits[num]
+                cycle.append((num, addr))
+                num = owner
+            cycles.append(cycle)
+        return cycles
+
+    def _lock_name(self, addr):
+        if not addr: return c.red + 'unknown' + c.reset
+        return '0x%x %s' % (addr, self.locks.get(addr, ('', ''))[0])
+
+    def _thread(self, num):
+        if num is None: return '-'
+        return num < 0 and 'lwp %d' % -num or str(num)
+
+    def dump(self, max_locks = 30):
+        print(c.white + 'locks held or waited (most contended first)' + c.reset)
+        report = self.get_contention()
+        if not report:
+            print(c.red + '<empty>' + c.reset)
+        else:
+            print((c.cyan + '%16s %-9s %8s %8s %s' + c.reset) % ('Address', 'Kind', 'Owner', 'Waiters', 'Name'))
+            for addr, owner, waiters in report[:max_locks]:
+                name, kind = self.locks.get(addr, ('', ''))
+                print((c.green + '%16x ' + c.magenta + '%-9s ' + c.yellow + '%8s %8d ' + c.reset + '%s') %
+                      (addr, kind, self._thread(owner), len(waiters), name or c.red + 'unknown' + c.reset))
+        print(c.white + 'total: ' + c.reset + '%d mutexes, %d held, %d waiting threads' %
+              (len(self.locks), len(self.owners), len(self.waiters)))
+
+        print(c.white + 'waiting threads' + c.reset)
+        if not self.waiters:
+            print(c.red + '<empty>' + c.reset)
+        else:
+            print((c.cyan + '%6s %8s %-32s %s' + c.reset) % ('Thread', 'Owner', 'Function', 'Lock'))
+            for num, (addr, function) in sorted(self.waiters.items()):
+                print((c.green + '%6d ' + c.yellow + '%8s ' + c.reset + '%-32s %s') %
+                      (num, self._thread(self.owners.get(addr)), function, self._lock_name(addr)))
+
+        print(c.white + 'wait-for cycles (deadlocks)' + c.reset)
+        cycles = self.get_cycles()
+        if not cycles:
+            print(c.red + '<empty>' + c.reset)
+        for cycle in cycles:
+            print(c.red + 'cycle: ' + c.reset + ' -> '.join('thread %d waits %s' % (num, self._lock_name(addr))
+                                                          for num, addr in cycle) + ' -> thread %d' % cycle[0][0])
@@ -109,13 +109,17 @@ mt_elf_sections = {
 class MTmaps:
     """ reads and parses /proc/$pid/maps file """
     class Region:
-        def __init__(self, low, high, map_type, file_mmap, permission, extra):
+        def __init__(self, low, high, map_type, file_mmap, permission, extra, anonymous = False):
             self.low = low
             self.high = high
             self.map_type = map_type
             self.file_mmap = file_mmap
             self.permission = permission
             self.extra = extra
+            self.anonymous = anonymous # not backed by a file (inode 0)
+            self.numa_policy = ''      # from /proc/$pid/numa_maps (load_numa)
+            self.numa_nodes = { }      # { node: pages }
+            self.numa_page = 4096      # kernel page size of the mapping
 
         def __lt__(self, region):
             return self.low < region.low
@@ -156,7 +160,7 @@ class MTmaps:
                     assert line[5].endswith(']'), 'parsing'
                     if line[5] in mt_map_codenames.keys():
                         map_type |= mt_map_codenames[line[5]]
-                self.regions.append(MTmaps.Region(low, high, map_type, file_mmap, permission, ''))
+                self.regions.append(MTmaps.Region(low, high, map_type, file_mmap, permission, '', not int(line[4])))
         self.regions.sort()
 
         # find all stacks
@@ -186,6 +190,34 @@ class MTmaps:
                         print(c.red + 'unknown elf section type: ' + c.reset + parts[4] + ' ' + c.blue + os.path.basename(parts[6]) + c.reset)
                     region.map_type |= mt_elf_sections['<unknown>']
 
+    def load_numa(self, pid):
+        """ memory policy and pages per NUMA node of regions from /proc/$pid/numa_maps;
+            lines and regions are both sorted by address and merged in a single pass.
+            Returns False when the file is not available (kernel without NUMA) """
+        try:
+            f = open('/proc/%d/numa_maps' % pid)
+        except IOError:
+            return False
+        with f:
+            i = 0
+            for line in f:
+                parts = line.split()
+                if len(parts) < 2: continue
+                low = int(parts[0], 16)
+                while i < len(self.regions) and self.regions[i].low < low: i += 1
+                if i == len(self.regions): break
+                region = self.regions[i]
+                if region.low != low: continue # region created after reading maps
+                region.numa_policy = parts[1]
+                region.numa_nodes = { }
+                for part in parts[2:]:
+                    key, sep, count = part.partition('=')
+                    if key[:1] == 'N' and key[1:].isdigit():
+                        region.numa_nodes[int(key[1:])] = int(count)
+                    elif key == 'kernelpagesize_kB':
+                        region.numa_page = int(count) * 1024
+        return True
+
     def dump(self, regions = None):
         print(c.white + 'regions' + c.reset)
         regions = regions == None and self.regions or regions
@@ -203,6 +235,14 @@ class MTmaps:
                 return region
         return None
 
+    def get_anonymous_writable(self):
+        """ writable regions not backed by files: heap, stacks, anonymous mmaps, bss... """
+        return [ region for region in self.regions if region.anonymous and 'w' in region.permission ]
+
+    def get_writable(self):
+        """ writable regions (anonymous and private file data) """
+        return [ region for region in self.regions if 'w' in region.permission ]
+
     def get_regions(self, names):
         # convert [] names into map_type
         map_type = 0
@@ -16,40 +16,185 @@
 #   You should have received a copy of the GNU General Public License
 #   along with memory-tools. If not, see <http://www.gnu.org/licenses/>.
 
-import mt_visitor, mt_colors as c, mt_maps
+import gdb, bisect, mt_visitor, mt_maps, mt_pages, mt_dirty
+from mt_type_cleaning import type_id, mt_type_names
+from mt_colors import mt_colors as c
 
 class MTmemory(mt_visitor.MTvisitor):
-    def __init__(self):
+    """ values and links reachable from symbols; the graph is kept between
+        analyses: on the next one, only values on pages modified since the
+        previous one (by content hashes or soft dirty bits) are visited again """
+    def __init__(self, page = mt_pages.mt_page):
         super().__init__()
-        self.seen = { }   # { (addr, typename): (name, size) }
+        self.seen = { }   # { (addr, type id): (name, size) }
         self.graph = { }  # { (addr_from, addr_to): name }
+        self.types = { }  # { type id: gdb.Type } of seen values
+        self.page = page
+        self.page_hashes = { } # { page number: hash } of pages holding seen values
+        self.pages = set()     # { page number } holding seen values (hashed or not)
+        self.tracker = mt_dirty.MTdirty(page) # own soft dirty window, between analyses
+        self.decoded = 0  # values visited by last analysis
+        self.reused = 0   # values kept from previous analysis
 
-    def analysis(self, symbols):
-        """ memory analysis; symbols is a MTsymbols object """
-        for addr, (symbol, value) in symbols.symbols.items():
+    def analysis(self, symbols, tuples = None, dirty = None, tracked = None):
+        """ memory analysis; symbols is a MTsymbols object and tuples the
+            selected symbols (all by default); dirty is the set of written page
+            numbers since previous analysis within tracked address ranges
+            [ (low, high) ] (everywhere when None); page content hashes are
+            compared out of them, or everywhere when dirty is None. If it
+            fails, the kept graph is dropped and next analysis starts over """
+        if tuples is None: tuples = symbols.filter()
+        name_values = symbols.get_values(tuples)
+        self.decoded = 0
+        try:
+            self._analysis(name_values, dirty, tracked)
+        except:
+            self._reset()
+            raise
+
+    def _reset(self):
+        self.seen, self.graph, self.types = { }, { }, { }
+        self.page_hashes, self.pages = { }, set()
+
+    def _analysis(self, name_values, dirty, tracked):
+        changed = [ ]
+        changed_pages = set()
+        if self.seen:
+            changed_pages = self._changed_pages(dirty, tracked)
+            changed = self._invalidate(changed_pages)
+        self.reused = len(self.seen)
+        roots = [ ]
+        for name, value in name_values:
             # start recursion for this value
             self.stack = [] # [ (name, address) ]
-            self.visit(value, symbol.name)
-            assert len(self.stack) == 1, 'memory analysis value'
+            self.visit(value, name)
+            if value.address is not None: roots.append(int(value.address))
+        # visit again values on modified pages still reachable (a value no longer
+        # linked, as a freed node, may hold allocator data instead of links)
+        revisit = dict(changed)
+        while revisit:
+            reached, addrs = self._reach(roots)
+            values = sorted((key[0], key[0] + self.seen[key][1]) for key in reached)
+            starts, ends = [ v[0] for v in values ], [ ]
+            for low, high in values: ends.append(max(high, ends[-1] if ends else 0))
+            def is_reached(addr):
+                i = bisect.bisect_right(starts, addr) - 1
+                return addr in addrs or (i >= 0 and ends[i] > addr)
+            keys = [ key for key in revisit if key not in self.seen and is_reached(key[0]) ]
+            if not keys: break
+            for key in keys:
+                addr, id = key
+                self.stack = []
+                self.visit(gdb.Value(addr).cast(self.types[id].pointer()).dereference(), revisit.pop(key))
+        self._sweep(roots)
+        self._update_hashes(changed_pages)
+
+    def _pages(self):
+        pages = set()
+        for (addr, id), (name, size) in self.seen.items():
+            pages.update(range(addr // self.page, (addr + max(size, 1) - 1) // self.page + 1))
+        return pages
+
+    def _hash_pages(self, pages):
+        inferior = gdb.selected_inferior()
+        try:
+            return mt_pages.page_hashes(inferior.pid, pages, self.page)
+        except OSError:
+            return { } # all pages will be considered modified
+
+    def _update_hashes(self, changed_pages):
+        """ hash only pages with new values or modified since last analysis """
+        pages = self._pages()
+        hashes = dict((page, h) for page, h in self.page_hashes.items() if page in pages and page not in changed_pages)
+        hashes.update(self._hash_pages(set(page for page in pages if page not in hashes)))
+        self.page_hashes = hashes
+        self.pages = pages
+
+    def _changed_pages(self, dirty, tracked):
+        """ { page number } modified since previous analysis: dirty pages and,
+            out of tracked ranges, pages with a different (or no) content hash """
+        if dirty is not None and tracked is None: return set(dirty)
+        pages = self.pages
+        if tracked:
+            starts = [ low for low, high in tracked ]
+            def is_tracked(page):
+                i = bisect.bisect_right(starts, page * self.page) - 1
+                return i >= 0 and page * self.page < tracked[i][1]
+            pages = set(page for page in pages if not is_tracked(page))
+        hashes = self._hash_pages(pages)
+        changed = set(page for page in pages if page not in hashes or hashes[page] != self.page_hashes.get(page))
+        return changed if dirty is None else changed.union(dirty)
+
+    def _invalidate(self, dirty):
+        """ remove values on dirty pages and their links; return them [ (key, name) ] """
+        changed = [ ]
+        for key, (name, size) in self.seen.items():
+            addr = key[0]
+            if any(page in dirty for page in range(addr // self.page, (addr + max(size, 1) - 1) // self.page + 1)):
+                changed.append((key, name))
+        removed = set()
+        for key, name in changed:
+            del self.seen[key]
+            removed.add(key[0])
+        self.graph = { link: name for link, name in self.graph.items() if link[0] not in removed }
+        return changed
+
+    def _sweep(self, roots):
+        """ remove values no longer reachable from roots """
+        reached, addrs = self._reach(roots)
+        for key in [ key for key in self.seen if key not in reached ]:
+            del self.seen[key]
+        live = set(key[0] for key in self.seen)
+        self.graph = { link: name for link, name in self.graph.items() if link[0] in live }
+
+    def _reach(self, roots):
+        """ (keys of values reachable from roots, reached addresses): values
+            inside reachable values and targets of their links are reachable """
+        values = sorted((key[0], key[0] + size, key) for key, (name, size) in self.seen.items())
+        starts = [ v[0] for v in values ]
+        links = { } # { addr_from: [ addr_to ] }
+        for addr_from, addr_to in self.graph.keys():
+            links.setdefault(addr_from, [ ]).append(addr_to)
+        reached = set()
+        addrs = set()
+        pending = list(roots)
+        while pending:
+            addr = pending.pop()
+            if addr in addrs: continue
+            addrs.add(addr)
+            i = bisect.bisect_left(starts, addr)
+            while i < len(values) and values[i][0] == addr:
+                low, high, key = values[i]
+                i += 1
+                if key in reached: continue
+                reached.add(key)
+                pending.extend(links.get(low, ()))
+                # values inside
+                j = i
+                while j < len(values) and values[j][0] < high:
+                    if values[j][2] not in reached: pending.append(values[j][0])
+                    j += 1
+        return reached, addrs
 
     def dump(self):
         regions = mt_maps.MTmaps().regions
-        regions.append([1 << 64, 1 << 64, ''])
+        regions.append(mt_maps.MTmaps.Region(1 << 64, 1 << 64, 0, '', '', ''))
         region = ''
         i_region = 0
 
-        addrs = [ (addr, size, name, typename) for (addr, typename), (name, size) in self.seen.items() ]
+        addrs = [ (addr, size, name, mt_type_names.get_name(id)) for (addr, id), (name, size) in self.seen.items() ]
         addrs = sorted(addrs, key = lambda x: (x[0] << 16) - x[1])
         max_segment = (0, 0)
-        print(c.WHITE + 'Memory: ' + c.RESET + str(len(self.seen)) + ' values ' + str(len(self.graph)) + ' links')
+        print(c.white + 'Memory: ' + c.reset + str(len(self.seen)) + ' values ' + str(len(self.graph)) + ' links' +
+              (' (%d visited, %d reused)' % (self.decoded, self.reused)))
         for i, (addr, size, name, typename) in enumerate(addrs):
             # region
             i_region_prev = i_region
-            while addr >= regions[i_region][1]:
+            while addr >= regions[i_region].high:
                 i_region += 1
-                region = regions[i_region][2]
+                region = regions[i_region].build_description()
             if region and i_region != i_region_prev:
-                print(c.CYAN + 'region: ' + c.RESET + region)
+                print(c.cyan + 'region: ' + c.reset + region)
 
             indent = 0
             j = i - 1
@@ -59,11 +204,11 @@ class MTmemory(mt_visitor.MTvisitor):
                 j -= 1
             if addr + size > max_segment[1]:
                 max_segment = (addr, addr + size)
-            print((c.GREEN + '%16x ' + c.YELLOW + '%6d ' + c.RESET + '%s %s') % (addr, size, '    '*indent, name))
+            print((c.green + '%16x ' + c.yellow + '%6d ' + c.reset + '%s %s') % (addr, size, '    '*indent, name))
 
-        print('\n' + c.WHITE + 'Links: ' + c.RESET)
+        print('\n' + c.white + 'Links: ' + c.reset)
         for (addr_from, addr_to), name in self.graph.items():
-            print((c.GREEN + '%16x %16x ' + c.RESET + '%s') % (addr_from, addr_to, name))
+            print((c.green + '%16x %16x ' + c.reset + '%s') % (addr_from, addr_to, name))
         print()
 
     def autogenerated(self, name):
@@ -72,11 +217,12 @@ class MTmemory(mt_visitor.MTvisitor):
     def process(self, value, name, recur):
         addr = int(value.address or 0)
         if addr:
-            typename = str(value.type)
-            key = (addr, typename)
+            key = (addr, type_id(value.type))
             if key not in self.seen.keys():
                 size = value.type.sizeof
                 self.seen[key] = (name, size)
+                self.types.setdefault(key[1], value.type)
+                self.decoded += 1
                 if recur: # visit dependencies
                     # check for char[]
                     if self.is_string_char_array(value): return self.visit_string(value, name)
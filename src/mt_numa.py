@@ -0,0 +1,189 @@
+#   -*- mode: python; coding: utf-8; -*-
+#
+#   Copyright 2018 Asier Aguirre <asier.aguirre@gmail.com>
+#   This file is part of memory-tools.
+#
+#   memory-tools is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   memory-tools is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with memory-tools. If not, see <http://www.gnu.org/licenses/>.
+
+
+import os, ctypes, platform
+from mt_colors import mt_colors as c
+
+mt_page = 4096
+mt_node_path = '/sys/devices/system/node'
+mt_move_pages = { 'x86_64': 279, 'aarch64': 239, 'ppc64': 301, 'ppc64le': 301,
+                  's390x': 310, 'i686': 317, 'armv7l': 344 } # syscall numbers
+
+def parse_cpu_list(text):
+    """ [ cpu ] from kernel cpu lists as '0-3,8,10-11' """
+    cpus = [ ]
+    for part in text.strip().split(','):
+        if not part: continue
+        first, sep, last = part.partition('-')
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+def cpu_nodes():
+    """ { cpu: NUMA node } from sysfs; empty without NUMA support """
+    nodes = { }
+    try:
+        names = os.listdir(mt_node_path)
+    except OSError:
+        return nodes
+    for name in names:
+        if not name.startswith('node') or not name[4:].isdigit(): continue
+        with open(os.path.join(mt_node_path, name, 'cpulist')) as f:
+            for cpu in parse_cpu_list(f.read()):
+                nodes[cpu] = int(name[4:])
+    return nodes
+
+def thread_cpus(pid, lwp):
+    """ (cpu where thread last ran, [ allowed cpu ]) of thread lwp of process pid """
+    with open('/proc/%d/task/%d/stat' % (pid, lwp)) as f:
+        stat = f.read()
+    cpu = int(stat[stat.rfind(')') + 1:].split()[36]) # field 39: processor
+    allowed = [ ]
+    with open('/proc/%d/task/%d/status' % (pid, lwp)) as f:
+        for line in f:
+            if line.startswith('Cpus_allowed_list:'):
+                allowed = parse_cpu_list(line.split(':', 1)[1])
+    return cpu, allowed
+
+def page_nodes(pid, pages, batch = 1 << 14):
+    """ { page address: node } of pages of process pid, queried by move_pages(2)
+        without nodes (nothing is moved); negative nodes are -errno for pages
+        not present (-ENOENT) or not mapped (-EFAULT). Pages are queried from
+        this process in batches, so the inferior does not run """
+    number = mt_move_pages.get(platform.machine())
+    if number is None: raise OSError('move_pages: unknown syscall number for ' + platform.machine())
+    libc = ctypes.CDLL(None, use_errno = True)
+    pages = sorted(pages)
+    nodes = { }
+    for first in range(0, len(pages), batch):
+        chunk = pages[first:first + batch]
+        addrs = (ctypes.c_void_p * len(chunk))(*chunk)
+        status = (ctypes.c_int * len(chunk))()
+        if libc.syscall(ctypes.c_long(number), ctypes.c_int(pid), ctypes.c_ulong(len(chunk)),
+                        addrs, None, status, ctypes.c_int(0)) < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, 'move_pages: ' + os.strerror(errno))
+        nodes.update(zip(chunk, status))
+    return nodes
+
+
+class MTnuma:
+    """ NUMA placement of regions (numa_maps) and of large objects reachable from
+        roots (per page nodes), next to the cpus and nodes where threads run """
+    def __init__(self, maps, pid, page = mt_page):
+        self.maps = maps
+        self.pid = pid
+        self.page = page
+        self.available = maps.load_numa(pid)
+        self.cpu_nodes = cpu_nodes()
+        self.threads = { } # { thread num: (lwp, cpu, [ allowed cpu ], { allowed node }) }
+
+    def load_threads(self, threads):
+        for thread in threads:
+            lwp = thread.ptid[1] or thread.ptid[0]
+            try:
+                cpu, allowed = thread_cpus(self.pid, lwp)
+            except (IOError, IndexError, ValueError):
+                continue
+            nodes = set(self.cpu_nodes.get(c, 0) for c in allowed)
+            self.threads[thread.num] = (lwp, cpu, allowed, nodes)
+
+    def get_objects(self, objects, min_bytes, root_threads = { }):
+        """ [ (name, start, bytes, { node: pages }, threads) ] of objects (grouped
+            by name) of an MTpage_objects with at least min_bytes; threads is the
+            set of thread nums of the roots reaching the object or None when a
+            static root reaches it """
+        groups = { } # { name: [start, bytes, [ range ], roots] }
+        for r in objects.ranges:
+            group = groups.setdefault(r[2], [r[0], 0, [ ], set()])
+            group[1] += r[1] - r[0]
+            group[2].append(r)
+            group[3].add(r[3])
+        group_pages = { } # { name: { page } }
+        for name, (start, bytes, ranges, roots) in groups.items():
+            if bytes < min_bytes: continue
+            group_pages[name] = set(p for r in ranges for p in range(r[0] // self.page * self.page, r[1], self.page))
+        pages = set().union(*group_pages.values())
+        nodes = pages and page_nodes(self.pid, pages) or { }
+        report = [ ]
+        for name, object_pages in group_pages.items():
+            start, bytes, ranges, roots = groups[name]
+            counts = { }
+            for page in object_pages:
+                node = nodes.get(page, -1)
+                if node >= 0: counts[node] = counts.get(node, 0) + 1
+            threads = set()
+            for root in roots:
+                root_set = root_threads.get(root)
+                if root_set is None:
+                    threads = None
+                    break
+                threads |= root_set
+            report.append((name, start, bytes, counts, threads))
+        report.sort(key = lambda x: -x[2])
+        return report
+
+    def _nodes(self, counts, allowed = None, width = 24):
+        """ 'N0=3 N1=5' text; red when most pages are out of allowed nodes """
+        text = '%-*s' % (width, ' '.join('N%d=%d' % (node, counts[node]) for node in sorted(counts)) or '-')
+        if allowed and counts and max(counts, key = counts.get) not in allowed:
+            return c.red + text + c.reset
+        return text
+
+    def _allowed(self, threads):
+        if not threads: return None
+        return set(node for num in threads if num in self.threads for node in self.threads[num][3])
+
+    def dump_regions(self):
+        print(c.white + 'NUMA placement of regions' + c.reset)
+        regions = [ r for r in self.maps.regions if r.numa_nodes ]
+        if not regions:
+            print(c.red + '<empty>' + c.reset)
+            return
+        print((c.cyan + '%16s %16s %-12s %-24s %s' + c.reset) % ('Start', 'End', 'Policy', 'Nodes (pages)', 'Description'))
+        totals = { }
+        for region in regions:
+            threads = region.extra.startswith('thread ') and { int(region.extra.split()[1]) }
+            print((c.green + '%16x %16x ' + c.magenta + '%-12s ' + c.reset + '%s %s') %
+                  (region.low, region.high, region.numa_policy, self._nodes(region.numa_nodes, self._allowed(threads)),
+                   region.build_description()))
+            for node, pages in region.numa_nodes.items():
+                totals[node] = totals.get(node, 0) + pages * region.numa_page
+        print(c.white + 'total: ' + c.reset + ' '.join('N%d=%d bytes' % (n, totals[n]) for n in sorted(totals)))
+
+    def dump_threads(self):
+        print(c.white + 'thread cpu affinity' + c.reset)
+        if not self.threads:
+            print(c.red + '<empty>' + c.reset)
+            return
+        print((c.cyan + '%6s %8s %4s %4s %-12s %s' + c.reset) % ('Thread', 'LWP', 'Cpu', 'Node', 'Nodes', 'Allowed cpus'))
+        for num, (lwp, cpu, allowed, nodes) in sorted(self.threads.items()):
+            cpus = len(allowed) > 8 and '%d cpus' % len(allowed) or ','.join(str(c) for c in allowed)
+            print((c.green + '%6d ' + c.reset + '%8d ' + c.yellow + '%4d %4d ' + c.reset + '%-12s %s') %
+                  (num, lwp, cpu, self.cpu_nodes.get(cpu, 0), ','.join(str(n) for n in sorted(nodes)), cpus))
+
+    def dump_objects(self, report):
+        print(c.white + 'NUMA placement of objects' + c.reset)
+        if not report:
+            print(c.red + '<empty>' + c.reset)
+            return
+        print((c.cyan + '%16s %14s %-24s %-10s %s' + c.reset) % ('Address', 'Bytes', 'Nodes (pages)', 'Threads', 'Name'))
+        for name, start, bytes, counts, threads in report:
+            names = threads is None and 'all' or ','.join(str(t) for t in sorted(threads))
+            print((c.green + '%16x ' + c.yellow + '%14d ' + c.reset + '%s %-10s %s') %
+                  (start, bytes, self._nodes(counts, self._allowed(threads)), names, name))
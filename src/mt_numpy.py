@@ -0,0 +1,102 @@
+#   -*- mode: python; coding: utf-8; -*-
+#
+#   Copyright 2018 Asier Aguirre <asier.aguirre@gmail.com>
+#   This file is part of memory-tools.
+#
+#   memory-tools is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   memory-tools is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with memory-tools. If not, see <http://www.gnu.org/licenses/>.
+
+import gdb, mt_util, mt_visitor
+from mt_containers import MTarray
+from mt_type_cleaning import type_id
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+mt_dtypes = { } # { type id: numpy.dtype }
+
+def get_dtype(type):
+    """ numpy dtype with the layout of gdb type (scalars, pointers, arrays and plain structs) """
+    if np is None: raise RuntimeError('numpy is not available in gdb python')
+    type = type.strip_typedefs()
+    key = type_id(type)
+    if key not in mt_dtypes:
+        mt_dtypes[key] = _get_dtype(type)
+    return mt_dtypes[key]
+
+def _is_signed(type):
+    try:
+        return type.is_signed # gdb >= 12
+    except AttributeError:
+        return not str(type).startswith('unsigned') and type.code != gdb.TYPE_CODE_BOOL
+
+def _get_dtype(type):
+    code = type.code
+    order = mt_util.endian_prefix()
+    if code in { gdb.TYPE_CODE_INT, gdb.TYPE_CODE_CHAR, gdb.TYPE_CODE_ENUM }:
+        return np.dtype(order + (_is_signed(type) and 'i' or 'u') + str(type.sizeof))
+    if code == gdb.TYPE_CODE_BOOL:
+        if type.sizeof == 1: return np.dtype('?')
+        return np.dtype(order + 'u' + str(type.sizeof))
+    if code == gdb.TYPE_CODE_FLT:
+        if type.sizeof not in (2, 4, 8): raise TypeError('unsupported float type: ' + str(type))
+        return np.dtype(order + 'f' + str(type.sizeof))
+    if code == gdb.TYPE_CODE_PTR:
+        return np.dtype(order + 'u' + str(type.sizeof))
+    if code == gdb.TYPE_CODE_ARRAY:
+        target = type.target()
+        return np.dtype((get_dtype(target), (type.sizeof // target.sizeof,)))
+    if code in { gdb.TYPE_CODE_STRUCT, gdb.TYPE_CODE_UNION }:
+        names, formats, offsets = [], [], []
+        for i, field in enumerate(type.fields()):
+            if not hasattr(field, 'bitpos') or field.bitsize: continue # static member or bitfield
+            names.append(field.name or '_anonymous%d' % i)
+            formats.append(get_dtype(field.type))
+            offsets.append(field.bitpos // 8)
+        return np.dtype({ 'names': names, 'formats': formats, 'offsets': offsets, 'itemsize': type.sizeof })
+    raise TypeError('no numpy layout for type: ' + str(type))
+
+
+def read_array(buffers, type_elem):
+    """ ndarray with the elements of contiguous buffers [ (address, count) ];
+        each buffer is read at once """
+    dtype = get_dtype(type_elem)
+    arrays = [np.frombuffer(mt_util.read_memory(address, count * type_elem.sizeof), dtype = dtype)
+              for address, count in buffers if count]
+    if not arrays: return np.empty(0, dtype = dtype)
+    if len(arrays) == 1: return arrays[0]
+    return np.concatenate(arrays)
+
+def to_numpy(value):
+    """ ndarray from a value being an array, std::vector, std::deque or pointer
+        to a single element, with a dtype derived from the element type """
+    if np is None: raise RuntimeError('numpy is not available in gdb python')
+    type = value.type.strip_typedefs()
+    value = value.cast(type)
+    if type.code == gdb.TYPE_CODE_PTR:
+        return read_array([(int(value), 1)], type.target())
+    wrap = type.code == gdb.TYPE_CODE_ARRAY and MTarray(value) or mt_visitor.MTvisitor().get_struct_wrapper(value)
+    if not wrap or not hasattr(wrap, 'get_buffers'):
+        raise TypeError('no contiguous elements in type: ' + str(value.type))
+    if getattr(wrap, 'is_bool', False): # std::vector<bool> bit storage
+        return np.array(wrap._get_bools(0, wrap.prop_size), dtype = np.bool_)
+    buffers = wrap.get_buffers()
+    if buffers is None: raise TypeError('value not in memory')
+    return read_array(buffers, wrap.type_elem)
+
+def pointer_to_numpy(pointer, count):
+    """ ndarray of count elements pointed by pointer value """
+    if np is None: raise RuntimeError('numpy is not available in gdb python')
+    return read_array([(int(pointer), count)], pointer.type.strip_typedefs().target())
@@ -0,0 +1,230 @@
+#   -*- mode: python; coding: utf-8; -*-
+#
+#   Copyright 2018 Asier Aguirre <asier.aguirre@gmail.com>
+#   This file is part of memory-tools.
+#
+#   memory-tools is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   memory-tools is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with memory-tools. If not, see <http://www.gnu.org/licenses/>.
+
+import os, heapq, array, mt_visitor
+from mt_numpy import np
+from mt_type_cleaning import clean_type
+from mt_colors import mt_colors as c
+
+mt_page = 4096
+mt_block = 1 << 20 # bytes read at once from /proc/$pid/mem
+
+def page_hashes(pid, pages, page = mt_page, block = mt_block):
+    """ { page number: hash of contents } of pages (numbers) of process pid;
+        contiguous pages are read at once from /proc/$pid/mem """
+    hashes = { }
+    mem = os.open('/proc/%d/mem' % pid, os.O_RDONLY)
+    try:
+        pages = sorted(pages)
+        run = block // page
+        i = 0
+        while i < len(pages):
+            j = i + 1
+            while j < len(pages) and pages[j] == pages[j - 1] + 1 and j - i < run: j += 1
+            try:
+                data = os.pread(mem, (j - i) * page, pages[i] * page)
+            except OSError:
+                data = b''
+            for k in range(len(data) // page):
+                hashes[pages[i + k]] = hash(data[k * page:(k + 1) * page])
+            i = j
+    finally:
+        os.close(mem)
+    return hashes
+
+
+class MTpages:
+    """ zero and duplicated pages in writable anonymous regions, reading
+        /proc/$pid/mem in large blocks; only resident pages (by /proc/$pid/pagemap)
+        are considered. Pages are compared by 128 bit fingerprints (vectorized
+        with numpy when available), so duplicates are candidates as for KSM """
+    def __init__(self, pid, page = mt_page, block = mt_block):
+        self.pid = pid
+        self.page = page
+        self.block = max(page, block // page * page)
+        self.regions = [ ]          # [ (region, resident, zero, duplicated, unreadable) ] pages
+        self.zero = array.array('Q')        # addresses of zero pages
+        self.duplicated = array.array('Q')  # addresses of pages with contents seen before
+        self.fingerprints = { }     # { fingerprint: count }
+        if np is not None:
+            words = page // 8
+            random = np.random.RandomState(page)
+            self.k1 = random.randint(0, 1 << 62, words, dtype = np.uint64) * 2 + 1
+            self.k2 = random.randint(0, 1 << 62, words, dtype = np.uint64) * 2 + 1
+            self.k3 = random.randint(0, 1 << 62, words, dtype = np.uint64)
+
+    def scan(self, regions):
+        mem = os.open('/proc/%d/mem' % self.pid, os.O_RDONLY)
+        try:
+            pagemap = os.open('/proc/%d/pagemap' % self.pid, os.O_RDONLY)
+        except OSError:
+            pagemap = None # no resident information: all pages are read
+        try:
+            for region in regions:
+                self.regions.append((region,) + self._region(mem, pagemap, region))
+        finally:
+            os.close(mem)
+            if pagemap is not None: os.close(pagemap)
+
+    def _resident(self, pagemap, addr, pages):
+        """ residency flags (present or swapped) of pages from addr """
+        if pagemap is None: return [ True ] * pages
+        try:
+            data = os.pread(pagemap, 8 * pages, addr // self.page * 8)
+        except OSError:
+            return [ True ] * pages
+        if np is not None:
+            entries = np.frombuffer(data, dtype = np.uint64)
+            return ((entries >> np.uint64(62)) != 0).tolist()
+        entries = array.array('Q', data)
+        return [ bool(e >> 62) for e in entries ]
+
+    def _region(self, mem, pagemap, region):
+        resident = zero = duplicated = unreadable = 0
+        addr = region.low
+        while addr < region.high:
+            size = min(self.block, region.high - addr)
+            pages = size // self.page
+            flags = self._resident(pagemap, addr, pages)
+            n = sum(flags)
+            if n:
+                try:
+                    data = os.pread(mem, size, addr)
+                except OSError:
+                    data = b''
+                if len(data) < size:
+                    unreadable += n
+                else:
+                    resident += n
+                    z, d = self._block(addr, data, flags)
+                    zero += z
+                    duplicated += d
+            addr += size
+        return (resident, zero, duplicated, unreadable)
+
+    def _block(self, addr, data, flags):
+        """ count zero and duplicated pages of resident pages of block at addr """
+        zero = duplicated = 0
+        if np is not None:
+            words = np.frombuffer(data, dtype = np.uint64).reshape(-1, self.page // 8)
+            is_zero = (~words.any(axis = 1)).tolist()
+            h1 = (words * self.k1).sum(axis = 1).tolist()
+            h2 = np.bitwise_xor.reduce((words ^ self.k3) * self.k2, axis = 1).tolist()
+            fingerprints = zip(h1, h2)
+        else:
+            pages = [ data[i:i + self.page] for i in range(0, len(data), self.page) ]
+            zero_page = bytes(self.page)
+            is_zero = [ p == zero_page for p in pages ]
+            fingerprints = ((hash(p), len(p)) for p in pages)
+        for i, (flag, is_z, fingerprint) in enumerate(zip(flags, is_zero, fingerprints)):
+            if not flag: continue
+            if is_z:
+                zero += 1
+                self.zero.append(addr + i * self.page)
+                continue
+            count = self.fingerprints.get(fingerprint, 0)
+            self.fingerprints[fingerprint] = count + 1
+            if count:
+                duplicated += 1
+                self.duplicated.append(addr + i * self.page)
+        return zero, duplicated
+
+    def dump(self):
+        print(c.white + 'zero and duplicated pages of writable anonymous regions' + c.reset)
+        if not self.regions:
+            print(c.red + '<empty>' + c.reset)
+            return
+        print((c.cyan + '%16s %16s %10s %10s %10s %s' + c.reset) % ('Start', 'End', 'Resident', 'Zero', 'Duplicated', 'Description'))
+        for region, resident, zero, duplicated, unreadable in self.regions:
+            if not resident: continue
+            print((c.green + '%16x %16x ' + c.yellow + '%10d %10d %10d ' + c.reset + '%s') %
+                  (region.low, region.high, resident, zero, duplicated, region.build_description()))
+        resident = sum(r[1] for r in self.regions)
+        print(c.white + 'total: ' + c.reset + '%d resident pages, %d zero (%d bytes), %d duplicated (%d bytes)' %
+              (resident, len(self.zero), len(self.zero) * self.page, len(self.duplicated), len(self.duplicated) * self.page))
+
+
+class MTpage_objects(mt_visitor.MTwalker):
+    """ address ranges of roots, pointed objects and container buffers and
+        nodes reachable from roots, to find the objects covering pages """
+    keys = { 'name': 2, 'root': 3, 'type': 4 }
+
+    def __init__(self):
+        super().__init__()
+        self.ranges = [ ] # [ (start, end, name, root name, typename) ]
+        self.root = ''
+
+    def analysis(self, name_values):
+        """ name_values as returned by MTsymbols.get_values """
+        for name, value in name_values:
+            self.root = name
+            self.walk(value, name)
+        self.ranges.sort()
+
+    def on_top(self, value, name):
+        if value.address is not None and value.type.sizeof:
+            addr = int(value.address)
+            self.ranges.append((addr, addr + value.type.sizeof, name, self.root, clean_type(value.type)))
+
+    def on_wrap(self, wrap, value, name):
+        type_elem = getattr(wrap, 'type_elem', None)
+        if type_elem is None: return True
+        typename = clean_type(value.type)
+        buffers = hasattr(wrap, 'get_buffers') and wrap.get_buffers()
+        for addr, count in buffers or ():
+            if count: self.ranges.append((addr, addr + count * type_elem.sizeof, name + '[]', self.root, typename))
+        if hasattr(wrap, 'get_node_addresses'):
+            size = getattr(wrap, 'payload', 0) + type_elem.sizeof
+            for addr in wrap.get_node_addresses():
+                self.ranges.append((addr, addr + size, name + '[]', self.root, typename))
+        return True
+
+    def get_objects(self, pages, page = mt_page, by = 'name'):
+        """ { name: [start, bytes] } bytes of pages covered by each object (all
+            the objects overlapping a page are credited); objects are grouped by
+            name, by root name or by type (by argument) """
+        key = self.keys[by]
+        objects = { }
+        active = [ ] # heap of (end, index) of ranges overlapping the page
+        i = 0
+        for addr in sorted(pages): # sweep of pages and ranges (sorted by start)
+            end = addr + page
+            while i < len(self.ranges) and self.ranges[i][0] < end:
+                heapq.heappush(active, (self.ranges[i][1], i))
+                i += 1
+            while active and active[0][0] <= addr: heapq.heappop(active)
+            for stop, j in active:
+                start = self.ranges[j][0]
+                stats = objects.setdefault(self.ranges[j][key], [start, 0])
+                stats[1] += min(stop, end) - max(start, addr)
+                stats[0] = min(stats[0], start)
+        return objects
+
+    def dump(self, scan):
+        self.dump_pages('zero', scan.zero, scan.page)
+        self.dump_pages('duplicated', scan.duplicated, scan.page)
+
+    def dump_pages(self, title, pages, page = mt_page, by = 'name', max_objects = 30):
+        print(c.white + (by == 'name' and 'objects' or by + 's') + ' on ' + title + ' pages' + c.reset)
+        objects = self.get_objects(pages, page, by)
+        if not objects:
+            print(c.red + '<empty>' + c.reset)
+            return
+        print((c.cyan + '%16s %14s %s' + c.reset) % ('Address', 'Bytes', 'Name'))
+        for name, (start, bytes) in sorted(objects.items(), key = lambda x: -x[1][1])[:max_objects]:
+            print((c.green + '%16x ' + c.yellow + '%14d ' + c.reset + '%s') % (start, bytes, name))
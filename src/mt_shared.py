@@ -0,0 +1,190 @@
+#   -*- mode: python; coding: utf-8; -*-
+#
+#   Copyright 2018 Asier Aguirre <asier.aguirre@gmail.com>
+#   This file is part of memory-tools.
+#
+#   memory-tools is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   memory-tools is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with memory-tools. If not, see <http://www.gnu.org/licenses/>.
+
+import gdb, bisect, array, mt_visitor
+from mt_containers import MTstd_shared_ptr, MTstd_weak_ptr
+from mt_type_cleaning import clean_type
+from mt_colors import mt_colors as c
+
+def strongly_connected(n, edges):
+    """ strongly connected components of graph of n nodes and edges [ (from, to) ];
+        iterative Tarjan over a compact adjacency array, linear in nodes + edges """
+    start = array.array('l', [0]) * (n + 1)
+    for a, b in edges: start[a + 1] += 1
+    for i in range(n): start[i + 1] += start[i]
+    fill = array.array('l', start)
+    targets = array.array('l', [0]) * len(edges)
+    for a, b in edges:
+        targets[fill[a]] = b
+        fill[a] += 1
+
+    index = array.array('l', [-1]) * n
+    low = array.array('l', [0]) * n
+    on_stack = bytearray(n)
+    stack = [ ]
+    components = [ ]
+    counter = 0
+    for root in range(n):
+        if index[root] >= 0: continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = 1
+        work = [ (root, start[root]) ]
+        while work:
+            v, i = work[-1]
+            if i < start[v + 1]:
+                work[-1] = (v, i + 1)
+                w = targets[i]
+                if index[w] < 0:
+                    index[w] = low[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    on_stack[w] = 1
+                    work.append((w, start[w]))
+                elif on_stack[w] and index[w] < low[v]:
+                    low[v] = index[w]
+            else:
+                work.pop()
+                if work and low[v] < low[work[-1][0]]: low[work[-1][0]] = low[v]
+                if low[v] == index[v]:
+                    component = [ ]
+                    while True:
+                        w = stack.pop()
+                        on_stack[w] = 0
+                        component.append(w)
+                        if w == v: break
+                    components.append(component)
+    return components
+
+
+class MTshared(mt_visitor.MTwalker):
+    """ shared_ptr and weak_ptr reachable from roots grouped by control block,
+        and cycles of shared ownership (never freed by reference counting) """
+    def __init__(self):
+        super().__init__()
+        self.blocks = { }     # { control block: index }
+        self.info = [ ]       # [ [control block, use, weak, block bytes, object bytes, object addr, object size, typename] ]
+        self.pointers = [ ]   # [ (shared_ptr addr, owner index or -1, index) ]
+        self.n_shared = self.n_weak = 0
+        self.owners = [ ]     # stack of control block indexes whose object is being walked
+
+    def analysis(self, name_values):
+        """ name_values as returned by MTsymbols.get_values """
+        for name, value in name_values:
+            self.walk(value, name)
+
+    def _block(self, wrap):
+        block = wrap.get_control_block()
+        if not block: return -1
+        index = self.blocks.get(block)
+        if index is None:
+            index = self.blocks[block] = len(self.info)
+            pointer = wrap.value['_M_ptr']
+            block_bytes, object_bytes = wrap.get_control_block_bytes()
+            self.info.append([block, int(wrap.prop_ref_count), int(wrap.prop_weak_count), block_bytes, object_bytes,
+                              int(pointer), pointer.type.target().sizeof, clean_type(pointer.type.target())])
+        return index
+
+    def _walk_wrap(self, wrap, value, name):
+        if not isinstance(wrap, MTstd_shared_ptr):
+            return super()._walk_wrap(wrap, value, name)
+        try:
+            index = self._block(wrap)
+        except gdb.error:
+            return
+        if index < 0: return # empty
+        if isinstance(wrap, MTstd_weak_ptr):
+            self.n_weak += 1
+            return
+        self.n_shared += 1
+        if value.address is not None:
+            owner = -1
+            if self.owners: owner = self.owners[-1]
+            self.pointers.append((int(value.address), owner, index))
+        self.owners.append(index)
+        try:
+            super()._walk_wrap(wrap, value, name)
+        finally:
+            self.owners.pop()
+
+    def get_edges(self):
+        """ ownership edges [ (owner index, owned index) ]; shared_ptrs not found
+            while walking an owned object (reached through raw pointers) are
+            assigned to the object containing them """
+        objects = sorted((info[5], info[5] + info[6], i) for i, info in enumerate(self.info) if info[1])
+        starts = [ o[0] for o in objects ]
+        edges = [ ]
+        for addr, owner, index in self.pointers:
+            if owner < 0:
+                i = bisect.bisect_right(starts, addr) - 1
+                if i >= 0 and addr < objects[i][1]: owner = objects[i][2]
+            if owner >= 0: edges.append((owner, index))
+        return edges
+
+    def get_cycles(self):
+        """ [ (component indexes, internal references) ] of ownership cycles """
+        edges = self.get_edges()
+        components = strongly_connected(len(self.info), edges)
+        loops = set(a for a, b in edges if a == b)
+        cycles = [ ]
+        component_of = { }
+        for component in components:
+            if len(component) > 1 or component[0] in loops:
+                for i in component: component_of[i] = len(cycles)
+                cycles.append((component, 0))
+        internal = [ 0 ] * len(cycles)
+        for a, b in edges:
+            if a in component_of and component_of[a] == component_of.get(b):
+                internal[component_of[a]] += 1
+        return [ (component, internal[i]) for i, (component, _) in enumerate(cycles) ]
+
+    def dump(self, max_blocks = 20):
+        print(c.white + 'shared ownership by object type' + c.reset)
+        if not self.info:
+            print(c.red + '<empty>' + c.reset)
+            return
+        types = { } # { typename: [blocks, use, weak, bytes, expired bytes] }
+        for block, use, weak, block_bytes, object_bytes, addr, size, typename in self.info:
+            stats = types.setdefault(typename, [0, 0, 0, 0, 0])
+            stats[0] += 1
+            stats[1] += use
+            stats[2] += weak
+            stats[3] += block_bytes + (use and object_bytes or 0)
+            if not use: stats[4] += block_bytes
+        print((c.cyan + '%10s %10s %10s %14s %14s %s' + c.reset) % ('Blocks', 'Uses', 'Weak', 'Bytes', 'Expired', 'Type'))
+        for typename, (blocks, use, weak, bytes, expired) in sorted(types.items(), key = lambda x: -x[1][3]):
+            print((c.yellow + '%10d %10d %10d %14d %14d ' + c.reset + '%s') % (blocks, use, weak, bytes, expired, typename))
+        print(c.white + 'total: ' + c.reset + '%d shared_ptr %d weak_ptr %d control blocks' %
+              (self.n_shared, self.n_weak, len(self.info)))
+        print(c.white + 'most shared objects' + c.reset)
+        print((c.cyan + '%16s %16s %8s %8s %s' + c.reset) % ('Control block', 'Object', 'Uses', 'Weak', 'Type'))
+        for block, use, weak, block_bytes, object_bytes, addr, size, typename in \
+                sorted(self.info, key = lambda x: -x[1])[:max_blocks]:
+            print((c.green + '%16x %16x ' + c.yellow + '%8d %8d ' + c.reset + '%s') % (block, addr, use, weak, typename))
+        print(c.white + 'ownership cycles' + c.reset)
+        cycles = self.get_cycles()
+        if not cycles:
+            print(c.red + '<empty>' + c.reset)
+        for component, internal in cycles:
+            uses = sum(self.info[i][1] for i in component)
+            bytes = sum(self.info[i][3] + self.info[i][4] for i in component)
+            typenames = sorted(set(self.info[i][7] for i in component))
+            print((c.yellow + '  %d objects %d bytes, %d external references%s: ' + c.reset + '%s') %
+                  (len(component), bytes, max(0, uses - internal),
+                   uses <= internal and ' (leaked)' or '', ', '.join(typenames)))
@@ -0,0 +1,186 @@
+#   -*- mode: python; coding: utf-8; -*-
+#
+#   Copyright 2018 Asier Aguirre <asier.aguirre@gmail.com>
+#   This file is part of memory-tools.
+#
+#   memory-tools is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   memory-tools is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with memory-tools. If not, see <http://www.gnu.org/licenses/>.
+
+import gdb, bisect, mt_heap, mt_visitor
+from mt_containers import MTstd_mutex
+from mt_type_cleaning import type_id, clean_type
+from mt_colors import mt_colors as c
+
+mt_cache_line = 64
+
+mt_sync_typedefs = { 'pthread_mutex_t', 'pthread_spinlock_t', 'pthread_rwlock_t', 'pthread_cond_t',
+                     'pthread_barrier_t', 'sem_t', '__gthread_mutex_t', '__gthread_recursive_mutex_t' }
+mt_sync_prefixes = ( 'std::mutex', 'std::recursive_mutex', 'std::timed_mutex', 'std::recursive_timed_mutex',
+                     'std::shared_mutex', 'std::shared_timed_mutex', 'std::condition_variable',
+                     'std::atomic<', 'std::atomic_flag', 'std::__atomic_base<', 'std::__atomic_flag_base' )
+
+mt_sync_kinds = { } # { type id: kind or None }
+
+def sync_kind(type):
+    """ 'lock' or 'atomic' for synchronization types (written by several threads), else None """
+    key = type_id(type)
+    if key not in mt_sync_kinds:
+        mt_sync_kinds[key] = _sync_kind(type)
+    return mt_sync_kinds[key]
+
+def _sync_kind(type):
+    while True:
+        if type.name in mt_sync_typedefs: return 'lock'
+        if type.code != gdb.TYPE_CODE_TYPEDEF: break
+        type = type.target()
+    name = type.unqualified().name or ''
+    if name in mt_sync_typedefs: return 'lock' # union named by its typedef
+    if not name.startswith(mt_sync_prefixes): return None
+    return 'atomic' in name and 'atomic' or 'lock'
+
+mt_sync_fields = { } # { type id: [ (offset, size, field name, kind) ] }
+
+def sync_fields(type):
+    """ synchronization members of type (recursively), computed once per type """
+    key = type_id(type)
+    if key not in mt_sync_fields:
+        mt_sync_fields[key] = [ ] # recursive types
+        mt_sync_fields[key] = _sync_fields(type)
+    return mt_sync_fields[key]
+
+def _sync_fields(type):
+    return member_fields(type, sync_kind, sync_fields)
+
+def member_fields(type, kind_of, fields_of):
+    """ [ (offset, size, field name, kind) ] of type itself or its members (through
+        arrays and structs) with a kind by kind_of; fields_of is the memoized
+        version of the caller, used for member types """
+    kind = kind_of(type)
+    if kind: return [ (0, type.sizeof, '', kind) ]
+    type = type.strip_typedefs()
+    if type.code == gdb.TYPE_CODE_ARRAY:
+        elem = type.target()
+        if not elem.sizeof: return [ ]
+        fields = fields_of(elem)
+        return [ (i * elem.sizeof + offset, size, ('[%d]' % i) + name, kind)
+                 for i in range(type.sizeof // elem.sizeof) for offset, size, name, kind in fields ]
+    if type.code != gdb.TYPE_CODE_STRUCT: return [ ]
+    fields = [ ]
+    for field in type.fields():
+        if not hasattr(field, 'bitpos') or field.bitsize: continue
+        for offset, size, name, kind in fields_of(field.type):
+            fields.append((field.bitpos // 8 + offset, size, '.' + (field.name or '') + name, kind))
+    return fields
+
+
+class MTsharing(mt_visitor.MTwalker):
+    """ cache lines where locks or atomics share the line with other locks,
+        atomics or unrelated objects (false sharing candidates) """
+    def __init__(self, line = mt_cache_line):
+        super().__init__()
+        self.line = line
+        self.tops = { }     # { addr: (size, name) } roots and pointer targets
+        self.items = { }    # { addr: (size, name, kind, top addr) } locks and atomics
+        self.packed = [ ]   # [ (addr, count, elem size, name, typename) ] arrays of elements with sync members
+        self.top = 0
+
+    def analysis(self, name_values):
+        """ name_values as returned by MTsymbols.get_values """
+        for name, value in name_values:
+            self.walk(value, name)
+
+    def on_top(self, value, name):
+        self.top = int(value.address or 0)
+        if self.top and self.top not in self.tops:
+            self.tops[self.top] = (value.type.sizeof, name)
+
+    def add_item(self, addr, size, name, kind):
+        if addr and addr not in self.items:
+            self.items[addr] = (size, name, kind, self.top)
+
+    def _sync(self, value, name):
+        kind = sync_kind(value.type)
+        if kind and value.address is not None:
+            self.add_item(int(value.address), value.type.sizeof, name, kind)
+        return kind
+
+    def on_struct(self, value, name):
+        self._sync(value, name)
+
+    def on_typedef(self, value, name):
+        return not self._sync(value, name) # pthread_mutex_t and friends
+
+    def visit_union(self, value, name):
+        self._sync(value, name)
+
+    def on_wrap(self, wrap, value, name):
+        if isinstance(wrap, MTstd_mutex) or self._sync(value, name): return False
+        type_elem = getattr(wrap, 'type_elem', None)
+        if type_elem is None or not hasattr(wrap, 'get_buffers'): return True
+        fields = sync_fields(type_elem)
+        buffers = fields and wrap.get_buffers()
+        if not buffers: return True
+        size = type_elem.sizeof
+        for addr, count in buffers:
+            if count > 1 and size % self.line:
+                self.packed.append((addr, count, size, name, clean_type(type_elem)))
+        if mt_heap.type_owns_heap(type_elem): return True # elements are walked
+        for addr, count in buffers:
+            for i in range(count):
+                for offset, field_size, field, kind in fields:
+                    self.add_item(addr + i * size + offset, field_size, ('[%d]' % i) + name + field, kind)
+        return True
+
+    def get_lines(self):
+        """ [ (line addr, [ (addr, size, name, kind) ]) ] lines shared by a lock or atomic
+            with another one or with other roots / pointed objects """
+        tops = sorted((addr, addr + size, name) for addr, (size, name) in self.tops.items())
+        starts = [ t[0] for t in tops ]
+        max_size = max([ 0 ] + [ t[1] - t[0] for t in tops ])
+        lines = { } # { line: [ (addr, size, name, kind, top) ] }
+        for addr, (size, name, kind, top) in self.items.items():
+            for line in range(addr // self.line, (addr + max(size, 1) - 1) // self.line + 1):
+                lines.setdefault(line, [ ]).append((addr, size, name, kind, top))
+        report = [ ]
+        for line, items in sorted(lines.items()):
+            low, high = line * self.line, (line + 1) * self.line
+            own = [ (top, top + self.tops[top][0]) for top in set(item[4] for item in items) if top ]
+            others = [ ]
+            i = bisect.bisect_left(starts, high) - 1
+            while i >= 0 and tops[i][0] + max_size > low:
+                addr, end, name = tops[i]
+                i -= 1
+                if end <= low: continue
+                if any(addr < own_end and end > own_addr for own_addr, own_end in own): continue
+                others.append((addr, end - addr, name, 'data'))
+            if len(items) > 1 or others:
+                report.append((low, [ item[:4] for item in sorted(items) ] + sorted(others)))
+        return report
+
+    def dump(self, max_lines = 50):
+        report = self.get_lines()
+        print(c.white + 'cache lines shared by locks / atomics' + c.reset)
+        if not report:
+            print(c.red + '<empty>' + c.reset)
+        for low, objects in report[:max_lines]:
+            print(c.green + 'line 0x%x' % low + c.reset)
+            for addr, size, name, kind in objects:
+                print((c.cyan + '  %16x ' + c.yellow + '%6d %-6s ' + c.reset + '%s') % (addr, size, kind, name))
+        if len(report) > max_lines:
+            print(c.white + '... %d more lines' % (len(report) - max_lines) + c.reset)
+        print(c.white + 'arrays of elements with locks / atomics sharing lines' + c.reset)
+        if not self.packed:
+            print(c.red + '<empty>' + c.reset)
+        for addr, count, size, name, typename in self.packed:
+            print((c.cyan + '  %16x ' + c.yellow + '%6d x %4d bytes ' + c.reset + '%s ' + c.blue + '%s' + c.reset) %
+                  (addr, count, size, name, typename))
@@ -0,0 +1,163 @@
+#   -*- mode: python; coding: utf-8; -*-
+#
+#   Copyright 2018 Asier Aguirre <asier.aguirre@gmail.com>
+#   This file is part of memory-tools.
+#
+#   memory-tools is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   memory-tools is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with memory-tools. If not, see <http://www.gnu.org/licenses/>.
+
+
+import gdb, os, array, mt_util
+from mt_numpy import np
+from mt_colors import mt_colors as c
+
+mt_page = 4096
+mt_block = 1 << 16 # bytes read at once from /proc/$pid/mem
+
+def stack_limit(pid):
+    """ soft RLIMIT_STACK of process pid (main thread stack size), None if unlimited """
+    with open('/proc/%d/limits' % pid) as f:
+        for line in f:
+            if line.startswith('Max stack size'):
+                soft = line[len('Max stack size'):].split()[0]
+                return soft != 'unlimited' and int(soft) or None
+    return None
+
+class MTstacks:
+    """ stack usage of each thread: current depth (from sp), frame sizes (sp
+        deltas of consecutive frames) and high-water mark (lowest non-zero
+        word of the stack region: pages never touched are zero filled, and
+        pages before the first resident one are skipped by /proc/$pid/pagemap) """
+    def __init__(self, pid, page = mt_page, block = mt_block, max_frames = 4096):
+        self.pid = pid
+        self.page = page
+        self.block = max(page, block // page * page)
+        self.max_frames = max_frames
+        self.threads = [ ] # [ (thread num, lwp, region, size, depth, high water, resident, frames) ]
+                           #   frames = [ (level, bytes, function) ]
+
+    @mt_util.maintain_thread_frame
+    def analysis(self, maps, threads):
+        main_limit = stack_limit(self.pid)
+        mem = os.open('/proc/%d/mem' % self.pid, os.O_RDONLY)
+        try:
+            pagemap = os.open('/proc/%d/pagemap' % self.pid, os.O_RDONLY)
+        except OSError:
+            pagemap = None # every page is read
+        try:
+            for thread in threads:
+                thread.switch()
+                frame = gdb.newest_frame()
+                sp = int(frame.read_register('sp'))
+                region = maps.get_region(sp)
+                if not region: continue
+                lwp = thread.ptid[1] or thread.ptid[0]
+                size = region.high - region.low
+                if lwp == self.pid and main_limit: size = max(size, main_limit) # main stack grows
+                low_mark = self._high_water(mem, pagemap, region.low, sp)
+                resident = self._resident(pagemap, region.low, region.high)
+                self.threads.append((thread.num, lwp, region, size, region.high - sp,
+                                     region.high - low_mark, resident, self._frames(frame)))
+        finally:
+            os.close(mem)
+            if pagemap is not None: os.close(pagemap)
+        # closest to overflow first
+        self.threads.sort(key = lambda t: t[3] - t[5])
+
+    def _frames(self, frame):
+        frames = [ ]
+        sp = int(frame.read_register('sp'))
+        level = 0
+        while frame and level < self.max_frames:
+            try:
+                older = frame.older()
+                older_sp = older and int(older.read_register('sp'))
+            except gdb.error:
+                older = None
+            if not older: break
+            if older_sp > sp: # inlined frames share sp
+                frames.append((level, older_sp - sp, frame.name() or '??'))
+            frame, sp = older, older_sp
+            level += 1
+        return frames
+
+    def _resident(self, pagemap, low, high):
+        """ bytes of pages present or swapped between low and high """
+        if pagemap is None: return high - low
+        pages = 0
+        for addr in range(low, high, self.block):
+            count = min(self.block, high - addr) // self.page
+            try:
+                data = os.pread(pagemap, 8 * count, addr // self.page * 8)
+            except OSError:
+                return high - low
+            if np is not None:
+                pages += int(np.count_nonzero(np.frombuffer(data, dtype = np.uint64) >> np.uint64(62)))
+            else:
+                pages += sum(1 for e in array.array('Q', data) if e >> 62)
+        return pages * self.page
+
+    def _first_resident(self, pagemap, low, high):
+        if pagemap is None: return low
+        for addr in range(low, high, self.block):
+            count = min(self.block, high - addr) // self.page
+            try:
+                data = os.pread(pagemap, 8 * count, addr // self.page * 8)
+            except OSError:
+                return low
+            for i, e in enumerate(array.array('Q', data)):
+                if e >> 62: return addr + i * self.page
+        return high
+
+    def _high_water(self, mem, pagemap, low, sp):
+        """ lowest address below sp with non-zero contents (sp if none) """
+        addr = self._first_resident(pagemap, low, sp)
+        while addr < sp:
+            size = min(self.block, sp - addr)
+            try:
+                data = os.pread(mem, size, addr)
+            except OSError:
+                data = b''
+            if not data: return sp
+            zeros = len(data) - len(data.lstrip(b'\0'))
+            if zeros < len(data): return addr + zeros // 8 * 8
+            addr += len(data)
+        return sp
+
+    def dump(self, max_frames = 20):
+        print(c.white + 'thread stacks (closest to overflow first)' + c.reset)
+        if not self.threads:
+            print(c.red + '<empty>' + c.reset)
+            return
+        print((c.cyan + '%6s %8s %12s %12s %12s %6s %12s %6s %s' + c.reset) %
+              ('Thread', 'LWP', 'Size', 'Depth', 'High water', 'Used', 'Resident', 'Frames', 'Largest frame'))
+        for num, lwp, region, size, depth, high, resident, frames in self.threads:
+            used = size and 100.0 * high / size or 0
+            largest = frames and max(frames, key = lambda f: f[1])
+            color = used >= 75 and c.red or c.yellow
+            print((c.green + '%6d ' + c.reset + '%8d ' + c.yellow + '%12d %12d %12d ' + color + '%5.1f%% ' +
+                   c.yellow + '%12d ' + c.reset + '%6d %s') %
+                  (num, lwp, size, depth, high, used, resident, len(frames),
+                   largest and '%s (%d bytes)' % (largest[2], largest[1]) or ''))
+        print(c.white + 'total: ' + c.reset + '%d threads, %d bytes resident, %d bytes high water' %
+              (len(self.threads), sum(t[6] for t in self.threads), sum(t[5] for t in self.threads)))
+
+        print(c.white + 'largest frames' + c.reset)
+        largest = sorted(((bytes, num, level, name) for num, lwp, region, size, depth, high, resident, frames in self.threads
+                          for level, bytes, name in frames), reverse = True)[:max_frames]
+        if not largest:
+            print(c.red + '<empty>' + c.reset)
+            return
+        print((c.cyan + '%6s %6s %12s %s' + c.reset) % ('Thread', 'Level', 'Bytes', 'Function'))
+        for bytes, num, level, name in largest:
+            print((c.green + '%6d ' + c.reset + '%6d ' + c.yellow + '%12d ' + c.reset + '%s') % (num, level, bytes, name))
@@ -0,0 +1,121 @@
+#   -*- mode: python; coding: utf-8; -*-
+#
+#   Copyright 2018 Asier Aguirre <asier.aguirre@gmail.com>
+#   This file is part of memory-tools.
+#
+#   memory-tools is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   memory-tools is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with memory-tools. If not, see <http://www.gnu.org/licenses/>.
+
+import gdb, mt_util, mt_visitor
+from mt_containers import MTstd_string
+from mt_colors import mt_colors as c
+
+class MTstrings(mt_visitor.MTwalker):
+    """ duplicated contents of std::string, char arrays and const char* strings
+        reachable from roots; contents are hashed while walking (no copies kept)
+        and the table of contents is pruned of single copies when it grows over
+        max_contents, so memory stays bounded (counts become lower bounds) """
+    max_sample = 40
+
+    def __init__(self, max_contents = 1 << 20):
+        super().__init__()
+        self.max_contents = max_contents
+        self.contents = { }   # { (length, hash): [copies, heap copies, heap bytes per copy, sample] }
+        self.kinds = { }      # { kind: [count, bytes] } kinds: sso, heap, array, pointer
+        self.pointed = set()  # { addr } const char* targets already counted
+        self.pruned = 0       # single copy contents dropped from table
+
+    def analysis(self, name_values):
+        """ name_values as returned by MTsymbols.get_values """
+        for name, value in name_values:
+            self.walk(value, name)
+
+    def add(self, data, kind, heap_bytes = 0):
+        stats = self.kinds.setdefault(kind, [0, 0])
+        stats[0] += 1
+        stats[1] += heap_bytes or len(data)
+        key = (len(data), hash(data))
+        entry = self.contents.get(key)
+        if entry is None:
+            if len(self.contents) >= self.max_contents: self._prune()
+            entry = self.contents[key] = [0, 0, heap_bytes, data[:self.max_sample]]
+        entry[0] += 1
+        if heap_bytes:
+            entry[1] += 1
+            entry[2] = heap_bytes
+
+    def _prune(self):
+        singles = [ key for key, entry in self.contents.items() if entry[0] == 1 ]
+        for key in singles: del self.contents[key]
+        self.pruned += len(singles)
+        if len(self.contents) >= self.max_contents // 2:
+            self.max_contents *= 2 # mostly duplicates: let the table grow
+
+    def on_wrap(self, wrap, value, name):
+        if not isinstance(wrap, MTstd_string): return True
+        try:
+            addr, length = wrap.get_data()
+            data = length and mt_util.read_memory(addr, length) or b''
+            if wrap.is_sso():
+                self.add(data, 'sso')
+            else:
+                heap_bytes = wrap.prop_heap_bytes
+                self.add(data, heap_bytes and 'heap' or 'sso', heap_bytes)
+        except gdb.MemoryError:
+            pass
+        return False # characters are not visited
+
+    def visit_string(self, value, name):
+        try:
+            if value.type.strip_typedefs().code == gdb.TYPE_CODE_ARRAY:
+                if value.address is None: return
+                data = mt_util.read_memory(int(value.address), value.type.sizeof)
+                self.add(data.split(b'\0', 1)[0], 'array')
+            else:
+                addr = int(value)
+                if not addr or addr in self.pointed: return
+                self.pointed.add(addr)
+                self.add(mt_util.read_string(addr), 'pointer')
+        except gdb.MemoryError:
+            pass
+
+    def get_duplicates(self):
+        """ [ (reclaimable bytes, copies, length, sample) ] of contents with copies """
+        duplicates = [ ]
+        for (length, hash), (copies, heap_copies, heap_bytes, sample) in self.contents.items():
+            if copies < 2: continue
+            duplicates.append((max(0, heap_copies - 1) * heap_bytes, copies, length, sample))
+        return sorted(duplicates, key = lambda x: (-x[0], -x[1]))
+
+    def dump(self, max_duplicates = 30):
+        print(c.white + 'strings by storage' + c.reset)
+        if not self.kinds:
+            print(c.red + '<empty>' + c.reset)
+            return
+        print((c.cyan + '%10s %10s %14s' + c.reset) % ('Kind', 'Count', 'Bytes'))
+        for kind in ('sso', 'heap', 'array', 'pointer'):
+            count, bytes = self.kinds.get(kind, (0, 0))
+            print((c.green + '%10s ' + c.yellow + '%10d %14d' + c.reset) % (kind, count, bytes))
+        duplicates = self.get_duplicates()
+        print(c.white + 'duplicated contents' + c.reset +
+              (self.pruned and ' (%d single copy contents pruned, counts are lower bounds)' % self.pruned or ''))
+        if not duplicates:
+            print(c.red + '<empty>' + c.reset)
+            return
+        print((c.cyan + '%12s %10s %10s %s' + c.reset) % ('Reclaimable', 'Copies', 'Length', 'Content'))
+        for reclaimable, copies, length, sample in duplicates[:max_duplicates]:
+            text = repr(sample.decode('utf-8', 'replace'))
+            print((c.yellow + '%12d %10d %10d ' + c.reset + '%s%s') %
+                  (reclaimable, copies, length, text, length > self.max_sample and '...' or ''))
+        print(c.white + 'total: ' + c.reset + str(sum(d[0] for d in duplicates)) + ' bytes reclaimable in ' +
+              str(len(duplicates)) + ' duplicated contents')
@@ -50,10 +50,12 @@ mt_frame_type_to_name = {
 class MTsymbols:
     'Find all symbols accessible from the blocks of all frames of all threads'
     @mt_util.maintain_thread_frame
-    def __init__(self, empty = False):
+    def __init__(self, empty = False, statics = None):
         self.symbols_by_name = { }        # { name: { address: (symbol, thread, frame, block) } }
         self.symbols_by_addr = { }        # { address: { name: (symbol, thread, frame, block) } }
         self.seen_global_blocks = set()   # { (start, end) }
+        self.statics = [ ]                # [ (address, (symbol, thread, frame, block)) ] in global / static blocks
+        if statics: self._reuse_statics(statics)
         if not empty: self._inferior()
 
     def filter_arguments_from_string(self, argument):
@@ -248,9 +250,21 @@ class MTsymbols:
         symb_val = []
         for v in self.find_symbol_by_name(name).values():
             v[1].switch() # thread switch
-            symb_val.append((v[0], v[0].value(v[2])))
+            symb_val.append((v[0], mt_util.get_value(v[0], v[2])))
         return symb_val
 
+    @mt_util.maintain_thread_frame
+    def get_values(self, tuple_syms):
+        """ return the list of [ (name, value) ] of filtered symbols with an address """
+        values = []
+        for address, name, (symbol, thread, frame, block) in tuple_syms:
+            if not address: continue
+            thread.switch()
+            value = mt_util.get_value(symbol, frame)
+            if value is not None and not value.is_optimized_out:
+                values.append((name, value))
+        return values
+
     def _inferior(self):
         # get inferior
         inferior = gdb.selected_inferior()
@@ -291,17 +305,28 @@ class MTsymbols:
             self._block(block, frame, thread)
             block = block.superblock
 
+    def _reuse_statics(self, statics):
+        """ take global and static block symbols from a previous MTsymbols (their
+            values do not depend on frames) so that only frames are parsed """
+        threads = set(sym_tuple[1] for addr, sym_tuple in statics.statics)
+        if not all(thread.is_valid() for thread in threads): return
+        self.seen_global_blocks = set(statics.seen_global_blocks)
+        self.statics = statics.statics
+        for addr, sym_tuple in self.statics:
+            self._add(addr, sym_tuple)
+
     def _block(self, block, frame, thread):
-        if block.is_global:
+        is_static = block.is_global or block.is_static
+        if is_static:
             # do not parse multiple times the same blocks
             block_key = (block.start, block.end)
             if block_key in self.seen_global_blocks: return
             self.seen_global_blocks.add(block_key)
 
         for symbol in block:
-            self._symbol(symbol, block, frame, thread)
+            self._symbol(symbol, block, frame, thread, is_static)
 
-    def _symbol(self, symbol, block, frame, thread):
+    def _symbol(self, symbol, block, frame, thread, is_static):
         # self.symbols = { name: { address: (symbol, thread, frame, block) } }
         addr = 0
         if symbol.addr_class not in { gdb.SYMBOL_LOC_TYPEDEF, gdb.SYMBOL_LOC_UNRESOLVED, gdb.SYMBOL_LOC_LABEL }:
@@ -309,7 +334,11 @@ class MTsymbols:
             if value.address != None and not value.is_optimized_out:
                 addr = int(value.address)
         sym_tuple = (symbol, thread, frame, block)
-        name = symbol.name
+        if is_static: self.statics.append((addr, sym_tuple))
+        self._add(addr, sym_tuple)
+
+    def _add(self, addr, sym_tuple):
+        name = sym_tuple[0].name
         self.symbols_by_name.setdefault(name, { }).setdefault(addr, sym_tuple)
         self.symbols_by_addr.setdefault(addr, { }).setdefault(name, sym_tuple)
         sq_br = name.find('[')
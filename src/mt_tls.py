@@ -0,0 +1,127 @@
+#   -*- mode: python; coding: utf-8; -*-
+#
+#   Copyright 2018 Asier Aguirre <asier.aguirre@gmail.com>
+#   This file is part of memory-tools.
+#
+#   memory-tools is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   memory-tools is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with memory-tools. If not, see <http://www.gnu.org/licenses/>.
+
+
+import gdb, mt_util, mt_visitor
+from mt_type_cleaning import clean_type
+from mt_colors import mt_colors as c
+
+class MTtls(mt_visitor.MTwalker):
+    """ thread local variables of every thread and heap bytes owned by std
+        containers reachable from them. Thread local symbols are the static
+        ones with computed location that gdb reports as thread-local.
+        Variables of a module are at fixed offsets of its TLS block in every
+        thread, so only one variable per module (anchor) is looked up by gdb in
+        each thread; the others are read at anchor address + offset """
+    def __init__(self):
+        super().__init__()
+        self.variables = [ ] # [ (thread num, name, addr, typename, bytes, heap bytes) ]
+        self.modules = { }   # { module: [ (symbol, offset from anchor) ] }
+        self.lookups = 0     # TLS addresses resolved by gdb
+        self.heap = 0        # heap bytes of current variable
+
+    def _address(self, symbol):
+        self.lookups += 1
+        try:
+            value = mt_util.get_value(symbol, None)
+        except gdb.error:
+            return 0 # TLS not allocated in this thread
+        return value is not None and value.address is not None and int(value.address) or 0
+
+    def is_thread_local(self, symbol):
+        """ gdb describes the location (no thread needed, works with one thread) """
+        try:
+            info = gdb.execute('info address ' + symbol.name, to_string = True)
+        except gdb.error:
+            return False
+        return 'thread-local' in info
+
+    def find_symbols(self, statics, threads):
+        """ group thread local symbols of statics (as MTsymbols.statics) by module """
+        candidates = { } # { (module, name): symbol }
+        for addr, (symbol, thread, frame, block) in statics:
+            if symbol.addr_class == gdb.SYMBOL_LOC_COMPUTED and symbol.is_variable and symbol.symtab:
+                key = (symbol.symtab.objfile.filename, symbol.name)
+                if key not in candidates and self.is_thread_local(symbol): candidates[key] = symbol
+        if not candidates or not threads: return
+        threads[0].switch()
+        addrs = dict((key, self._address(symbol)) for key, symbol in candidates.items())
+        for (module, name), addr in sorted(addrs.items(), key = lambda x: x[1]):
+            if not addr: continue
+            symbols = self.modules.setdefault(module, [ ])
+            anchor = symbols and addrs[(module, symbols[0][0].name)] or addr
+            symbols.append((candidates[(module, name)], addr - anchor))
+
+    @mt_util.maintain_thread_frame
+    def analysis(self, statics, threads):
+        threads = sorted(threads, key = lambda t: t.num)
+        self.find_symbols(statics, threads)
+        for thread in threads:
+            thread.switch()
+            for module, symbols in self.modules.items():
+                anchor = self._address(symbols[0][0])
+                if not anchor: continue
+                for symbol, offset in symbols:
+                    type = symbol.type
+                    value = gdb.Value(anchor + offset).cast(type.pointer()).dereference()
+                    self.heap = 0
+                    self.walk(value, symbol.name)
+                    self.variables.append((thread.num, symbol.name, anchor + offset, clean_type(type),
+                                           type.sizeof, self.heap))
+
+    def on_wrap(self, wrap, value, name):
+        if hasattr(wrap, 'prop_heap_bytes'): self.heap += wrap.prop_heap_bytes
+        return True
+
+    def get_threads(self):
+        """ { thread num: [variables, bytes, heap bytes] } """
+        threads = { }
+        for num, name, addr, typename, bytes, heap in self.variables:
+            stats = threads.setdefault(num, [0, 0, 0])
+            stats[0] += 1
+            stats[1] += bytes
+            stats[2] += heap
+        return threads
+
+    def get_variables(self):
+        """ { name: [typename, threads, heap bytes, max heap bytes in a thread] } """
+        variables = { }
+        for num, name, addr, typename, bytes, heap in self.variables:
+            stats = variables.setdefault(name, [typename, 0, 0, 0])
+            stats[1] += 1
+            stats[2] += heap
+            stats[3] = max(stats[3], heap)
+        return variables
+
+    def dump(self, max_variables = 20):
+        print(c.white + 'thread local storage by thread' + c.reset)
+        if not self.variables:
+            print(c.red + '<empty>' + c.reset)
+            return
+        print((c.cyan + '%6s %10s %14s %14s' + c.reset) % ('Thread', 'Variables', 'Bytes', 'Heap bytes'))
+        for num, (count, bytes, heap) in sorted(self.get_threads().items(), key = lambda x: (-x[1][2], x[0])):
+            print((c.green + '%6d ' + c.yellow + '%10d %14d %14d' + c.reset) % (num, count, bytes, heap))
+        print(c.white + 'thread local storage by variable' + c.reset)
+        print((c.cyan + '%8s %14s %14s %s' + c.reset) % ('Threads', 'Heap bytes', 'Max thread', 'Name'))
+        variables = sorted(self.get_variables().items(), key = lambda x: (-x[1][2], x[0]))
+        for name, (typename, threads, heap, max_heap) in variables[:max_variables]:
+            print((c.yellow + '%8d %14d %14d ' + c.reset + '%s ' + c.blue + '%s' + c.reset) %
+                  (threads, heap, max_heap, name, typename))
+        print(c.white + 'total: ' + c.reset + '%d variables in %d modules, %d bytes, %d heap bytes (%d TLS lookups)' %
+              (len(self.variables), len(self.modules), sum(v[4] for v in self.variables),
+               sum(v[5] for v in self.variables), self.lookups))
@@ -16,16 +16,21 @@
 #   You should have received a copy of the GNU General Public License
 #   along with memory-tools. If not, see <http://www.gnu.org/licenses/>.
 
-import mt_visitor
+import gdb, collections.abc, mt_visitor
+from mt_containers import MTarray, MTstd_vector
+from mt_type_cleaning import type_id
 
 class MTpython(mt_visitor.MTvisitor):
-    def __init__(self):
+    def __init__(self, lazy = False):
         super().__init__()
-        self.seen = { }  # { (addr, typename): python }
+        self.lazy = lazy
+        self.seen = { }  # { (addr, type id): python }
 
     def get(self, symbol_value):
-        """ return a python structure from symbol (symbol, value) """
+        """ return a python structure from symbol (symbol, value); in lazy mode
+            structs, arrays and containers are MTproxy objects """
         value = symbol_value[1]
+        if self.lazy: return self.get_lazy(value, symbol_value[0].name)
 
         # start recursion
         self.stack = [] # (name, python)
@@ -33,6 +38,30 @@ class MTpython(mt_visitor.MTvisitor):
         assert len(self.stack) == 1
         return self.stack[0][1]
 
+    def get_lazy(self, value, name):
+        """ python value for scalars, strings and null pointers, MTproxy otherwise """
+        code = value.type.code
+        if code == gdb.TYPE_CODE_TYPEDEF:
+            return self.get_lazy(value.cast(value.type.strip_typedefs()), name)
+        if code == gdb.TYPE_CODE_REF:
+            return self.get_lazy(value.referenced_value(), name)
+        if code == gdb.TYPE_CODE_PTR and not self.is_string_const_char(value):
+            target = self.dereference(value)
+            if target is None: return None
+            return self.get_lazy(target, '*' + name)
+        if code in { gdb.TYPE_CODE_STRUCT, gdb.TYPE_CODE_UNION } or (
+                code == gdb.TYPE_CODE_ARRAY and not self.is_string_char_array(value)):
+            key = value.address and int(value.address) and (int(value.address), type_id(value.type))
+            if key and key in self.seen: return self.seen[key]
+            proxy = MTproxy(self, value)
+            if key: self.seen[key] = proxy
+            return proxy
+        # scalars and strings
+        self.stack = []
+        self.visit(value, name)
+        if not self.stack: return None
+        return self.stack[0][1]
+
     def visit_struct(self, value, name):
         struct = { }
         if self._cached(value, name, struct): return
@@ -74,11 +103,7 @@ class MTpython(mt_visitor.MTvisitor):
         self.stack.append((name, str(value)))
 
     def visit_string(self, value, name):
-        try:
-            string = value.string()
-        except:
-            string = None
-        self.stack.append((name, string))
+        self.stack.append((name, self.get_string(value)))
 
     def visit_bool(self, value, name):
         self.stack.append((name, bool(value)))
@@ -93,11 +118,105 @@ class MTpython(mt_visitor.MTvisitor):
         if value.address:
             addr = int(value.address)
             if addr:
-                typename = str(value.type)
-                key = (addr, typename)
+                key = (addr, type_id(value.type))
                 if key in self.seen.keys():
                     self.stack.append((name, self.seen[key]))
                     return True
                 else:
                     self.seen[key] = python
         return False
+
+
+class MTproxy(collections.abc.Mapping):
+    """ lazy dict-like view of a struct, union, array or container, with the keys
+        of MTpython; fields, elements and pointer targets are converted and cached
+        only when accessed """
+    def __init__(self, python, value):
+        self._python = python
+        self._value = value
+        self._wrap = value.type.code != gdb.TYPE_CODE_UNION and python.get_struct_wrapper(value) or None
+        self._cache = { }     # { key: python }
+        self._fields = None   # { key: function returning field value }
+        self._elems = None    # [ gdb.Value ] container elements iterated so far
+        self._iter = None
+
+    def __repr__(self):
+        return '<MTproxy %s at %s>' % (self._value.type, self._value.address)
+
+    def __getitem__(self, key):
+        if key not in self._cache:
+            self._cache[key] = self._get(key)
+        return self._cache[key]
+
+    def __iter__(self):
+        return iter(self._keys())
+
+    def __len__(self):
+        return len(self._keys())
+
+    def _get(self, key):
+        if self._wrap:
+            if isinstance(key, int): return self._python.get_lazy(self._elem(key), '[%d]' % key)
+            if not isinstance(key, str) or not key.startswith('.') or not hasattr(self._wrap, 'prop_' + key[1:]):
+                raise KeyError(key)
+            prop = getattr(self._wrap, 'prop_' + key[1:])
+            return isinstance(prop, str) and prop or self._python.get_lazy(gdb.Value(prop), key)
+        field = self._get_fields().get(key)
+        if not field: raise KeyError(key)
+        return self._python.get_lazy(field(), key)
+
+    def _keys(self):
+        if not self._wrap: return list(self._get_fields().keys())
+        props = ['.' + prop[5:] for prop in dir(self._wrap) if prop.startswith('prop_')]
+        if self._indexable():
+            count = int(self._wrap.prop_size)
+        else:
+            count = 0
+            while self._elem(count, False) is not None: count += 1
+        return props + list(range(count))
+
+    def _indexable(self):
+        return isinstance(self._wrap, (MTarray, MTstd_vector))
+
+    def _elem(self, i, required = True):
+        """ i-th container element; O(1) for arrays and vectors, otherwise
+            elements are iterated once and kept """
+        if self._indexable():
+            if i >= 0 and i < int(self._wrap.prop_size): return self._wrap.get_item(i)
+        else:
+            if self._elems is None:
+                self._elems = []
+                self._iter = iter(self._wrap)
+            while i >= len(self._elems) and self._iter:
+                try:
+                    self._elems.append(next(self._iter))
+                except StopIteration:
+                    self._iter = None
+            if i >= 0 and i < len(self._elems): return self._elems[i]
+        if required: raise KeyError(i)
+        return None
+
+    def _get_fields(self):
+        """ same fields and names as MTvisitor._struct_visit and _union_visit """
+        if self._fields is not None: return self._fields
+        value = self._value
+        self._fields = { }
+        for field_name, field in value.type.items():
+            if value.type.code == gdb.TYPE_CODE_UNION:
+                self._fields['+' + (field_name or '<anonymous>')] = lambda n = field_name: value[n]
+            elif field.artificial:
+                continue
+            elif field.is_base_class:
+                if field.type.sizeof > 1: # only bases with data members
+                    self._fields['.base'] = lambda f = field: value.cast(f.type)
+            elif hasattr(field, 'bitpos'):
+                self._fields[field_name or '<anonymous>'] = lambda n = field_name, f = field: self._field(n, f)
+        return self._fields
+
+    def _field(self, field_name, field):
+        new_value = self._value[field_name]
+        if new_value.type.code == gdb.TYPE_CODE_REF:
+            # convert T& into *((T**)address) as MTvisitor does
+            address = int(self._value.address) + (field.bitpos >> 3)
+            new_value = gdb.Value(address).cast(new_value.type.target().pointer().pointer()).dereference()
+        return new_value
@@ -16,7 +16,7 @@
 #   You should have received a copy of the GNU General Public License
 #   along with memory-tools. If not, see <http://www.gnu.org/licenses/>.
 
-import gdb
+import gdb, re
 
 class_template_params = {
     'std::vector':         1,
@@ -31,53 +31,84 @@ class_template_params = {
     'frame::lf::Vector':   1,
 }
 
-def remove_template_params(string):
-    template = string.find('<')
-    if template < 0: return string # no templates
-    return string[:template] + string[string.rfind('>') + 1:]
-
-def clean_template_arguments(string, num):
-    level = 0
-    new = ''
-    last = 0
-    for i, c in enumerate(string):
-        if c == '<': level += 1
-        elif c == '>': level -= 1
-        elif c == ',' and not level:
-            # template argument
-            if not num: break
-            num -= 1
-            if last: new += ', '
-            new += remove_template_params(string[last:i])
-            last = i + 2
-    if num:
-        if last: new += ', '
-        new += remove_template_params(string[last:])
-    return new
+mt_type_tokens = re.compile(r'<|>|,\s*|[^<>,]+')
 
 def clean_type_name(typename):
+    """ single pass over tokens: templates not ending the name are removed,
+        trailing template keeps its first class_template_params arguments
+        (3 by default) with their own template parameters removed """
     if not typename: return ''
     level = 0
-    new = ''
-    last = 0
-    for i, c in enumerate(typename):
-        if c == '<':
+    new = [ ]
+    start = 0                    # position of top level '<'
+    args = [ ]                   # arguments of top level template
+    head = tail = ''             # argument text before its first template and after its last one
+    nested = False
+    for token in mt_type_tokens.finditer(typename):
+        text = token.group()
+        if text == '<':
             if not level:
-                new += typename[last:i]
-                last = i
+                start = token.start()
+                args, head, tail, nested = [ ], '', '', False
+            elif level == 1:
+                nested = True
             level += 1
-        elif c == '>':
+        elif text == '>' and level:
             level -= 1
-            if not level:
-                if i + 1 >= len(typename):
-                    num_args = class_template_params.get(typename[:last], 3)
-                    new += '<' + clean_template_arguments(typename[last + 1:i], num_args) + '>'
-                last = i + 1
-    new += typename[last:]
-    return new
+            if level == 1:
+                tail = ''
+            elif not level and token.end() == len(typename):
+                args.append(head + tail)
+                num_args = class_template_params.get(typename[:start], 3)
+                new.append('<' + ', '.join(args[:num_args]) + '>')
+        elif level == 1 and text[0] == ',':
+            args.append(head + tail)
+            head, tail, nested = '', '', False
+        elif level == 1:
+            if nested: tail += text
+            else: head += text
+        elif not level:
+            new.append(text)
+    return ''.join(new)
+
+
+class MTtype_names:
+    """ interned type names: each distinct type gets a small integer id with
+        its full and cleaned names computed once; has to be cleared when
+        objfiles change """
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.ids = { }           # { full name: id }
+        self.names = [ ]         # [ full name ] by id
+        self.clean_names = [ ]   # [ clean name or None when not computed yet ] by id
+
+    def get_id(self, type):
+        name = str(type)
+        id = self.ids.get(name)
+        if id is None:
+            id = self.ids[name] = len(self.names)
+            self.names.append(name)
+            self.clean_names.append(None)
+        return id
+
+    def get_name(self, id):
+        return self.names[id]
+
+    def get_clean_name(self, id):
+        clean = self.clean_names[id]
+        if clean is None:
+            clean = self.clean_names[id] = clean_type_name(self.names[id])
+        return clean
+
+mt_type_names = MTtype_names()
+
+def type_id(type):
+    return mt_type_names.get_id(type)
 
 def clean_type(type):
-    return clean_type_name(str(type))
+    return mt_type_names.get_clean_name(mt_type_names.get_id(type))
 
     """ this code does similar to str(type) """
     """
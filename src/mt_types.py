@@ -0,0 +1,72 @@
+#   -*- mode: python; coding: utf-8; -*-
+#
+#   Copyright 2018 Asier Aguirre <asier.aguirre@gmail.com>
+#   This file is part of memory-tools.
+#
+#   memory-tools is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   memory-tools is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with memory-tools. If not, see <http://www.gnu.org/licenses/>.
+
+import gdb
+
+class MTtype_registry:
+    """ memoized gdb type lookups (each gdb.lookup_type is a symbol table
+        search); it has to be cleared when objfiles change """
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.types = { }     # { name: gdb.Type }
+        self.members = { }   # { (container typename, member typedef): gdb.Type }
+        self.target = { }    # { property: value } pointer size, endianness...
+        self.hits = self.misses = 0
+
+    def lookup(self, name):
+        """ gdb.lookup_type(name) """
+        type = self.types.get(name)
+        if type is None:
+            self.misses += 1
+            type = self.types[name] = gdb.lookup_type(name)
+        else:
+            self.hits += 1
+        return type
+
+    def member(self, orig, name):
+        """ type orig::name (member typedef of a container type) """
+        key = (str(orig), name)
+        type = self.members.get(key)
+        if type is None:
+            self.misses += 1
+            search = '%s::%s' % (orig.strip_typedefs().unqualified(), name)
+            type = self.members[key] = gdb.lookup_type(search)
+        else:
+            self.hits += 1
+        return type
+
+    def pointer_size(self):
+        if 'pointer_size' not in self.target:
+            self.target['pointer_size'] = self.lookup('void').pointer().sizeof
+        return self.target['pointer_size']
+
+    def endian_prefix(self):
+        if 'endian' not in self.target:
+            self.target['endian'] = 'big' in gdb.execute('show endian', to_string = True) and '>' or '<'
+        return self.target['endian']
+
+    def stats(self):
+        requests = self.hits + self.misses
+        return [ ('types', len(self.types)),
+                 ('member types', len(self.members)),
+                 ('requests', requests),
+                 ('hit rate', '%.1f%%' % (requests and 100.0 * self.hits / requests)) ]
+
+mt_type_registry = MTtype_registry()
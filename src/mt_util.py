@@ -16,7 +16,7 @@
 #   You should have received a copy of the GNU General Public License
 #   along with memory-tools. If not, see <http://www.gnu.org/licenses/>.
 
-import gdb
+import gdb, struct, mt_cache, mt_types
 
 def save_thread_frame():
     return gdb.selected_thread(), gdb.selected_frame()
@@ -38,7 +38,8 @@ def get_frame_number(thread, frame): # thread has to be selected
 def get_value(symbol, frame): # thread has to be selected
     'Get value from symbol'
     if symbol.addr_class not in { gdb.SYMBOL_LOC_TYPEDEF, gdb.SYMBOL_LOC_UNRESOLVED, gdb.SYMBOL_LOC_LABEL }:
-        value = symbol.value(frame)
+        # frame of global / static symbols can be no longer valid (cached symbols)
+        value = symbol.value(frame) if symbol.needs_frame else symbol.value()
         return value
     return None
 
@@ -66,3 +67,29 @@ def find_frames_by_function_addr(addr):
                         thread_frames.append((thread, frame))
                 frame = frame.older()
     return thread_frames
+
+def pointer_size():
+    'Size in bytes of a pointer in the inferior'
+    return mt_types.mt_type_registry.pointer_size()
+
+def endian_prefix():
+    'struct module byte order prefix of the inferior'
+    return mt_types.mt_type_registry.endian_prefix()
+
+def read_memory(addr, size):
+    'Read size bytes of inferior memory at addr (through the page cache, bulk reads bypass it)'
+    return mt_cache.mt_page_cache.read(addr, size)
+
+def read_string(addr):
+    'Read the null terminated string at addr (through the page cache)'
+    return mt_cache.mt_page_cache.read_string(addr)
+
+def is_readable(addr):
+    'Check if inferior memory at addr is accessible'
+    return mt_cache.mt_page_cache.is_readable(addr)
+
+def read_pointers(addr, count):
+    'Read count consecutive pointer sized words at addr'
+    size = pointer_size()
+    fmt = endian_prefix() + str(count) + (size == 8 and 'Q' or 'I')
+    return struct.unpack(fmt, read_memory(addr, size * count))
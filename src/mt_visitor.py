@@ -16,9 +16,10 @@
 #   You should have received a copy of the GNU General Public License
 #   along with memory-tools. If not, see <http://www.gnu.org/licenses/>.
 
-import gdb
+import gdb, mt_heap, mt_types, mt_util
+from mt_type_cleaning import type_id
 from mt_containers import (MTarray, MTstd_vector, MTstd_unordered_map, MTstd_unordered_set,
-                           MTstd_unique_ptr, MTstd_shared_ptr, MTstd_string, MTstd_mutex,
+                           MTstd_unique_ptr, MTstd_shared_ptr, MTstd_weak_ptr, MTstd_string, MTstd_mutex,
                            MTstd_list, MTstd_function, MTstd_deque, MTstd_map, MTstd_set,
                            MTframe_lf_hashmap, MTframe_lf_vector, MTframe_lf_chunk,
                            MTframe_hashmap_close_addressing)
@@ -56,8 +57,8 @@ mt_type_code_to_name = {
 class MTvisitor:
     def __init__(self, n_elems_containters = 1 << 32):
         self.n_elems_containers = n_elems_containters
-        self.char_type = gdb.lookup_type('char')
-        self.long_type = gdb.lookup_type('long')
+        self.char_type = mt_types.mt_type_registry.lookup('char')
+        self.long_type = mt_types.mt_type_registry.lookup('long')
 
     def visit(self, value, name):
         code = value.type.code
@@ -98,6 +99,7 @@ class MTvisitor:
             elif typename.startswith('std::unordered_set<'): return MTstd_unordered_set(value)
             elif typename.startswith('std::unique_ptr<'): return MTstd_unique_ptr(value)
             elif typename.startswith('std::shared_ptr<'): return MTstd_shared_ptr(value)
+            elif typename.startswith('std::weak_ptr<'): return MTstd_weak_ptr(value)
             elif typename.startswith('std::__cxx11::basic_string<') or typename.startswith('std::basic_string<'):
                 return MTstd_string(value)
             elif typename == 'std::mutex' or typename == 'std::recursive_mutex': return MTstd_mutex(value)
@@ -121,6 +123,25 @@ class MTvisitor:
             elif typename.startswith('frame::lf::Vector<'): return MTframe_lf_vector(value)
             elif typename == 'frame::lf::Chunk': return MTframe_lf_chunk
 
+    def dereference(self, value):
+        """ pointed value or None if null, generic pointer or not in accessible memory """
+        if not int(value): return None
+        try:
+            target = value.dereference()
+        except gdb.error:
+            return None
+        if not mt_util.is_readable(int(value)): return None
+        return target
+
+    def get_string(self, value):
+        """ python string of a char array or char pointer (read through the page cache) """
+        try:
+            if value.type.code != gdb.TYPE_CODE_PTR: return value.string()
+            if not int(value): return None
+            return mt_util.read_string(int(value)).decode()
+        except:
+            return None
+
     def is_string_const_char(self, value):
         if value.type.code != gdb.TYPE_CODE_PTR: return False
         base_type = value.type.target()
@@ -182,10 +203,8 @@ class MTvisitor:
             self.visit_string(value, name)
             return
 
-        try:
-            value = value.dereference()     # could fail if generic pointer
-            str(value.cast(self.char_type)) # test that values is in accessible memory
-        except:
+        value = self.dereference(value)
+        if value is None:
             #self.visit(value.cast(self.long_type), name) # visit with the pointer value
             return
         self.visit(value, '*' + name)
@@ -217,3 +236,94 @@ class MTvisitor:
             self.visit(item, ('[%d]' + name) % count)
             count += 1
             if count == self.n_elems_containers: break
+
+
+class MTwalker(MTvisitor):
+    """ visit once every value reachable from roots; pointers are followed
+        breadth first through a work list to avoid deep recursion """
+    def __init__(self):
+        super().__init__()
+        self.seen = set()  # { (addr, type id) }
+        self.pending = []  # [ (value, name) ]
+
+    def walk(self, value, name):
+        self.on_top(value, name)
+        self.visit(value, name)
+        while self.pending:
+            value, name = self.pending.pop()
+            self.on_top(value, name)
+            self.visit(value, name)
+
+    def on_top(self, value, name):
+        """ called for each root and pointer target before visiting it """
+        pass
+
+    def on_wrap(self, wrap, value, name):
+        """ called for known containers; return if elements have to be visited """
+        return True
+
+    def on_struct(self, value, name):
+        """ called for other structs, classes and arrays """
+        pass
+
+    def on_typedef(self, value, name):
+        """ called for values of typedef types before they are visited with the
+            typedefs stripped (pthread_mutex_t is an anonymous union); return if
+            the stripped value has to be visited """
+        return True
+
+    def _first_time(self, value):
+        addr = int(value.address or 0)
+        if not addr: return True
+        key = (addr, type_id(value.type))
+        if key in self.seen: return False
+        self.seen.add(key)
+        return True
+
+    def _walk_wrap(self, wrap, value, name):
+        if getattr(wrap, 'error', False) or not self.on_wrap(wrap, value, name): return
+        type_elem = getattr(wrap, 'type_elem', None)
+        if type_elem is not None and not mt_heap.type_owns_heap(type_elem): return
+        count = 0
+        for item in wrap:
+            self.visit(item, ('[%d]' + name) % count)
+            count += 1
+            if count == self.n_elems_containers: break
+
+    def visit_struct(self, value, name):
+        if not self._first_time(value): return
+        try:
+            wrap = self.get_struct_wrapper(value)
+        except (gdb.error, RuntimeError):
+            wrap = None
+        if wrap: return self._walk_wrap(wrap, value, name)
+        self.on_struct(value, name)
+        self.generic_visit(value, name)
+
+    def visit_array(self, value, name):
+        if self.is_string_char_array(value): return self.visit_string(value, name)
+        if not self._first_time(value): return
+        self.on_struct(value, name)
+        self._walk_wrap(MTarray(value), value, name)
+
+    def visit_ptr(self, value, name):
+        base_type = value.type.target()
+        if base_type.name == 'char' and base_type == base_type.const():
+            return self.visit_string(value, name)
+        target = self.dereference(value)
+        if target is None: return
+        self.pending.append((target, '*' + name))
+
+    def visit_typedef(self, value, name):
+        if self.on_typedef(value, name):
+            self.visit(value.cast(value.type.strip_typedefs()), name)
+
+    def visit_string(self, value, name): pass
+    def visit_union(self, value, name): pass # too dangerous to recurse
+    def visit_int(self, value, name): pass
+    def visit_char(self, value, name): pass
+    def visit_bool(self, value, name): pass
+    def visit_flt(self, value, name): pass
+    def visit_enum(self, value, name): pass
+    def visit_void(self, value, name): pass
+    def visit_memerptr(self, value, name): pass
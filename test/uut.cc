@@ -36,9 +36,11 @@
 #include <memory>
 #include <thread>
 #include <chrono>
+#include <atomic>
 #include <functional>
 #include <unordered_map>
 #include <unordered_set>
+#include <pthread.h>
 #endif
 
 using namespace std;
@@ -109,6 +111,9 @@ vector<int> mt_gvi;
 // global vector of classes
 vector<MTclass> mt_gvc;
 
+// global vector of bools
+vector<bool> mt_gvb;
+
 // global list of ints
 list<int> mt_gli;
 
@@ -116,6 +121,9 @@ list<int> mt_gli;
 const string mt_gstr("bye");
 string mt_gstr_long("The quick brown fox jumps over the lazy dog multiple times to do this string longer...");
 string mt_gstr_empty;
+string mt_gstr_dups[3] = { "duplicated string, longer than the small buffer",
+                           "duplicated string, longer than the small buffer",
+                           "duplicated string, longer than the small buffer" };
 
 // array
 unsigned short mt_gaus[8] = { 4, 3, 2, 1, 8, 7, 6, 5 };
@@ -145,6 +153,13 @@ void*** mt_vppp(&mt_vpp);
 // deque
 deque<int> mt_gdequei;
 
+// padded struct
+struct MTpadded {
+    char c;
+    double d;
+    char e;
+} mt_gpadded[4];
+
 // map/set ints
 map<int, int> mt_gmii;
 set<int> mt_gsi;
@@ -166,14 +181,56 @@ shared_ptr<int> mt_gspi;
 shared_ptr<MTclass> mt_gspc;
 shared_ptr<MTclass> mt_gspc_null;
 
+// chain of shared ptrs
+struct MTnode {
+    int i;
+    shared_ptr<MTnode> next;
+};
+shared_ptr<MTnode> mt_gchain;
+
+// shared ownership cycle
+struct MTcycle {
+    shared_ptr<MTcycle> other;
+    weak_ptr<MTcycle> back;
+};
+shared_ptr<MTcycle> mt_gcycle;
+
+// locks and atomics sharing cache lines
+struct MTshared {
+    mutex lock1;
+    mutex lock2;
+} mt_gshared;
+atomic<long> mt_gcounters[4];
+
+// pthread synchronization types (typedefs of anonymous unions and ints)
+struct MTpthread_sync {
+    pthread_spinlock_t spin;
+    pthread_rwlock_t rwlock;
+    pthread_cond_t cond;
+} mt_gpsync;
+list<MTshared> mt_glocks(2); // mutexes in list nodes
+
+// pthread mutexes: global, struct member and vector elements
+pthread_mutex_t mt_gpmutex = PTHREAD_MUTEX_INITIALIZER;
+struct MTpthread_locked {
+    int count;
+    pthread_mutex_t lock;
+} mt_gplocked;
+vector<pthread_mutex_t> mt_gpmutexes(2);
+
+// thread local storage
+thread_local vector<int> mt_gtls;
+
 // thread
 volatile bool mt_thread_finish;
 volatile bool mt_thread_in;
+volatile bool mt_waiter_in;
 mutex mt_thread_mutex;
 void mt_thread_func() {
     // static
     int mt_stvi = 4500;
     noinline(mt_stvi);
+    mt_gtls.resize(1000);
 
     mt_thread_mutex.lock();
     MTclass mt_tc;
@@ -186,6 +243,13 @@ void mt_thread_func() {
     mt_thread_mutex.unlock();
 }
 
+// waits for the mutex held by mt_thread_func
+void mt_waiter_func() {
+    mt_waiter_in = true;
+    mt_thread_mutex.lock();
+    mt_thread_mutex.unlock();
+}
+
 // function
 function<void ()> mt_gfunc(mt_thread_func);
 
@@ -225,6 +289,9 @@ int main(int argc, char** argv) {
     mt_gvc[0].i = 999;
     mt_gvc[1].i = 1001;
 
+    // global vector of bools
+    for (int k = 0; k < 70; k++) mt_gvb.push_back(k % 3 == 0);
+
     // global list of ints
     mt_gli.push_back(7);
     mt_gli.push_front(49);
@@ -253,6 +320,8 @@ int main(int argc, char** argv) {
     // static
     int mt_slvi = 4499;
     noinline(mt_slvi);
+    int mt_lzero = 0; // falsy gdb.Value
+    noinline(mt_lzero);
 
 #ifdef CPP11
     have_cpp11 = true;
@@ -273,9 +342,27 @@ int main(int argc, char** argv) {
     mt_gspi.reset(new int(66));
     mt_gspc.reset(new MTclass);
 
+    // chain of shared ptrs
+    for (int k = 0; k < 3; k++) {
+        shared_ptr<MTnode> node(new MTnode);
+        node->i = k;
+        node->next = mt_gchain;
+        mt_gchain = node;
+    }
+
+    // shared ownership cycle
+    mt_gcycle = make_shared<MTcycle>();
+    mt_gcycle->other = make_shared<MTcycle>();
+    mt_gcycle->other->other = mt_gcycle;
+    mt_gcycle->other->back = mt_gcycle;
+
     // thread
+    mt_gtls.resize(10);
     thread mt_thread(mt_thread_func);
     while (!mt_thread_in) this_thread::sleep_for(chrono::milliseconds(1)); // wait for thread
+    thread mt_waiter(mt_waiter_func);
+    while (!mt_waiter_in) this_thread::sleep_for(chrono::milliseconds(1));
+    this_thread::sleep_for(chrono::milliseconds(50)); // waiter blocks in lock
 #endif
 
     // wait for gdb inspection and exit
@@ -284,6 +371,7 @@ int main(int argc, char** argv) {
 #ifdef CPP11
     mt_thread_finish = true;
     mt_thread.join();
+    mt_waiter.join();
 #endif
     return 0;
 }
@@ -16,7 +16,7 @@
 #   You should have received a copy of the GNU General Public License
 #   along with memory-tools. If not, see <http://www.gnu.org/licenses/>.
 
-import sys, mt_symbols, mt_to_python, mt_memory, mt_maps, mt_init
+import sys, mt_symbols, mt_to_python, mt_memory, mt_maps, mt_init, mt_health, mt_containers, mt_numpy, mt_export, mt_cache, mt_types, mt_type_cleaning, mt_layout, mt_sharing, mt_locality, mt_strings, mt_shared, mt_pages, mt_dirty, mt_cold, mt_numa, mt_stacks, mt_tls, mt_locks, mt_alloc_stats, mt_heap, os, gdb
 from mt_colors import mt_colors as c
 
 # passed by through gdb_commands
@@ -67,11 +67,11 @@ class Test:
             self._errors += 1
             self._failed.append(self._assertions)
 
-def test_get_python(t, symbols, var_name):
+def test_get_python(t, symbols, var_name, lazy = False):
     syms = symbols.find_symbol_value_by_name(var_name)
     t.check(len(syms) == 1)
     # convert to python
-    python = mt_to_python.MTpython().get(syms[0])
+    python = mt_to_python.MTpython(lazy).get(syms[0])
     if debug_uut: print(str(python))
     return python
 
@@ -117,6 +117,16 @@ def test_global_vector(t, symbols):
     t.check(python[0]['i'] == 999)
     t.check(python[1]['i'] == 1001)
 
+def test_global_vector_bool(t, symbols):
+    python = test_get_python(t, symbols, 'mt_gvb')
+    t.check(python['.type'] == 'std::vector')
+    t.check(python['.size'] == 70)
+    t.check(python[0] == True)
+    t.check(python[1] == False)
+    t.check(python[66] == True)
+    t.check(python[69] == True)
+    t.check(len([k for k in python.keys() if isinstance(k, int)]) == 70)
+
 def test_global_unordered_map(t, symbols):
     python = test_get_python(t, symbols, 'mt_gumii')
     t.check(python['.type'] == 'std::unordered_map')
@@ -125,6 +135,7 @@ def test_global_unordered_map(t, symbols):
     t.check(d[99] == -99)
     t.check(d[999] == -999)
     t.check(d[9999] == -9999)
+    t.check(python['.heap_bytes'] >= 3 * 8)
     python = test_get_python(t, symbols, 'mt_gusi')
     t.check(python['.type'] == 'std::unordered_set')
     d = { v for k, v in python.items() if isinstance(k, int) }
@@ -174,6 +185,67 @@ def test_global_string(t, symbols):
     t.check(python['.type'] == 'std::string')
     t.check(python[0] == '')
 
+def test_locality(t, symbols):
+    stats = mt_locality.MTlocality_stats([0, 8, 16, 3 * 4096])
+    t.check(stats.nodes == 4 and stats.pages == 2 and stats.mean == 4096)
+    t.check(abs(stats.same_page - 2 / 3) < 1e-9 and stats.percentiles == [8, 8, 8])
+    t.check(stats.pages_per_1000 == 500)
+    scattered = mt_locality.MTlocality_stats([0, 4096, 3 * 4096, 2 * 4096]) # no successor on the same page
+    t.check(scattered.same_page == 0.0 and scattered.pages == 4)
+    t.check(mt_locality.MTlocality_stats([64]).same_page == 1.0)
+    locality = mt_locality.MTlocality()
+    locality.analysis([ (name, symbols.find_symbol_value_by_name(name)[0][1]) for name in ('mt_gmii', 'mt_gchain') ])
+    nodes = sorted(stats.nodes for stats, addr, name, typename in locality.report)
+    t.check(nodes == [3, 6])
+
+def test_shared(t, symbols):
+    shared = mt_shared.MTshared()
+    shared.analysis([ (name, symbols.find_symbol_value_by_name(name)[0][1]) for name in ('mt_gcycle', 'mt_gchain') ])
+    t.check(shared.n_shared == 3 + 3 and shared.n_weak == 1 and len(shared.info) == 5)
+    cycles = shared.get_cycles()
+    t.check(len(cycles) == 1)
+    component, internal = cycles[0]
+    t.check(len(component) == 2 and internal == 2)
+    t.check(sum(shared.info[i][1] for i in component) == 3) # one external reference: mt_gcycle
+    t.check(all(info[3] > 0 for info in shared.info))
+    t.check(mt_shared.strongly_connected(3, [(0, 1), (1, 0), (2, 2)]) in ([[1, 0], [2]], [[2], [1, 0]]))
+
+def test_sharing(t, symbols):
+    shared = symbols.find_symbol_value_by_name('mt_gshared')[0][1]
+    counters = symbols.find_symbol_value_by_name('mt_gcounters')[0][1]
+    t.check(mt_sharing.sync_kind(shared['lock1'].type) == 'lock')
+    t.check(mt_sharing.sync_kind(counters[0].type) == 'atomic')
+    t.check([ f[0] for f in mt_sharing.sync_fields(shared.type) ] == [0, int(shared['lock2'].address) - int(shared.address)])
+    sharing = mt_sharing.MTsharing()
+    sharing.analysis([('mt_gshared', shared), ('mt_gcounters', counters)])
+    lines = sharing.get_lines()
+    t.check(any(len([ o for o in objects if o[3] == 'lock' ]) == 2 for low, objects in lines))
+    t.check(len([ a for a in sharing.items.values() if a[2] == 'atomic' ]) == 4)
+    t.check([ p[1:3] for p in sharing.packed ] == [(4, counters[0].type.sizeof)])
+    psync = symbols.find_symbol_value_by_name('mt_gpsync')[0][1]
+    sharing = mt_sharing.MTsharing()
+    sharing.analysis([('mt_gpsync', psync)])
+    t.check(sorted((addr, item[0]) for addr, item in sharing.items.items() if item[2] == 'lock') ==
+            sorted((int(psync[f].address), psync[f].type.sizeof) for f in ('spin', 'rwlock', 'cond')))
+
+def test_node_walkers(t, symbols):
+    syms = symbols.find_symbol_value_by_name('mt_gmii')
+    t.check(len(syms) == 1)
+    tree = mt_containers.MTstd_map(syms[0][1])
+    t.check([int(tree.get_payload(node)['first']) for node in tree.get_node_addresses()] == list(range(7, 13)))
+    t.check(max(tree.get_depths()) <= 4)
+    tree.size = 3 # walks stop at the node count (corrupt or changing trees)
+    t.check(len(list(tree.get_node_addresses())) == len(tree.get_depths()) == 3)
+    syms = symbols.find_symbol_value_by_name('mt_gli')
+    lst = mt_containers.MTstd_list(syms[0][1])
+    t.check([int(lst.get_payload(node)) for node in lst.get_node_addresses()] == [49, 7])
+    syms = symbols.find_symbol_value_by_name('mt_gchain')
+    t.check(len(syms) == 1)
+    head = mt_containers.MTstd_shared_ptr(syms[0][1]).get_item()
+    nodes = list(mt_containers.MTnodes().pointer_chain(head, 'next'))
+    t.check(len(nodes) == 3)
+    t.check(nodes[0] == int(head.address))
+
 def test_mutex(t, symbols):
     python = test_get_python(t, symbols, 'mt_thread_mutex')
     t.check(python['.type'] == 'std::mutex')
@@ -247,6 +319,10 @@ def test_global_deque(t, symbols):
     t.check(python[1] == 32)
     t.check(python[2] == 33)
     t.check(python[3] == 44)
+    # moved from deque: no map
+    deque = symbols.find_symbol_value_by_name('mt_gdequei')[0][1]
+    moved = mt_containers.MTstd_deque(gdb.Value(bytes(deque.type.sizeof), deque.type))
+    t.check(moved.get_buffers() == [] and moved.prop_heap_bytes == 0)
 
 def test_global_map(t, symbols):
     python = test_get_python(t, symbols, 'mt_gmii')
@@ -268,14 +344,418 @@ def test_global_map(t, symbols):
     t.check(python[4] == 11)
     t.check(python[5] == 12)
 
+def test_heap_bytes(t, symbols):
+    python = test_get_python(t, symbols, 'mt_gvi')
+    t.check(python['.heap_bytes'] >= 3 * 4)
+    t.check(python['.slack_bytes'] == (python['.capacity'] - 3) * 4)
+    python = test_get_python(t, symbols, 'mt_gli')
+    t.check(python['.size'] == 2)
+    t.check(python['.heap_bytes'] >= 2 * 4)
+    python = test_get_python(t, symbols, 'mt_gmii')
+    t.check(python['.heap_bytes'] >= 6 * 8)
+    python = test_get_python(t, symbols, 'mt_gdequei')
+    t.check(python['.heap_bytes'] >= 512)
+    python = test_get_python(t, symbols, 'mt_gstr_long')
+    t.check(python['.heap_bytes'] > len(python[0]))
+    python = test_get_python(t, symbols, 'mt_gstr_empty')
+    t.check(python['.heap_bytes'] == 0)
+
+def test_container_health(t, symbols):
+    health = mt_health.MThealth()
+    health.analysis(symbols.get_values(symbols.filter(names = ['^mt_gmii$', '^mt_gli$', '^mt_gumii$'])))
+    issues = { name: (wasted, cost) for wasted, cost, addr, name, typename, details in health.issues }
+    t.check(issues['mt_gmii'][1] >= 1 and issues['mt_gmii'][1] <= 3)
+    t.check(issues['mt_gli'][0] > 0)
+    if 'mt_gumii' in issues: # c++11
+        t.check(sum(health.chains[1:]) >= 1)
+
+def test_numpy(t, symbols):
+    if mt_numpy.np is None: return
+    array = mt_numpy.to_numpy(symbols.find_symbol_value_by_name('mt_gvi')[0][1])
+    t.check(list(array) == [1, 7, -100])
+    array = mt_numpy.to_numpy(symbols.find_symbol_value_by_name('mt_gaaul')[0][1])
+    t.check(array.shape == (2, 3))
+    t.check(int(array[1][2]) == 777777777777)
+    array = mt_numpy.to_numpy(symbols.find_symbol_value_by_name('mt_gvc')[0][1])
+    t.check(list(array['i']) == [999, 1001])
+    t.check(abs(array['d'][0] + 42.42) < 1e-14)
+    array = mt_numpy.to_numpy(symbols.find_symbol_value_by_name('mt_gdequei')[0][1])
+    t.check(list(array) == [-44, 32, 33, 44])
+    array = mt_numpy.to_numpy(symbols.find_symbol_value_by_name('mt_gvb')[0][1])
+    t.check(len(array) == 70 and array[3] and not array[4])
+
+def test_export(t, symbols):
+    import io, json
+    for ndjson in (False, True):
+        out = io.StringIO()
+        export = mt_export.MTexport(out, ndjson)
+        export.begin()
+        for var_name in ('mt_gcpl', 'mt_gvi'):
+            export.export(var_name, symbols.find_symbol_value_by_name(var_name)[0][1])
+        export.end()
+        if ndjson:
+            lines = [json.loads(line) for line in out.getvalue().split('\n') if line]
+            t.check(lines[0]['root'] == 'mt_gcpl')
+            t.check(lines[0]['value']['charp'] == 'class A')
+            t.check(lines[1]['value']['charp'] == 'class B')
+            t.check(lines[1]['value']['cp']['$ref'] == lines[0]['value']['$id'])
+            t.check(lines[-1]['value']['2'] == -100)
+        else:
+            roots = json.loads(out.getvalue())
+            gcpl = roots[0]['value']
+            t.check(gcpl['cp']['charp'] == 'class B')
+            t.check(gcpl['cp']['cp']['$ref'] == gcpl['$id'])
+            t.check(roots[1]['value']['.size'] == 3)
+            t.check(roots[1]['value']['1'] == 7)
+            t.check(len(export.ids) == 3) # roots and pointed class B only
+    for number, text in ((float('nan'), '"nan"'), (float('-inf'), '"-inf"'), (0.0, '0.0')):
+        out = io.StringIO()
+        mt_export.MTexport(out).visit_flt(gdb.Value(number), 'f')
+        t.check(out.getvalue() == text)
+    # a smart pointer cycle back to the top of a line (pointed target) is a reference
+    def ids(item):
+        if isinstance(item, dict):
+            return [ item[k] for k in item if k == '$id' ] + [ i for v in item.values() for i in ids(v) ]
+        return isinstance(item, list) and [ i for v in item for i in ids(v) ] or [ ]
+    for var_name, value in symbols.find_symbol_value_by_name('mt_gcycle'):
+        out = io.StringIO()
+        export = mt_export.MTexport(out, True)
+        node = mt_containers.MTstd_shared_ptr(value).get_item()
+        export.ids[export._key(node)] = 0
+        export._line(0, node, '*' + var_name)
+        line = json.loads(out.getvalue())
+        t.check(line['value']['$id'] == 0)
+        t.check(sorted(ids(line['value'])) == [0, 1])
+
+def test_lazy_python(t, symbols):
+    test_class(t, test_get_python(t, symbols, 'mt_lc', True))
+    python = test_get_python(t, symbols, 'mt_gcpl', True)
+    t.check(python['cp']['cp']['charp'] == 'class A')
+    t.check(python['cp']['cp'] is python)
+    python = test_get_python(t, symbols, 'mt_gvi', True)
+    t.check(python['.size'] == 3)
+    t.check(python[2] == -100)
+    t.check(len([k for k in python.keys() if isinstance(k, int)]) == 3)
+    python = test_get_python(t, symbols, 'mt_gmii', True)
+    t.check(python[5] == {'first': 12, 'second': 24 })
+    t.check(not 6 in python.keys())
+    python = test_get_python(t, symbols, 'mt_gaaul', True)
+    t.check(python[1][2] == 777777777777)
+    python = test_get_python(t, symbols, 'mt_gcr', True)
+    test_class(t, python['ref'])
+    python = test_get_python(t, symbols, 'mt_gcd', True)
+    test_class(t, python['.base']['.base'])
+    t.check(test_get_python(t, symbols, 'mt_vpp', True) == None)
+    t.check(test_get_python(t, symbols, 'mt_genum', True) == 100)
+
+def test_page_cache(t, symbols):
+    value = symbols.find_symbol_value_by_name('mt_gaaul')[0][1]
+    addr, size = int(value.address), value.type.sizeof
+    cache = mt_cache.MTpage_cache(4096, 2)
+    t.check(cache.read(addr, size) == bytes(gdb.selected_inferior().read_memory(addr, size)))
+    t.check(cache.misses >= 1)
+    cache.read(addr + 8, 8)
+    t.check(cache.hits >= 1)
+    t.check(cache.read_string(int(symbols.find_symbol_value_by_name('mt_gc')[0][1]['charp'])) == b'hello world')
+    t.check(not cache.is_readable(0))
+    misses, uncached = cache.misses, cache.uncached
+    t.check(not cache.is_readable(0) and 0 in cache.unreadable and 0 in cache.bad_pages)
+    t.check(cache.misses == misses and cache.uncached == uncached) # no read repeated
+    cache.read(int(gdb.selected_frame().read_register('sp')), 1)
+    t.check(cache.evictions >= 1)
+    lines = list(cache.lines)
+    heap = mt_maps.MTmaps().get_regions(['[heap]'])[0].low
+    t.check(len(cache.read(heap, 5 * 4096)) == 5 * 4096) # bulk read bypasses lines
+    t.check(list(cache.lines) == lines and cache.uncached == uncached + 1)
+    # string in the last page of a mapping ending within a line
+    high = mt_maps.MTmaps().get_regions(['[heap]'])[0].high
+    if high & 0xffff:
+        gdb.selected_inferior().write_memory(high - 4, b'end\0') # unused top chunk bytes
+        t.check(mt_cache.MTpage_cache(1 << 16).read_string(high - 4) == b'end')
+    cache.clear()
+    t.check(not cache.unreadable and not cache.bad_pages)
+
+def test_context_cache(t, symbols):
+    context = mt_init.MTcontext()
+    maps, syms = context.get_maps(), context.get_symbols()
+    t.check(context.get_maps() is maps and context.get_symbols() is syms)
+    t.check(context.maps.hits == 1 and context.symbols.hits == 1)
+    # inferior did not change: maps are kept, frames are parsed again reusing statics
+    context.on_resume()
+    t.check(context.get_maps() is maps)
+    resumed = context.get_symbols()
+    t.check(resumed is not syms and resumed.statics is syms.statics)
+    t.check(resumed.find_symbol_value_by_name('mt_gaaul')[0][1].address ==
+            syms.find_symbol_value_by_name('mt_gaaul')[0][1].address)
+    context.invalidate_symbols()
+    t.check(context.get_symbols() is not resumed and context.symbols.builds == 3)
+
+def test_type_registry(t, symbols):
+    registry = mt_types.MTtype_registry()
+    t.check(registry.lookup('long') is registry.lookup('long'))
+    t.check(registry.hits == 1 and registry.misses == 1)
+    vector = symbols.find_symbol_value_by_name('mt_gvi')[0][1].type
+    t.check(registry.member(vector, 'value_type').strip_typedefs().code == gdb.TYPE_CODE_INT)
+    t.check(registry.member(vector, 'value_type') is registry.member(vector, 'value_type'))
+    t.check(registry.pointer_size() == gdb.lookup_type('void').pointer().sizeof)
+    registry.clear()
+    t.check(not registry.types and not registry.members)
+
+def test_type_names(t, symbols):
+    names = mt_type_cleaning.MTtype_names()
+    vector = symbols.find_symbol_value_by_name('mt_gvi')[0][1].type
+    id = names.get_id(vector)
+    t.check(names.get_id(vector) == id and names.get_id(gdb.lookup_type('int')) != id)
+    t.check(names.get_name(id) == str(vector))
+    t.check(names.get_clean_name(id) == 'std::vector<int>')
+    t.check(mt_type_cleaning.clean_type_name(
+        'std::map<int, std::vector<int, std::allocator<int> >, std::less<int> >') == 'std::map<int, std::vector>')
+    t.check(mt_type_cleaning.clean_type_name('std::vector<int, std::allocator<int> >::iterator') == 'std::vector::iterator')
+
+def test_layout(t, symbols):
+    padded = symbols.find_symbol_value_by_name('mt_gpadded')[0][1]
+    padded_type = padded.type.target()
+    layout = mt_layout.get_layout(padded_type)
+    t.check(layout is mt_layout.get_layout(padded_type))
+    # double alignment depends on the ABI (8 on x86-64, 4 with -m32)
+    c, d, e = padded_type.fields()
+    align = d.bitpos // 8
+    hole, tail = align - 1, padded_type.sizeof - e.bitpos // 8 - 1
+    packed = (d.type.sizeof + 2 + align - 1) // align * align
+    t.check(layout.size == padded_type.sizeof and layout.tail == tail and layout.packed == packed)
+    t.check(layout.holes == [(1, hole, 'c')])
+    padding = mt_layout.MTpadding()
+    padding.analysis([('mt_gpadded', padded)])
+    report = padding.get_report()
+    t.check(report[0][:3] == (4 * (hole + tail), 4 * (padded_type.sizeof - packed), 4))
+
+def test_strings(t, symbols):
+    strings = mt_strings.MTstrings()
+    strings.analysis([ (name, symbols.find_symbol_value_by_name(name)[0][1]) for name in ('mt_gstr_dups', 'mt_gstr') ])
+    t.check(strings.kinds['heap'][0] == 3 and strings.kinds['sso'] == [1, 3])
+    duplicates = strings.get_duplicates()
+    t.check(len(duplicates) == 1)
+    reclaimable, copies, length, sample = duplicates[0]
+    t.check(copies == 3 and length == 47 and sample.startswith(b'duplicated string'))
+    t.check(reclaimable >= 2 * 48)
+
+def test_pages(t, symbols):
+    maps = mt_maps.MTmaps()
+    regions = maps.get_anonymous_writable()
+    t.check(regions and all(not region.file_mmap or region.map_type for region in regions))
+    pages = mt_pages.MTpages(gdb.selected_inferior().pid)
+    pages.scan(regions)
+    t.check(sum(r[1] for r in pages.regions) > 0)
+    t.check(all(r[2] + r[3] <= r[1] for r in pages.regions))
+    objects = mt_pages.MTpage_objects()
+    objects.ranges = [(0x1000, 0x1800, 'a'), (0x1800, 0x3000, 'b')]
+    t.check(objects.get_objects([0x1000, 0x2000]) == { 'a': [0x1000, 0x800], 'b': [0x1800, 0x1800] })
+    # several nodes on one page, a large buffer starting before them
+    objects.ranges = [(0x0, 0x1100, 'v[]', 'v', 'vector'), (0x1200, 0x1300, 'l[]', 'l', 'list'),
+                      (0x1400, 0x1500, 'l[]', 'l', 'list'), (0x1f00, 0x2100, 'l[]', 'l', 'list')]
+    t.check(objects.get_objects([0x1000]) == { 'v[]': [0x0, 0x100], 'l[]': [0x1200, 0x300] })
+    t.check(objects.get_objects([0x2000, 0x1000], by = 'type') == { 'vector': [0x0, 0x100], 'list': [0x1200, 0x400] })
+    # a large range covering the pages of many nodes
+    objects.ranges = [(0x0, 0x10000, 'big')] + [ (p + 0x10, p + 0x20, 'n') for p in range(0, 0x10000, 0x1000) ]
+    t.check(objects.get_objects(range(0, 0x10000, 0x1000)) == { 'big': [0x0, 0x10000], 'n': [0x10, 0x100] })
+
+def test_dirty(t, symbols):
+    dirty = mt_dirty.MTdirty()
+    pid = gdb.selected_inferior().pid
+    t.check(not dirty.is_tracking(pid))
+    regions = mt_maps.MTmaps().get_writable()
+    dirty.start(pid, regions)
+    t.check(dirty.is_tracking(pid))
+    pages = dirty.get_dirty_pages()
+    t.check([ region for region, region_pages in pages ] == regions)
+    t.check(all(region.low <= addr < region.high for region, region_pages in pages for addr in region_pages))
+    t.check(dirty.is_dirty({ 2 }, 2 * 4096 - 1, 2) and not dirty.is_dirty({ 2 }, 0, 4096))
+    # another window does not reset this one
+    before = dirty.get_dirty_set()
+    other = mt_dirty.MTdirty()
+    other.start(pid, regions)
+    t.check(dirty.is_tracking(pid) and other.is_tracking(pid))
+    t.check(before <= dirty.get_dirty_set() and dirty.saved == before)
+    t.check(dirty.get_ranges() == sorted((region.low, region.high) for region in regions))
+
+def test_cold(t, symbols):
+    cold = mt_cold.MTcold(gap = 2)
+    t.check(cold._runs([1, 2, 3, 6, 7, 20]) == [[1, 3], [6, 7], [20, 20]])
+    regions = mt_maps.MTmaps().get_anonymous_writable()
+    try:
+        cold.start(gdb.selected_inferior().pid, regions)
+    except OSError:
+        return # no idle page tracking (or privileges)
+    pages = cold.get_cold_pages()
+    t.check([ region for region, resident, region_pages in pages ] == regions)
+    t.check(all(len(region_pages) <= resident for region, resident, region_pages in pages))
+    objects = mt_pages.MTpage_objects()
+    objects.analysis([ ('mt_gvi', symbols.find_symbol_value_by_name('mt_gvi')[0][1]) ])
+    t.check(set(objects.get_objects([ r[0] // 4096 * 4096 for r in objects.ranges ], by = 'root')) == { 'mt_gvi' })
+
+def test_numa(t, symbols):
+    t.check(mt_numa.parse_cpu_list('0-2,5,7-8\n') == [0, 1, 2, 5, 7, 8])
+    maps = mt_maps.MTmaps()
+    pid = gdb.selected_inferior().pid
+    numa = mt_numa.MTnuma(maps, pid)
+    if not numa.available: return # kernel without NUMA
+    t.check(any(region.numa_nodes for region in maps.regions))
+    numa.load_threads(gdb.selected_inferior().threads())
+    t.check(len(numa.threads) == len(gdb.selected_inferior().threads()))
+    objects = mt_pages.MTpage_objects()
+    objects.analysis([ ('mt_gvi', symbols.find_symbol_value_by_name('mt_gvi')[0][1]) ])
+    report = numa.get_objects(objects, 0, { 'mt_gvi': None })
+    t.check(report and all(threads is None for name, start, bytes, counts, threads in report))
+    t.check(all(sum(counts.values()) >= 1 for name, start, bytes, counts, threads in report))
+
+def test_stacks(t, symbols):
+    inferior = gdb.selected_inferior()
+    stacks = mt_stacks.MTstacks(inferior.pid)
+    stacks.analysis(mt_maps.MTmaps(), inferior.threads())
+    t.check(len(stacks.threads) == len(inferior.threads()))
+    for num, lwp, region, size, depth, high, resident, frames in stacks.threads:
+        t.check(0 < depth <= high <= size)
+        t.check(frames and all(bytes > 0 for level, bytes, name in frames))
+    t.check([ s[3] - s[5] for s in stacks.threads ] == sorted(s[3] - s[5] for s in stacks.threads))
+
+def test_memory_incremental(t, symbols):
+    memory = mt_memory.MTmemory()
+    tuples = symbols.filter(*symbols.filter_arguments_from_string('^mt_g'))
+    memory.analysis(symbols, tuples)
+    values, links = len(memory.seen), len(memory.graph)
+    t.check(memory.decoded == values and values > 0 and not memory.reused)
+    memory.analysis(symbols, tuples, set()) # no dirty pages
+    t.check(memory.decoded == 0 and memory.reused == values and len(memory.seen) == values)
+    memory.analysis(symbols, tuples) # same page contents
+    t.check(memory.decoded == 0 and len(memory.seen) == values and len(memory.graph) == links)
+    memory.analysis(symbols, tuples, set(memory.page_hashes.keys()))
+    t.check(memory.decoded == values and len(memory.seen) == values and len(memory.graph) == links)
+    # no dirty pages in tracked ranges: pages out of them are compared by hashes
+    pages = sorted(memory.pages)
+    tracked = [ (pages[0] * 4096, (pages[0] + 1) * 4096) ]
+    memory.analysis(symbols, tuples, set(), tracked)
+    t.check(memory.decoded == 0 and len(memory.seen) == values)
+    hashes = memory.page_hashes
+    memory.page_hashes = dict((page, 0) for page in hashes) # untracked pages look modified
+    memory.analysis(symbols, tuples, set(), tracked)
+    t.check(memory.decoded > 0 and len(memory.seen) == values)
+    hashes[pages[0]] = 0 # tracked and not dirty: not hashed again
+    t.check(memory.page_hashes == hashes)
+    # modified values no longer linked are not visited again (unreadable here)
+    gcpl = symbols.find_symbol_value_by_name('mt_gcpl')[0][1]
+    stale = (64, mt_type_cleaning.type_id(gcpl.type))
+    memory.types[stale[1]] = gcpl.type
+    memory.seen[stale] = ('*stale', gcpl.type.sizeof)
+    memory.analysis(symbols, tuples, { 0 })
+    t.check(stale not in memory.seen and len(memory.seen) == values)
+    # a failed analysis drops the kept graph
+    memory.seen[stale] = ('*stale', gcpl.type.sizeof)
+    memory.graph[(int(gcpl.address), 64)] = '*stale'
+    failed = False
+    try:
+        memory.analysis(symbols, tuples, { 0 })
+    except gdb.error:
+        failed = True
+    t.check(failed and not memory.seen and not memory.graph and not memory.page_hashes)
+    memory.analysis(symbols, tuples)
+    t.check(memory.decoded == values and len(memory.seen) == values)
+
 def test_static_local(t, symbols):
     python = test_get_python(t, symbols, 'mt_slvi')
     t.check(python == 4499)
 
+def test_zero_local(t, symbols):
+    values = symbols.find_symbol_value_by_name('mt_lzero')
+    t.check(len(values) == 1 and int(values[0][1]) == 0)
+    locs, addrs, names, ranges = symbols.filter_arguments_from_string('^mt_lzero$')
+    t.check([ (name, int(value)) for name, value in symbols.get_values(symbols.filter(locs, addrs, names, ranges)) ] ==
+            [ ('mt_lzero', 0) ])
+
 def test_static_thread(t, symbols):
     python = test_get_python(t, symbols, 'mt_stvi')
     t.check(python == 4500)
 
+def test_tls(t, symbols):
+    tls = mt_tls.MTtls()
+    threads = gdb.selected_inferior().threads()
+    tls.analysis(symbols.statics, threads)
+    gtls = sorted((num, heap) for num, name, addr, typename, bytes, heap in tls.variables if name == 'mt_gtls')
+    t.check(len(gtls) == len(threads) == 3)
+    malloc = mt_heap.MTmalloc()
+    small, large = malloc.request_to_chunk(10 * 4), malloc.request_to_chunk(1000 * 4)
+    t.check(sorted(heap for num, heap in gtls) == [0, small, large])
+    t.check(tls.lookups <= 2 * len(tls.modules) + 2 * sum(len(s) for s in tls.modules.values()))
+    t.check(tls.get_variables()['mt_gtls'][1:] == [3, small + large, large])
+    t.check(all(tls.is_thread_local(list(symbols.find_symbol_by_name(name).values())[0][0]) == local
+                for name, local in (('mt_gtls', True), ('mt_gvi', False))))
+
+def test_locks(t, symbols):
+    threads = gdb.selected_inferior().threads()
+    mutex = symbols.find_symbol_value_by_name('mt_thread_mutex')[0][1]
+    addr = int(mutex.address)
+    t.check(mt_locks.mutex_kind(mutex.type) == 'mutex')
+    locks = mt_locks.MTlocks()
+    locks.analysis([('mt_thread_mutex', mutex)], threads)
+    t.check(locks.locks == { addr: ('mt_thread_mutex', 'mutex') })
+    t.check(locks.owners.get(addr) in [ thread.num for thread in threads ])
+    t.check([ w[0] for w in locks.waiters.values() ] == [ addr ])
+    t.check([ (c[0], len(c[2])) for c in locks.get_contention() ] == [(addr, 1)])
+    t.check(locks.get_cycles() == [ ])
+    # thread 2 waits lock 0x20 owned by thread 3, which waits lock 0x10 owned by thread 2
+    locks.threads = { 100: 1, 101: 2, 102: 3 }
+    locks.owners = { 0x10: 2, 0x20: 3 }
+    locks.waiters = { 2: (0x20, 'f'), 3: (0x10, 'f') }
+    t.check(locks.get_cycles() == [[(2, 0x20), (3, 0x10)]])
+    # mutexes inside list nodes, from the node payloads: elements are not walked
+    value = symbols.find_symbol_value_by_name('mt_glocks')[0][1]
+    wrap = mt_containers.MTstd_list(value)
+    locks = mt_locks.MTlocks()
+    key = mt_type_cleaning.type_id(wrap.type_elem.strip_typedefs())
+    t.check(mt_heap.type_owns_heap(wrap.type_elem)) # std::mutex members
+    mt_heap.mt_owns_heap[key] = False
+    try:
+        locks.analysis([('mt_glocks', value)], threads)
+    finally:
+        mt_heap.mt_owns_heap[key] = True
+    fields = mt_locks.mutex_fields(wrap.type_elem)
+    t.check(len(fields) == 2)
+    t.check(sorted(locks.locks) == sorted(node + wrap.payload + f[0] for node in wrap.get_node_addresses() for f in fields))
+    # pthread mutexes (typedefs of unions): global, struct member and vector elements
+    names = ('mt_gpmutex', 'mt_gplocked', 'mt_gpmutexes')
+    values = [ (name, symbols.find_symbol_value_by_name(name)[0][1]) for name in names ]
+    gpmutex, gplocked, gpmutexes = [ value for name, value in values ]
+    t.check(mt_locks.mutex_kind(gpmutex.type) == 'pthread')
+    locks = mt_locks.MTlocks()
+    locks.analysis(values, threads)
+    vector = mt_containers.MTstd_vector(gpmutexes)
+    expected = [ int(gpmutex.address), int(gplocked['lock'].address) ] + \
+               [ addr + i * vector.type_elem.sizeof for addr, count in vector.get_buffers() for i in range(count) ]
+    t.check(len(expected) == 4 and sorted(locks.locks) == sorted(expected))
+    t.check(set(kind for name, kind in locks.locks.values()) == { 'pthread' })
+    t.check(not locks.owners)
+
+def test_alloc_stats(t, symbols):
+    path = '/tmp/mt-alloc-stats.test'
+    if os.path.exists(path): os.unlink(path)
+    ring = mt_alloc_stats.MTring(path, mt_alloc_stats.mt_alloc_format, 3)
+    for i in range(5): ring.append((float(i), 1000, 0, 100 * i, 10, 1, 0.0))
+    t.check([ r[0] for r in ring.records() ] == [2.0, 3.0, 4.0])
+    ring.close()
+    ring = mt_alloc_stats.MTring(path, mt_alloc_stats.mt_alloc_format)
+    t.check(ring.capacity == 3 and ring.count == 5)
+    t.check(mt_alloc_stats.get_trends(ring.records())['in use'] == (100.0, 100.0))
+    ring.close()
+    os.unlink(path)
+    xml = '<malloc version="1"><heap nr="0"/><total type="fast" count="1" size="32"/>' \
+          '<total type="rest" count="2" size="968"/><total type="mmap" count="1" size="4096"/>' \
+          '<system type="current" size="10000"/></malloc>'
+    t.check(mt_alloc_stats.parse_malloc_info(xml) == (10000, 4096, 9000, 1000, 1))
+    sampler = mt_alloc_stats.MTalloc_sampler()
+    sample = sampler.sample()
+    t.check(sampler.allocator in ('mallinfo2', 'malloc_info'))
+    t.check(len(sample) == 7 and sample[1] > 0 and 0 < sample[3] <= sample[1])
+    t.check(sampler.sample()[3] == sample[3]) # no leaks in inferior
+
 def test(debug, tests):
     global debug_uut
     global tests_uut
@@ -288,6 +768,7 @@ def test(debug, tests):
     with Test(symbols, test_local_class) as t: t.test()
     with Test(symbols, test_global_class) as t: t.test()
     with Test(symbols, test_global_vector) as t: t.test()
+    with Test(symbols, test_global_vector_bool) as t: t.test()
     with Test(symbols, test_global_list) as t: t.test()
     with Test(symbols, test_global_string) as t: t.test()
     with Test(symbols, test_global_array) as t: t.test()
@@ -299,6 +780,25 @@ def test(debug, tests):
     with Test(symbols, test_global_deque) as t: t.test()
     with Test(symbols, test_global_map) as t: t.test()
     with Test(symbols, test_static_local) as t: t.test()
+    with Test(symbols, test_zero_local) as t: t.test()
+    with Test(symbols, test_heap_bytes) as t: t.test()
+    with Test(symbols, test_container_health) as t: t.test()
+    with Test(symbols, test_numpy) as t: t.test()
+    with Test(symbols, test_export) as t: t.test()
+    with Test(symbols, test_lazy_python) as t: t.test()
+    with Test(symbols, test_page_cache) as t: t.test()
+    with Test(symbols, test_context_cache) as t: t.test()
+    with Test(symbols, test_type_registry) as t: t.test()
+    with Test(symbols, test_type_names) as t: t.test()
+    with Test(symbols, test_layout) as t: t.test()
+    with Test(symbols, test_strings) as t: t.test()
+    with Test(symbols, test_pages) as t: t.test()
+    with Test(symbols, test_dirty) as t: t.test()
+    with Test(symbols, test_cold) as t: t.test()
+    with Test(symbols, test_numa) as t: t.test()
+    with Test(symbols, test_stacks) as t: t.test()
+    with Test(symbols, test_memory_incremental) as t: t.test()
+    with Test(symbols, test_alloc_stats) as t: t.test()
 
     # c++11 compatible tests
     have_cpp11 = False
@@ -310,9 +810,15 @@ def test(debug, tests):
         with Test(symbols, test_global_unordered_map) as t: t.test()
         with Test(symbols, test_global_unique_ptr) as t: t.test()
         with Test(symbols, test_global_shared_ptr) as t: t.test()
+        with Test(symbols, test_node_walkers) as t: t.test()
+        with Test(symbols, test_sharing) as t: t.test()
+        with Test(symbols, test_shared) as t: t.test()
+        with Test(symbols, test_locality) as t: t.test()
         with Test(symbols, test_mutex) as t: t.test()
         with Test(symbols, test_function) as t: t.test()
         with Test(symbols, test_static_thread) as t: t.test()
+        with Test(symbols, test_tls) as t: t.test()
+        with Test(symbols, test_locks) as t: t.test()
 
     # execute commands w/o checking output
     commands = [
@@ -330,6 +836,35 @@ def test(debug, tests):
         ('mt switch', 'mt_slvi'),
         ('mt switch', 'mt_lstr'),
         ('mt objects', ''),
+        ('mt footprint', ''),
+        ('mt footprint', '^mt_g'),
+        ('mt layout', ''),
+        ('mt layout', '^mt_gpadded$'),
+        ('mt sharing', ''),
+        ('mt locality', ''),
+        ('mt strings', ''),
+        ('mt shared', ''),
+        ('mt pages', ''),
+        ('mt pages', '--objects ^mt_g'),
+        ('mt dirty', 'start'),
+        ('mt dirty', 'report --objects ^mt_g'),
+        ('mt cold', 'report'),
+        ('mt numa', ''),
+        ('mt numa', '--objects --min 0 ^mt_g'),
+        ('mt stacks', ''),
+        ('mt tls', ''),
+        ('mt locks', ''),
+        ('mt alloc-stats', '--file /tmp/mt-alloc-stats.commands report'),
+        ('mt memory', '^mt_g'),
+        ('mt memory', '^mt_g'),
+        ('mt memory', '--reset ^mt_gvi$'),
+        ('mt containers', ''),
+        ('mt containers', '--cost ^mt_g'),
+        ('mt export', '/dev/null ^mt_g'),
+        ('mt export', '--ndjson /dev/null ^mt_g'),
+        ('mt cache', ''),
+        ('mt cache', 'clear'),
+        ('mt cache', 'all'),
         ('mt debug', 'on'),
         ('mt debug', ''),
         ('mt colors', 'off'),